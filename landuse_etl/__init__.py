@@ -0,0 +1,64 @@
+"""
+Land-use ETL for the Quartierfarben map: loads the Basel-Stadt WFS layers,
+classifies every Bodenbedeckung feature and writes landuse.geojson.
+
+`Pipeline` / `run_pipeline` run it from Python, `python -m landuse_etl` (or
+`uv run pipeline.py`) from the command line; etl.py is the marimo notebook view.
+"""
+from .checkpoint import StageCache
+from .composition import CompositionEngine, district_composition
+from .dataset import Dataset
+from .districts import DISTRICT_MODES, load_districts
+from .export import export_frame, write_features
+from .incremental import IncrementalPlan, merge_incremental, plan_incremental, save_incremental_state
+from .joins import area_weighted_majority_join
+from .normalize import normalize_geometries
+from .partition import map_partitions
+from .pmtiles import PMTilesReader, write_pmtiles
+from .poi import BuildingIndex
+from .profiling import Profiler
+from .rules import NutzungRules
+from .raster import CategoryRaster, load_category_raster, write_category_raster
+from .pipeline import STAGES, Pipeline, PipelineConfig, resolve_stages, run_pipeline
+from .svg import export_district_svgs, export_to_svg
+from .tilediff import plan_tile_changes
+from .wfs import DEFAULT_WFS_URL, HttpCache, RateLimiter, load_data_from_wfs, retry_session
+
+__all__ = [
+    "BuildingIndex",
+    "CategoryRaster",
+    "CompositionEngine",
+    "DEFAULT_WFS_URL",
+    "DISTRICT_MODES",
+    "Dataset",
+    "HttpCache",
+    "IncrementalPlan",
+    "NutzungRules",
+    "PMTilesReader",
+    "Pipeline",
+    "PipelineConfig",
+    "Profiler",
+    "RateLimiter",
+    "STAGES",
+    "StageCache",
+    "district_composition",
+    "area_weighted_majority_join",
+    "export_district_svgs",
+    "export_frame",
+    "export_to_svg",
+    "load_data_from_wfs",
+    "load_category_raster",
+    "load_districts",
+    "map_partitions",
+    "normalize_geometries",
+    "merge_incremental",
+    "plan_incremental",
+    "plan_tile_changes",
+    "resolve_stages",
+    "retry_session",
+    "run_pipeline",
+    "save_incremental_state",
+    "write_category_raster",
+    "write_features",
+    "write_pmtiles",
+]
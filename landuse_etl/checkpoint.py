@@ -0,0 +1,94 @@
+"""Stage-level checkpoints as (Geo)Parquet, keyed by code, inputs and parameters."""
+import hashlib
+import json
+import logging
+import os
+
+import geopandas as gpd
+import pandas as pd
+import shapely
+
+
+class StageCache:
+    """
+    Checkpoints stage outputs as (Geo)Parquet in `directory`.
+    The key hashes the stage's code, the content of its input frames, the code
+    of helper functions passed as inputs and its parameters, so a rerun with the same inputs loads the stage instead of
+    recomputing it, and a crashed run resumes after the last stage it finished.
+    `code_token` (e.g. pipeline.code_fingerprint) goes into every key, so a
+    change to code a stage reaches without taking it as an input, such as a
+    helper it calls, invalidates the checkpoints too.
+    Only the newest `keep` checkpoints per stage are kept.
+    """
+    def __init__(self, directory=os.path.join(".cache", "stages"), enabled=True, keep=3, code_token=""):
+        self.directory = directory
+        self.enabled = enabled
+        self.keep = keep
+        self.code_token = code_token
+        if enabled:
+            os.makedirs(directory, exist_ok=True)
+
+    @staticmethod
+    def _code_fingerprint(code):
+        # bytecode, names and constants only: moving a cell does not invalidate it
+        h = hashlib.sha256(code.co_code)
+        h.update(repr(code.co_names).encode())
+        for const in code.co_consts:
+            h.update(StageCache._code_fingerprint(const).encode() if hasattr(const, "co_code") else repr(const).encode())
+        return h.hexdigest()
+
+    @staticmethod
+    def fingerprint(obj):
+        h = hashlib.sha256()
+        if callable(obj) and hasattr(obj, "__code__"):
+            # helper functions a stage calls: their code is part of the key too
+            h.update(StageCache._code_fingerprint(obj.__code__).encode())
+        elif isinstance(obj, pd.DataFrame):
+            frame = pd.DataFrame({
+                i: (shapely.to_wkb(obj.iloc[:, i].values, hex=True) if isinstance(obj.iloc[:, i].dtype, gpd.array.GeometryDtype)
+                    else obj.iloc[:, i].to_numpy())
+                for i in range(obj.shape[1])
+            }, index=obj.index)
+            h.update(repr([(str(c), str(t)) for c, t in obj.dtypes.items()]).encode())
+            h.update(pd.util.hash_pandas_object(frame, index=True).to_numpy().tobytes())
+            if isinstance(obj, gpd.GeoDataFrame) and obj.crs is not None:
+                h.update(obj.crs.to_string().encode())
+        else:
+            h.update(json.dumps(obj, sort_keys=True, default=str).encode())
+        return h.hexdigest()
+
+    def key(self, name, fn, inputs=(), params=None):
+        h = hashlib.sha256(name.encode())
+        h.update(self.code_token.encode())
+        h.update(self._code_fingerprint(fn.__code__).encode())
+        for obj in inputs:
+            h.update(self.fingerprint(obj).encode())
+        h.update(self.fingerprint(params or {}).encode())
+        return h.hexdigest()[:20]
+
+    def run(self, name, fn, *, inputs=(), params=None):
+        """Return `fn()`, or its checkpoint if one exists for these inputs and params."""
+        if not self.enabled:
+            return fn()
+        path = os.path.join(self.directory, f"{name}-{self.key(name, fn, inputs, params)}.parquet")
+        if os.path.exists(path):
+            logging.info(f"Stage {name}: loaded checkpoint {path}")
+            try:
+                return gpd.read_parquet(path)
+            except ValueError:  # no geo metadata: plain DataFrame
+                return pd.read_parquet(path)
+
+        result = fn()
+        tmp = f"{path}.{os.getpid()}.tmp"
+        result.to_parquet(tmp)
+        os.replace(tmp, path)
+        logging.info(f"Stage {name}: wrote checkpoint {path}")
+
+        older = sorted(
+            (os.path.join(self.directory, f) for f in os.listdir(self.directory)
+             if f.startswith(f"{name}-") and f.endswith(".parquet")),
+            key=os.path.getmtime, reverse=True,
+        )
+        for stale in older[self.keep:]:
+            os.remove(stale)
+        return result
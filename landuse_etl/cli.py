@@ -0,0 +1,177 @@
+"""
+Command line for the pipeline:
+
+    uv run pipeline.py [--incremental] [--offline] [--stages geojson] [--output landuse.geojson] ...
+    python -m landuse_etl ...
+
+The notebook (etl.py) accepts the same flags.
+"""
+import argparse
+import logging
+import os
+
+from .districts import DISTRICT_MODES
+from .export import COORD_PRECISION, EXPORT_PROFILES, export_driver
+from .normalize import GRID_SIZE_M
+from .partition import PART_ROWS
+from .pipeline import DEFAULT_STAGES, OPTIONAL_STAGES, PipelineConfig, resolve_stages, run_pipeline
+from .wfs import DEFAULT_WFS_URL
+
+
+def _stage_list(value):
+    return [s.strip() for s in value.split(",") if s.strip()]
+
+
+def _bbox(value):
+    bbox = [float(v) for v in value.split(",")]
+    if len(bbox) != 4:
+        raise argparse.ArgumentTypeError("expected minx,miny,maxx,maxy")
+    return bbox
+
+
+def build_parser():
+    parser = argparse.ArgumentParser(
+        prog="landuse-etl",
+        description="Build landuse.geojson (and landuse.svg) from the Basel-Stadt WFS.",
+    )
+    parser.add_argument("--url", default=DEFAULT_WFS_URL, help="WFS endpoint (default: %(default)s)")
+    parser.add_argument(
+        "--output", default="landuse.geojson",
+        help="land-use output; .geojson, .geojsonl/.ndjson (one feature per line) or .fgb (FlatGeobuf) (default: %(default)s)",
+    )
+    parser.add_argument("--svg-output", default="landuse.svg", help="SVG output path (default: %(default)s)")
+    parser.add_argument(
+        "--export-profile", default="full", choices=EXPORT_PROFILES,
+        help="GeoJSON columns: all of them, or only a nutzung code for the tiles (default: %(default)s)",
+    )
+    parser.add_argument(
+        "--coord-precision", type=int, default=COORD_PRECISION,
+        help="decimal places of the exported WGS84 coordinates (default: %(default)s, about 1 cm)",
+    )
+    parser.add_argument("--full-precision", action="store_true", help="export coordinates unrounded")
+    parser.add_argument("--codes", default=None, help="nutzung code lookup of the tiles profile (default: src/lib/landuseCodes.json)")
+    parser.add_argument(
+        "--composition-output", default="composition.json",
+        help="per-district landuse composition JSON (default: %(default)s)",
+    )
+    parser.add_argument("--raster-output", default="landuse.raster", help="raster stage output (default: %(default)s)")
+    parser.add_argument("--raster-cell-size", type=float, default=2.0, help="raster cell size in metres (default: %(default)s)")
+    parser.add_argument("--tiles-dir", default="tiles", help="tippecanoe tile directory read by the pmtiles stage (default: %(default)s)")
+    parser.add_argument("--pmtiles-output", default="landuse.pmtiles", help="pmtiles stage output (default: %(default)s)")
+    parser.add_argument(
+        "--tile-changes-dir", default="tile_changes", help="tile_changes stage output: changes.json and z<zoom>.geojsonl (default: %(default)s)",
+    )
+    parser.add_argument("--dirty-tiles", default=None, help="changes.json of the tile_changes stage: update only its dirty tiles in --pmtiles-output")
+    parser.add_argument("--district-svg-dir", default="districts", help="district_svg stage output (default: %(default)s)")
+    parser.add_argument(
+        "--district-modes", type=_stage_list, default=list(DISTRICT_MODES),
+        help=f"area modes for the composition and district_svg stages (default: {','.join(DISTRICT_MODES)})",
+    )
+    parser.add_argument(
+        "--profile-output", default="",
+        help="per-stage profiling report (default: <output>.profile.json, next to the GeoJSON)",
+    )
+    parser.add_argument("--no-profile", action="store_true", help="do not write the profiling report")
+    parser.add_argument("--colors", default=None, help="colour configuration (default: src/lib/colors.json)")
+    parser.add_argument("--rules", default=None, help="nutzung rules (default: src/lib/nutzungRules.json)")
+    parser.add_argument(
+        "--stages", type=_stage_list, default=None,
+        help=(f"comma-separated stages to run, dependencies included (default: {','.join(DEFAULT_STAGES)}; "
+              f"on request: {','.join(OPTIONAL_STAGES)})"),
+    )
+    parser.add_argument("--skip", type=_stage_list, default=[], help="comma-separated stages to leave out, e.g. svg")
+    parser.add_argument(
+        "--grid-size", type=float, default=GRID_SIZE_M, help="snapping grid for the loaded geometries, in metres (default: %(default)s)",
+    )
+    parser.add_argument("--workers", type=int, default=1, help="processes for the parallel stages (default: %(default)s)")
+    parser.add_argument(
+        "--part-rows", type=int, default=PART_ROWS, help="features per spatial part of the parallel stages (default: %(default)s)",
+    )
+    parser.add_argument(
+        "--bbox", type=_bbox, default=None, metavar="MINX,MINY,MAXX,MAXY",
+        help="load only the features intersecting this EPSG:2056 box (default: the whole canton)",
+    )
+    parser.add_argument("--offline", action="store_true", help="replay WFS responses from the HTTP cache only")
+    parser.add_argument("--cache-dir", default=os.path.join(".cache", "http"), help="HTTP cache (default: %(default)s)")
+    parser.add_argument("--incremental", action="store_true", help="recompute only features touched by changed inputs")
+    parser.add_argument("--state-dir", default=os.path.join(".cache", "incremental"), help="incremental state (default: %(default)s)")
+    parser.add_argument(
+        "--low-memory", action="store_true",
+        help="keep only the columns the stages read, as compact dtypes, and release intermediates early",
+    )
+    parser.add_argument(
+        "--memory-budget", type=float, default=None, metavar="MB",
+        help="peak RSS budget in MiB, checked per stage in the profiling report",
+    )
+    parser.add_argument("--no-checkpoints", action="store_true", help="do not read or write stage checkpoints")
+    parser.add_argument("--stage-dir", default=os.path.join(".cache", "stages"), help="stage checkpoints (default: %(default)s)")
+    parser.add_argument("--source-token", default=None, help="checkpoint the Bodenbedeckung load under this key (default: no load checkpoint)")
+    parser.add_argument("--log-level", default="INFO", choices=["DEBUG", "INFO", "WARNING", "ERROR"])
+    return parser
+
+
+def config_from_args(args):
+    """PipelineConfig from parsed command-line arguments."""
+    kwargs = {}
+    if args.colors:
+        kwargs["colors_path"] = args.colors
+    if args.rules:
+        kwargs["rules_path"] = args.rules
+    if args.codes:
+        kwargs["codes_path"] = args.codes
+    return PipelineConfig(
+        args.url,
+        output=args.output,
+        svg_output=args.svg_output,
+        export_profile=args.export_profile,
+        coord_precision=None if args.full_precision else args.coord_precision,
+        profile_output=None if args.no_profile else args.profile_output,
+        composition_output=args.composition_output,
+        raster_output=args.raster_output,
+        raster_cell_size=args.raster_cell_size,
+        tiles_dir=args.tiles_dir,
+        pmtiles_output=args.pmtiles_output,
+        tile_changes_dir=args.tile_changes_dir,
+        dirty_tiles=args.dirty_tiles,
+        district_svg_dir=args.district_svg_dir,
+        district_modes=args.district_modes,
+        grid_size=args.grid_size,
+        workers=args.workers,
+        part_rows=args.part_rows,
+        bbox=args.bbox,
+        offline=args.offline,
+        cache_dir=args.cache_dir,
+        incremental=args.incremental,
+        state_dir=args.state_dir,
+        low_memory=args.low_memory,
+        memory_budget_mb=args.memory_budget,
+        checkpoints=not args.no_checkpoints,
+        stage_dir=args.stage_dir,
+        source_token=args.source_token,
+        **kwargs,
+    )
+
+
+def main(argv=None):
+    parser = build_parser()
+    args = parser.parse_args(argv)
+    logging.basicConfig(level=getattr(logging, args.log_level), format="%(asctime)s %(levelname)s %(message)s")
+    # bad flags are usage errors; anything the run itself raises keeps its traceback
+    try:
+        config = config_from_args(args)
+        stages = resolve_stages(args.stages, args.skip)
+        if "geojson" in stages:
+            export_driver(config.output)
+    except ValueError as e:
+        parser.error(str(e))
+    pipeline = run_pipeline(config, stages)
+    total = sum(pipeline.timings.values())
+    logging.info(f"Pipeline finished in {total:.2f}s: " + ", ".join(f"{k}={v:.2f}s" for k, v in pipeline.timings.items()))
+    if args.memory_budget is not None:
+        children, peak = pipeline.profiler.peak_rss_total()
+        if peak is not None:
+            logging.info(
+                f"Peak RSS {peak / 2**20:.0f} MiB of a {args.memory_budget:.0f} MiB budget "
+                f"(largest of {args.workers} worker(s): {children / 2**20:.0f} MiB)"
+            )
+    return 0
@@ -0,0 +1,341 @@
+"""
+Land-use composition per district, precomputed for the frontend, and
+CompositionEngine for arbitrary circles (schools, Kultur POIs, addresses).
+
+For every district of an area mode the area of each landuse category is
+summed exactly in EPSG:2056, so selecting a Wohnviertel or Wahlkreis in the
+app is a lookup instead of a turf intersect/area pass over the rendered tiles.
+The numbers have the shape getLanduseSizes returns:
+
+    {mode: {district_id: {"name": ..., "sumSizes": m2, "sizes": {category: {"m": m2, "p": percent}}}}}
+"""
+import json
+import os
+from collections import OrderedDict
+from concurrent.futures import ProcessPoolExecutor
+
+import numpy as np
+import pandas as pd
+import shapely
+
+from .stages import CRS_CH
+
+# settings.js analysisRadiusInMeters and the steps of the circle Map.svelte draws
+ANALYSIS_RADIUS_M = 250
+CIRCLE_STEPS = 16
+
+
+def nutzung_categories(nutzung, color_config, default="other"):
+    """Frontend category (colors.json landuseMapping) of each `nutzung` value."""
+    mapping = color_config.get("landuseMapping", {})
+    # as objects: a categorical `nutzung` would map to categories `default` is not one of
+    return pd.Series(nutzung, copy=False).astype(object).map(mapping).fillna(default)
+
+
+def district_composition(gdf_nutzung, districts, categories, *, area_decimals=1, percent_decimals=2):
+    """
+    Category areas (m²) and shares (%) for each row of `districts`, keyed by its `id`.
+    `gdf_nutzung` and `districts` must share a metric CRS; `categories` is aligned
+    with `gdf_nutzung` (see nutzung_categories).
+    """
+    geoms = gdf_nutzung.geometry.values
+    district_geoms = districts.geometry.values
+    categories = np.asarray(categories, dtype=object)
+
+    # one bulk query for all districts; features lying fully inside a district
+    # keep their own area, only the ones on a border are intersected
+    d_idx, f_idx = gdf_nutzung.sindex.query(district_geoms, predicate="intersects")
+    shapely.prepare(district_geoms)
+    inside = shapely.contains_properly(district_geoms[d_idx], geoms[f_idx])
+    areas = shapely.area(geoms[f_idx])
+    border = ~inside
+    areas[border] = shapely.area(shapely.intersection(geoms[f_idx[border]], district_geoms[d_idx[border]]))
+
+    sums = (
+        pd.DataFrame({"district": d_idx, "category": categories[f_idx], "m": areas})
+        .groupby(["district", "category"], sort=True)["m"].sum()
+    )
+    result = {}
+    for i, (district_id, name) in enumerate(zip(districts["id"], districts["name"])):
+        sizes = sums.loc[i] if i in sums.index.get_level_values(0) else pd.Series(dtype=float)
+        sizes = sizes[sizes > 0]
+        total = float(sizes.sum())
+        result[str(district_id)] = {
+            "name": name,
+            "sumSizes": round(total, area_decimals),
+            "sizes": {
+                category: {
+                    "m": round(float(m), area_decimals),
+                    "p": round(float(m) / total * 100, percent_decimals),
+                }
+                for category, m in sizes.items()
+            },
+        }
+    return result
+
+
+def write_composition(composition, path):
+    """Write the composition JSON compactly (atomically, like the profiling report)."""
+    directory = os.path.dirname(path)
+    if directory:
+        os.makedirs(directory, exist_ok=True)
+    tmp = f"{path}.{os.getpid()}.tmp"
+    with open(tmp, "w", encoding="utf-8") as f:
+        json.dump(composition, f, ensure_ascii=False, separators=(",", ":"))
+    os.replace(tmp, path)
+    return path
+
+
+def sizes_from_areas(names, areas):
+    """getLanduseSizes.js result from per-category areas: categories with area, percent of the total."""
+    total = float(np.sum(areas))
+    return {
+        "sizes": {name: {"m": float(m), "p": float(m) / total * 100} for name, m in zip(names, areas) if m > 0},
+        "sumSizes": total,
+    }
+
+
+def circle_polygons(xs, ys, radii, steps=CIRCLE_STEPS):
+    """
+    The circles getCircleGeom.js draws: `steps` vertices at `radius` metres,
+    starting due north and going clockwise.
+    """
+    angles = np.radians(360 / steps * np.arange(steps + 1))
+    angles[-1] = 0.0
+    r = np.asarray(radii, dtype=float)[:, None]
+    coords = np.stack([
+        np.asarray(xs, dtype=float)[:, None] + r * np.sin(angles),
+        np.asarray(ys, dtype=float)[:, None] + r * np.cos(angles),
+    ], axis=-1)
+    return shapely.polygons(coords)
+
+
+def _ragged_arange(counts):
+    """0..n-1 for every n in `counts`, concatenated."""
+    return np.arange(counts.sum()) - np.repeat(np.cumsum(counts) - counts, counts)
+
+
+def _clipped_ring_areas(x, y, ring, n_rings, radius, steps):
+    """
+    Area of each ring (vertices `x`, `y` relative to the circle centre, grouped
+    by `ring`, unclosed) clipped to the `steps`-gon of `radius` per vertex:
+    Sutherland-Hodgman against one edge of the polygon at a time, for all
+    rings at once, then the shoelace formula.
+    """
+    half = np.pi / steps
+    for k in range(steps):
+        if not len(x):
+            break
+        # outward normal of the edge between vertices k and k + 1
+        nx, ny = np.sin(2 * k * half + half), np.cos(2 * k * half + half)
+        s = nx * x + ny * y - radius * np.cos(half)
+        inside = s <= 0
+        idx = np.arange(len(x))
+        first = np.r_[True, ring[1:] != ring[:-1]]
+        last = np.r_[ring[1:] != ring[:-1], True]
+        nxt = np.where(last, np.maximum.accumulate(np.where(first, idx, 0)), idx + 1)
+        crossing = inside != inside[nxt]
+        # each vertex emits itself when inside, then the crossing point of its edge
+        emit = inside.astype(np.int64) + crossing
+        pos = np.cumsum(emit) - emit
+        t = s[crossing] / (s[crossing] - s[nxt[crossing]])
+        out_x, out_y = np.empty(emit.sum()), np.empty(emit.sum())
+        out_x[pos[inside]], out_y[pos[inside]] = x[inside], y[inside]
+        cpos = pos[crossing] + inside[crossing]
+        out_x[cpos] = x[crossing] + t * (x[nxt[crossing]] - x[crossing])
+        out_y[cpos] = y[crossing] + t * (y[nxt[crossing]] - y[crossing])
+        ring, radius = np.repeat(ring, emit), np.repeat(radius, emit)
+        x, y = out_x, out_y
+    if not len(x):
+        return np.zeros(n_rings)
+    idx = np.arange(len(x))
+    first = np.r_[True, ring[1:] != ring[:-1]]
+    last = np.r_[ring[1:] != ring[:-1], True]
+    nxt = np.where(last, np.maximum.accumulate(np.where(first, idx, 0)), idx + 1)
+    return np.abs(0.5 * np.bincount(ring, weights=x * y[nxt] - x[nxt] * y, minlength=n_rings))
+
+
+_worker_engine = None
+
+
+def _init_worker(engine):
+    global _worker_engine
+    _worker_engine = engine
+
+
+def _worker_areas(xs, ys, radii):
+    return _worker_engine.areas(xs, ys, radii)
+
+
+class CompositionEngine:
+    """
+    Land-use composition within circles, the Python counterpart of
+    getLanduseSizes.js, over the whole of `gdf_nutzung` rather than the
+    rendered tiles. Areas are planar m² in EPSG:2056, categories come from
+    colors.json landuseMapping ("other" when unmapped).
+
+        engine = CompositionEngine(gdf_nutzung, color_config)
+        engine.composition(2611300, 1267300)            # {"sizes": {...}, "sumSizes": ...}
+        engine.for_points(gdf_schulstandorte)            # one row per school
+
+    Candidates come from a prebuilt STRtree. Features lying fully inside a
+    circle count with their precomputed area; only the ones crossing it are
+    clipped, for all circles of a batch at once in NumPy (the circle is a
+    convex polygon, so no general overlay is needed). Centres
+    are snapped to `quantum` metres, and the last `cache_size` results are
+    kept (LRU), so repeated queries are dictionary lookups.
+    """
+    def __init__(self, gdf_nutzung, color_config, *, radius=ANALYSIS_RADIUS_M, steps=CIRCLE_STEPS,
+                 quantum=1.0, cache_size=4096):
+        if gdf_nutzung.crs is not None and gdf_nutzung.crs.to_epsg() != CRS_CH:
+            gdf_nutzung = gdf_nutzung.to_crs(CRS_CH)
+        categories = nutzung_categories(gdf_nutzung["nutzung"], color_config)
+        names = list(color_config.get("categories", {}))
+        names += sorted(set(categories) - set(names))
+        self.names = names
+        self.codes = pd.Categorical(categories, categories=names).codes.astype(np.int64)
+        self.geoms = np.asarray(gdf_nutzung.geometry.values)
+        self.radius = radius
+        self.steps = steps
+        self.quantum = quantum
+        self.cache_size = cache_size
+        self._build()
+
+    def _build(self):
+        self.tree = shapely.STRtree(self.geoms)
+        self.feature_areas = shapely.area(self.geoms)
+        self.feature_bounds = shapely.bounds(self.geoms)
+        # rings of all features as flat, unclosed coordinate runs:
+        # feature -> rings [ring_start, +ring_count), ring -> coords [coord_start, +coord_count)
+        parts, part_feature = shapely.get_parts(self.geoms, return_index=True)
+        is_polygon = shapely.get_type_id(parts) == shapely.GeometryType.POLYGON
+        parts, part_feature = parts[is_polygon], part_feature[is_polygon]
+        rings, ring_part = shapely.get_rings(parts, return_index=True)
+        coords, coord_ring = shapely.get_coordinates(rings, return_index=True)
+        closing = np.r_[coord_ring[1:] != coord_ring[:-1], True]
+        self.coords, coord_ring = coords[~closing], coord_ring[~closing]
+        self.coord_count = np.bincount(coord_ring, minlength=len(rings))
+        self.coord_start = np.cumsum(self.coord_count) - self.coord_count
+        self.ring_sign = np.where(np.r_[True, ring_part[1:] != ring_part[:-1]], 1.0, -1.0)
+        self.ring_count = np.bincount(part_feature[ring_part], minlength=len(self.geoms))
+        self.ring_start = np.cumsum(self.ring_count) - self.ring_count
+        self._cache = OrderedDict()
+
+    def __getstate__(self):
+        # worker processes rebuild the tree and start with an empty cache
+        state = self.__dict__.copy()
+        for key in ("tree", "feature_areas", "feature_bounds", "coords", "coord_count", "coord_start",
+                    "ring_sign", "ring_count", "ring_start", "_cache"):
+            state.pop(key)
+        return state
+
+    def __setstate__(self, state):
+        self.__dict__.update(state)
+        self._build()
+
+    def _snap(self, values):
+        values = np.asarray(values, dtype=float)
+        return np.round(values / self.quantum) * self.quantum if self.quantum else values
+
+    def areas(self, xs, ys, radii):
+        """m² per category (columns in `names` order) inside each circle; no snapping, no cache."""
+        xs, ys, radii = np.broadcast_arrays(
+            np.asarray(xs, dtype=float), np.asarray(ys, dtype=float), np.asarray(radii, dtype=float),
+        )
+        n, k = len(xs), len(self.names)
+        if not n:
+            return np.zeros((0, k))
+        # candidates by bounding box; features whose box lies within the
+        # polygon's inscribed circle count whole, boxes beyond its
+        # circumscribed circle not at all, the rest is clipped
+        circles = circle_polygons(xs, ys, radii, self.steps)
+        q, f = self.tree.query(circles)
+        minx, miny, maxx, maxy = self.feature_bounds[f].T
+        cx, cy, r = xs[q], ys[q], radii[q]
+        far = np.maximum(np.abs(minx - cx), np.abs(maxx - cx)) ** 2 + np.maximum(np.abs(miny - cy), np.abs(maxy - cy)) ** 2
+        near = (np.clip(cx, minx, maxx) - cx) ** 2 + (np.clip(cy, miny, maxy) - cy) ** 2
+        inside = far <= (r * np.cos(np.pi / self.steps)) ** 2
+        cut = ~inside & (near < r ** 2)
+        area = np.where(inside, self.feature_areas[f], 0.0)
+
+        pair = np.flatnonzero(cut)
+        n_ring = self.ring_count[f[pair]]
+        ring_pair = np.repeat(pair, n_ring)
+        ring = np.repeat(self.ring_start[f[pair]], n_ring) + _ragged_arange(n_ring)
+        n_coord = self.coord_count[ring]
+        coord = np.repeat(self.coord_start[ring], n_coord) + _ragged_arange(n_coord)
+        coord_ring = np.repeat(np.arange(len(ring)), n_coord)
+        centre = q[ring_pair][coord_ring]
+        ring_area = _clipped_ring_areas(
+            self.coords[coord, 0] - xs[centre], self.coords[coord, 1] - ys[centre],
+            coord_ring, len(ring), radii[centre], self.steps,
+        )
+        area += np.bincount(ring_pair, weights=ring_area * self.ring_sign[ring], minlength=len(q))
+        return np.bincount(q * k + self.codes[f], weights=area, minlength=n * k).reshape(n, k)
+
+    def _cached_areas(self, xs, ys, radii, workers=None, chunk_size=2000):
+        xs, ys = self._snap(xs), self._snap(ys)
+        xs, ys, radii = np.broadcast_arrays(xs, ys, np.asarray(radii, dtype=float))
+        keys = list(zip(xs.tolist(), ys.tolist(), radii.tolist()))
+        out = np.empty((len(keys), len(self.names)))
+        missing = {}
+        for i, key in enumerate(keys):
+            hit = self._cache.get(key)
+            if hit is not None:
+                self._cache.move_to_end(key)
+                out[i] = hit
+            else:
+                missing.setdefault(key, []).append(i)
+        if missing:
+            todo = np.array(list(missing), dtype=float)
+            computed = self._compute(todo[:, 0], todo[:, 1], todo[:, 2], workers, chunk_size)
+            for key, row in zip(missing, computed):
+                out[missing[key]] = row
+                self._cache[key] = row
+            while len(self._cache) > self.cache_size:
+                self._cache.popitem(last=False)
+        return out
+
+    def _compute(self, xs, ys, radii, workers, chunk_size):
+        if not workers or workers < 2 or len(xs) <= chunk_size:
+            return np.concatenate([
+                self.areas(xs[i:i + chunk_size], ys[i:i + chunk_size], radii[i:i + chunk_size])
+                for i in range(0, len(xs), chunk_size)
+            ])
+        with ProcessPoolExecutor(max_workers=workers, initializer=_init_worker, initargs=(self,)) as pool:
+            parts = pool.map(
+                _worker_areas,
+                *zip(*[(xs[i:i + chunk_size], ys[i:i + chunk_size], radii[i:i + chunk_size])
+                       for i in range(0, len(xs), chunk_size)]),
+            )
+            return np.concatenate(list(parts))
+
+    def composition(self, x, y, radius=None):
+        """Composition of one circle (centre in EPSG:2056), shaped like getLanduseSizes.js."""
+        row = self._cached_areas([x], [y], [self.radius if radius is None else radius])[0]
+        return sizes_from_areas(self.names, row)
+
+    def compositions(self, xs, ys, radii=None, *, workers=None, chunk_size=2000):
+        """Compositions of many circles; `radii` may be one value. `workers` > 1 spreads them over processes."""
+        radii = self.radius if radii is None else radii
+        rows = self._cached_areas(xs, ys, radii, workers, chunk_size)
+        return [sizes_from_areas(self.names, row) for row in rows]
+
+    def for_points(self, points, radius=None, *, workers=None, chunk_size=2000):
+        """
+        One row per point of a GeoDataFrame (any CRS): m² per category,
+        `sumSizes` and `p_<category>` percentages, indexed like `points`.
+        """
+        pts = points.geometry
+        if pts.crs is not None and pts.crs.to_epsg() != CRS_CH:
+            pts = pts.to_crs(CRS_CH)
+        # multipoints and other shapes are measured from their centroid
+        pts = pts.centroid if not (pts.geom_type == "Point").all() else pts
+        radius = self.radius if radius is None else radius
+        m = self._cached_areas(pts.x.to_numpy(), pts.y.to_numpy(), radius, workers, chunk_size)
+        table = pd.DataFrame(m, index=points.index, columns=self.names)
+        table["sumSizes"] = m.sum(axis=1)
+        with np.errstate(invalid="ignore", divide="ignore"):
+            for name in self.names:
+                table[f"p_{name}"] = table[name] / table["sumSizes"] * 100
+        return table
@@ -0,0 +1,105 @@
+"""
+One canonical frame in EPSG:2056 and its views in other CRSs.
+
+All spatial work runs on the canonical frame. A view in another CRS (EPSG:4326
+for the export and the tiles) is projected the first time it is asked for and
+then kept. It shares the attribute columns with the canonical frame and only
+has geometries of its own. There is one pyproj transformer per pair of CRSs,
+built on first use. Nothing is projected back: a frame in another CRS is
+brought to EPSG:2056 once, on the way in.
+"""
+import functools
+
+import geopandas as gpd
+import numpy as np
+import pyproj
+import shapely
+
+from .partition import PART_ROWS, map_chunks
+
+CRS_CH = 2056
+
+
+@functools.lru_cache(maxsize=None)
+def _transformer(src, dst):
+    return pyproj.Transformer.from_crs(src, dst, always_xy=True)
+
+
+def transformer(src, dst):
+    """The (cached) pyproj transformer from `src` to `dst`, in x/y order."""
+    return _transformer(pyproj.CRS.from_user_input(src), pyproj.CRS.from_user_input(dst))
+
+
+def project(geoms, src, dst):
+    """Geometry array `geoms` projected from `src` to `dst`."""
+    t = transformer(src, dst)
+
+    def coords(xyz):
+        return np.column_stack(t.transform(*xyz.T))
+
+    return shapely.transform(np.asarray(geoms, dtype=object), coords, include_z=None)
+
+
+def _project_series(geoms, crs):
+    return gpd.GeoSeries(project(geoms.values, geoms.crs, crs), index=geoms.index, crs=crs)
+
+
+def _with_geometry(frame, geoms):
+    # a shallow copy: a new geometry column, the attribute columns stay shared
+    out = frame.copy(deep=False)
+    out[frame.geometry.name] = geoms
+    return out.set_crs(geoms.crs, allow_override=True)
+
+
+def in_crs(frame, crs=CRS_CH):
+    """`frame` (GeoDataFrame or GeoSeries) itself when it is in `crs` (or has no CRS, which is taken as `crs`), projected otherwise."""
+    if frame.crs is None:
+        return frame.set_crs(crs)
+    if frame.crs == pyproj.CRS.from_user_input(crs):
+        return frame
+    geoms = _project_series(frame.geometry, crs)
+    return geoms if isinstance(frame, gpd.GeoSeries) else _with_geometry(frame, geoms)
+
+
+class Dataset:
+    """
+    A GeoDataFrame kept in EPSG:2056 (`frame`) and its views in other CRSs.
+
+        nutzung = Dataset(gdf_nutzung, workers=4)
+        nutzung.frame          # EPSG:2056, for every spatial operation
+        nutzung.view(4326)     # projected once, then reused
+
+    With `workers` > 1, views are projected in row chunks of `part_rows` over
+    a process pool (see map_chunks).
+    """
+    def __init__(self, frame, *, workers=1, part_rows=PART_ROWS):
+        self.workers = workers
+        self.part_rows = part_rows
+        self.frame = self._project(frame, CRS_CH) if frame.crs is not None else frame.set_crs(CRS_CH)
+        self._views = {}
+
+    def __len__(self):
+        return len(self.frame)
+
+    def _project(self, frame, crs):
+        if frame.crs == pyproj.CRS.from_user_input(crs):
+            return frame
+        geoms = map_chunks(_project_series, frame.geometry, workers=self.workers, part_rows=self.part_rows, crs=crs)
+        return _with_geometry(frame, geoms)
+
+    def geometry(self, crs=CRS_CH):
+        """The geometry column in `crs`."""
+        return self.view(crs).geometry
+
+    def view(self, crs=CRS_CH):
+        """The frame in `crs`; the canonical frame itself for EPSG:2056."""
+        key = pyproj.CRS.from_user_input(crs)
+        if key == self.frame.crs:
+            return self.frame
+        if key not in self._views:
+            self._views[key] = self._project(self.frame, key)
+        return self._views[key]
+
+    def drop_views(self):
+        """Forget the projected views; they are projected again when asked for."""
+        self._views.clear()
@@ -0,0 +1,53 @@
+"""
+District polygons (Wahlkreise, Wohnviertel) shared with the frontend.
+
+The frontend bundles them as ES modules (`export default {FeatureCollection}`)
+in src/lib; the ids and names used here mirror `areaModes` in
+src/lib/cityConfig.js.
+"""
+import json
+import os
+
+import geopandas as gpd
+
+from .stages import CRS_CH, REPO_ROOT
+
+DISTRICT_MODES = {
+    "wahlkreis": {
+        "path": os.path.join(REPO_ROOT, "src", "lib", "wahlkreise.js"),
+        "id_property": "objid",
+        "name_property": "wahlkreis",
+    },
+    "wohnviertel": {
+        "path": os.path.join(REPO_ROOT, "src", "lib", "wohnviertel.js"),
+        "id_property": "wov_id",
+        "name_property": "wov_name",
+    },
+}
+
+
+def read_geojson_module(path):
+    """Parse a `export default {...};` JS module holding a GeoJSON object."""
+    with open(path, "r", encoding="utf-8") as f:
+        text = f.read().strip()
+    prefix = "export default"
+    if not text.startswith(prefix):
+        raise ValueError(f"{path} does not start with '{prefix}'")
+    return json.loads(text[len(prefix):].strip().rstrip(";"))
+
+
+def load_districts(mode, crs=CRS_CH):
+    """
+    Districts of one area mode as a GeoDataFrame with columns `id` (string, as
+    the frontend compares it), `name` and `geometry`, reprojected to `crs`.
+    """
+    if mode not in DISTRICT_MODES:
+        raise ValueError(f"Unknown area mode {mode!r}; choose from {list(DISTRICT_MODES)}")
+    spec = DISTRICT_MODES[mode]
+    collection = read_geojson_module(spec["path"])
+    gdf = gpd.GeoDataFrame.from_features(collection["features"], crs=4326)
+    gdf = gpd.GeoDataFrame({
+        "id": gdf[spec["id_property"]].astype(str),
+        "name": gdf[spec["name_property"]].astype(str),
+    }, geometry=gdf.geometry.values, crs=4326)
+    return gdf.to_crs(crs) if crs is not None else gdf
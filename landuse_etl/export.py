@@ -0,0 +1,147 @@
+"""
+Export profiles of the classified land use.
+
+  - "full": every column, as classified (the default)
+  - "tiles": the tile source; only the geometry and a small integer `code`
+    per `nutzung`. The frontend maps codes to `nutzung` through the lookup
+    table src/lib/landuseCodes.json and from there to categories and
+    seasonal palettes (colors.json) at render time, so a change of colours
+    or category mapping needs no tile rebuild.
+
+Codes are stable: the lookup only ever grows, a `nutzung` keeps its code for
+good and new values get the next free one. Unchanged features therefore keep
+byte-identical tile attributes from run to run.
+
+The format follows the file extension (EXPORT_DRIVERS): GeoJSON, newline-
+delimited GeoJSON (one feature per line, which tippecanoe reads in parallel
+with -P) or FlatGeobuf (with its packed R-tree, so other tools can read a bbox
+without loading the whole file). All three are written in batches of features
+streamed through GDAL, never as one document in memory.
+"""
+import json
+import logging
+import os
+
+import numpy as np
+import pyarrow as pa
+import shapely
+from pyogrio.raw import write_arrow
+
+from .stages import REPO_ROOT
+
+EXPORT_PROFILES = ("full", "tiles")
+CODE_COLUMN = "code"
+CODES_PATH = os.path.join(REPO_ROOT, "src", "lib", "landuseCodes.json")
+
+EXPORT_DRIVERS = {
+    ".geojson": "GeoJSON",
+    ".json": "GeoJSON",
+    ".geojsonl": "GeoJSONSeq",
+    ".geojsons": "GeoJSONSeq",
+    ".ndjson": "GeoJSONSeq",
+    ".fgb": "FlatGeobuf",
+}
+# decimal places kept of WGS84 coordinates: 1e-7 degrees is about a centimetre
+COORD_PRECISION = 7
+BATCH_ROWS = 10000
+
+
+def load_landuse_codes(path=CODES_PATH):
+    """{nutzung: code} from the lookup table at `path` (empty when there is none)."""
+    if not os.path.exists(path):
+        return {}
+    with open(path, encoding="utf-8") as f:
+        return {nutzung: int(code) for code, nutzung in json.load(f).items()}
+
+
+def write_landuse_codes(codes, path=CODES_PATH):
+    """Write {nutzung: code} as the lookup table {code: nutzung}, by code."""
+    table = {str(code): nutzung for nutzung, code in sorted(codes.items(), key=lambda item: item[1])}
+    directory = os.path.dirname(path)
+    if directory:
+        os.makedirs(directory, exist_ok=True)
+    tmp = f"{path}.{os.getpid()}.tmp"
+    with open(tmp, "w", encoding="utf-8") as f:
+        json.dump(table, f, ensure_ascii=False, indent=2)
+        f.write("\n")
+    os.replace(tmp, path)
+
+
+def assign_landuse_codes(nutzung, codes):
+    """(code per value of `nutzung`, updated {nutzung: code}); new values get codes after the highest one."""
+    codes = dict(codes)
+    new = sorted(set(nutzung.dropna().astype(str)) - set(codes))
+    start = max(codes.values(), default=0) + 1
+    codes.update({value: start + i for i, value in enumerate(new)})
+    if new:
+        logging.info(f"Land-use codes: {len(new)} new value(s) {new}")
+    return nutzung.astype(str).map(codes).where(nutzung.notna(), 0).to_numpy(dtype=np.int32), codes
+
+
+def export_frame(gdf, profile="full", codes_path=CODES_PATH):
+    """`gdf` as written for `profile` (see EXPORT_PROFILES); "tiles" updates the lookup at `codes_path`."""
+    if profile not in EXPORT_PROFILES:
+        raise ValueError(f"profile must be one of {EXPORT_PROFILES}, not {profile!r}")
+    if profile == "full":
+        return gdf
+    values, codes = assign_landuse_codes(gdf["nutzung"], load_landuse_codes(codes_path))
+    write_landuse_codes(codes, codes_path)
+    return gdf[[gdf.geometry.name]].assign(**{CODE_COLUMN: values})[[CODE_COLUMN, gdf.geometry.name]]
+
+
+def quantize(gdf, decimals=COORD_PRECISION):
+    """`gdf` with coordinates rounded to `decimals` places (None keeps them as they are)."""
+    if decimals is None:
+        return gdf
+    # coordinate by coordinate, as in normalize_geometries: rings keep their order
+    geoms = shapely.set_precision(gdf.geometry.values, 10.0 ** -decimals, mode="pointwise")
+    return gdf.set_geometry(geoms, crs=gdf.crs)
+
+
+def export_driver(path):
+    """The GDAL driver EXPORT_DRIVERS assigns to the extension of `path`."""
+    ext = os.path.splitext(path)[1].lower()
+    if ext not in EXPORT_DRIVERS:
+        raise ValueError(f"{path}: extension must be one of {sorted(EXPORT_DRIVERS)}")
+    return EXPORT_DRIVERS[ext]
+
+
+def _geometry_type(gdf):
+    types = set(gdf.geometry.geom_type.dropna())
+    return types.pop() if len(types) == 1 else "Unknown"
+
+
+def write_features(gdf, path, *, layer="landuse-data", decimals=COORD_PRECISION, batch_rows=BATCH_ROWS):
+    """
+    Write `gdf` to `path` in the format of its extension (see export_driver),
+    streaming `batch_rows` features at a time; GeoJSON text keeps `decimals`
+    places (quantize the frame first to have the geometries match).
+    """
+    driver = export_driver(path)
+    layer_options = {}
+    if driver in ("GeoJSON", "GeoJSONSeq") and decimals is not None:
+        layer_options["COORDINATE_PRECISION"] = decimals
+    if driver == "GeoJSONSeq":
+        layer_options["RS"] = "NO"
+    if driver == "FlatGeobuf":
+        layer_options["SPATIAL_INDEX"] = "YES"
+
+    def batches():
+        for start in range(0, len(gdf), batch_rows):
+            table = pa.table(gdf.iloc[start:start + batch_rows].to_arrow(index=False, geometry_encoding="WKB"))
+            yield from table.to_batches()
+
+    schema = pa.table(gdf.iloc[:0].to_arrow(index=False, geometry_encoding="WKB")).schema
+    directory = os.path.dirname(path)
+    if directory:
+        os.makedirs(directory, exist_ok=True)
+    # the extension stays last: GDAL reads the format from it
+    root, ext = os.path.splitext(path)
+    tmp = f"{root}.{os.getpid()}.tmp{ext}"
+    write_arrow(
+        pa.RecordBatchReader.from_batches(schema, batches()), tmp, layer=layer, driver=driver,
+        geometry_name=gdf.geometry.name, geometry_type=_geometry_type(gdf),
+        crs=gdf.crs.to_wkt() if gdf.crs is not None else None, layer_options=layer_options,
+    )
+    os.replace(tmp, path)
+    return path
@@ -0,0 +1,173 @@
+"""
+Incremental runs: per-feature fingerprints, the plan of which Bodenbedeckung
+features must be recomputed, and the state carried over between runs.
+"""
+import hashlib
+import json
+import logging
+import os
+
+import geopandas as gpd
+import numpy as np
+import pandas as pd
+import shapely
+
+
+# features hashed at a time: the hex WKB of a whole layer is several times its size
+FINGERPRINT_ROWS = 50000
+
+
+def feature_fingerprints(gdf, chunk_rows=FINGERPRINT_ROWS):
+    """
+    One uint64 per feature over its geometry (WKB) and all attributes except
+    the run-local `laufnr`. Independent of column order; rows are hashed
+    `chunk_rows` at a time.
+    """
+    geom_col = gdf.geometry.name
+    cols = sorted(c for c in gdf.columns if c not in (geom_col, "laufnr"))
+    out = np.empty(len(gdf), dtype=np.uint64)
+    for start in range(0, len(gdf), chunk_rows):
+        part = gdf.iloc[start:start + chunk_rows]
+        frame = pd.DataFrame({c: part[c].values for c in cols}, index=pd.RangeIndex(len(part)))
+        frame["__wkb"] = shapely.to_wkb(part.geometry.values, hex=True)
+        out[start:start + len(part)] = pd.util.hash_pandas_object(frame, index=False).to_numpy(dtype=np.uint64)
+    return out
+
+
+class IncrementalPlan:
+    """
+    Which rows of the Bodenbedeckung base layer must be recomputed this run.
+      - `affected`: bool array aligned with the base layer (all True on full runs)
+      - `previous`: last run's output (EPSG:2056, with `_fp`), None on full runs
+      - `fingerprints`: per-layer fingerprints of this run, saved with the output
+    Everything a base feature's derived columns depend on is covered: its own
+    fingerprint, context polygons that were added/removed/changed where they
+    intersect it, and nearest-POI mappings that changed for it.
+    """
+    def __init__(self, mode, affected, previous=None, fingerprints=None, reason=""):
+        self.mode = mode
+        self.affected = affected
+        self.previous = previous
+        self.fingerprints = fingerprints or {}
+        self.reason = reason
+
+    @property
+    def n_affected(self):
+        return int(self.affected.sum())
+
+
+def _state_path(state_dir, name):
+    return os.path.join(state_dir, f"{name}.parquet")
+
+
+def _mapping_frame(mapping, fp_by_laufnr):
+    label_col = next(c for c in mapping.columns if c not in ("laufnr", "dist_m"))
+    return pd.DataFrame({
+        "_fp": fp_by_laufnr.reindex(mapping["laufnr"]).to_numpy(),
+        "label": mapping[label_col].astype(str).to_numpy(),
+        "dist_m": mapping["dist_m"].to_numpy(dtype=float),
+    })
+
+
+def plan_incremental(state_dir, params_hash, base, contexts, mappings, *, enabled=True):
+    """
+    Compare this run's inputs with the state saved by the previous run.
+      base     : Bodenbedeckung layer with `laufnr`
+      contexts : {name: GeoDataFrame} of polygon layers joined onto `base`
+      mappings : {name: DataFrame[laufnr, <label>, dist_m]} nearest-POI results
+    Falls back to a full run when disabled, when there is no usable state, or
+    when the code/config hash differs from the one the state was built with.
+    """
+    fp_base = feature_fingerprints(base)
+    fingerprints = {"base": fp_base}
+    fingerprints.update({name: feature_fingerprints(gdf) for name, gdf in contexts.items()})
+    fp_by_laufnr = pd.Series(fp_base, index=base["laufnr"].to_numpy())
+    fingerprints.update({f"mapping_{name}": _mapping_frame(m, fp_by_laufnr) for name, m in mappings.items()})
+
+    def full(reason):
+        logging.info(f"Incremental: full run ({reason})")
+        return IncrementalPlan("full", np.ones(len(base), dtype=bool), fingerprints=fingerprints, reason=reason)
+
+    if not enabled:
+        return full("incremental mode disabled")
+    try:
+        with open(os.path.join(state_dir, "state.json"), "r", encoding="utf-8") as f:
+            state = json.load(f)
+        if state.get("params_hash") != params_hash:
+            return full("code or configuration changed since the last run")
+        previous = gpd.read_parquet(_state_path(state_dir, "output"))
+        prev_layers = {name: gpd.read_parquet(_state_path(state_dir, f"layer_{name}")) for name in contexts}
+        prev_maps = {name: pd.read_parquet(_state_path(state_dir, f"mapping_{name}")) for name in mappings}
+    except (FileNotFoundError, json.JSONDecodeError, KeyError) as e:
+        return full(f"no usable state in {state_dir}: {e}")
+
+    # 1) new or modified base features
+    affected = ~np.isin(fp_base, previous["_fp"].to_numpy())
+    reasons = {"base": int(affected.sum())}
+
+    # 2) base features intersecting added/removed/modified context polygons
+    tree = base.sindex
+    for name, gdf in contexts.items():
+        prev = prev_layers[name]
+        fp_new = fingerprints[name]
+        changed = np.concatenate([
+            prev.geometry.values[~np.isin(prev["_fp"].to_numpy(), fp_new)],
+            gdf.geometry.values[~np.isin(fp_new, prev["_fp"].to_numpy())],
+        ])
+        hit = np.zeros(len(base), dtype=bool)
+        if len(changed):
+            hit[np.unique(tree.query(changed, predicate="intersects")[1])] = True
+        reasons[name] = int(hit.sum())
+        affected |= hit
+
+    # 3) base features whose nearest-POI assignment changed
+    for name in mappings:
+        cur, prev = fingerprints[f"mapping_{name}"], prev_maps[name]
+        diff = pd.concat([cur, prev]).drop_duplicates(keep=False)
+        hit = np.isin(fp_base, diff["_fp"].to_numpy())
+        reasons[f"mapping_{name}"] = int(hit.sum())
+        affected |= hit
+
+    logging.info(f"Incremental: {int(affected.sum())}/{len(base)} features to recompute {reasons}")
+    return IncrementalPlan("incremental", affected, previous=previous, fingerprints=fingerprints, reason=json.dumps(reasons))
+
+
+def merge_incremental(plan, base, computed):
+    """
+    Combine freshly computed rows with the previous output for all unaffected
+    rows. Row order, `laufnr` and column order are those of a full run.
+    """
+    if plan.previous is None:
+        return computed
+    derived = [c for c in computed.columns if c not in base.columns]
+    prev = plan.previous.drop_duplicates(subset="_fp").set_index("_fp")[derived]
+    reused = base[~plan.affected].set_crs(computed.crs, allow_override=True)
+    values = prev.reindex(plan.fingerprints["base"][~plan.affected])
+    for c in derived:
+        reused[c] = values[c].to_numpy()
+    out = pd.concat([reused, computed], ignore_index=True) if len(computed) else reused
+    out = out.sort_values("laufnr", kind="stable").reset_index(drop=True)[list(computed.columns)]
+    return gpd.GeoDataFrame(out, geometry=computed.geometry.name, crs=computed.crs)
+
+
+def save_incremental_state(state_dir, params_hash, plan, output, contexts):
+    """Persist this run's output (EPSG:2056) and layer fingerprints for the next run."""
+    os.makedirs(state_dir, exist_ok=True)
+    output.assign(_fp=plan.fingerprints["base"]).to_parquet(_state_path(state_dir, "output"))
+    for name, gdf in contexts.items():
+        gpd.GeoDataFrame({"_fp": plan.fingerprints[name]}, geometry=gdf.geometry.values, crs=gdf.crs) \
+            .to_parquet(_state_path(state_dir, f"layer_{name}"))
+    for key, frame in plan.fingerprints.items():
+        if key.startswith("mapping_"):
+            frame.to_parquet(_state_path(state_dir, key))
+    with open(os.path.join(state_dir, "state.json"), "w", encoding="utf-8") as f:
+        json.dump({"params_hash": params_hash, "features": int(len(output))}, f)
+
+
+def params_fingerprint(*paths):
+    """Hash of the files whose content determines the output (code + colour config)."""
+    h = hashlib.sha256()
+    for path in paths:
+        with open(path, "rb") as f:
+            h.update(f.read())
+    return h.hexdigest()
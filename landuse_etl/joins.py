@@ -0,0 +1,98 @@
+"""
+Area-weighted joins: which polygon of one layer owns (most of) each feature of
+another. Intersection areas are read straight off the spatial-index pairs;
+no intersection GeoDataFrame is built.
+"""
+import numpy as np
+import pandas as pd
+import shapely
+
+BY = ("value", "feature")
+
+
+def weighted_pairs(left, right, key, value, *, by="value"):
+    """
+    `left[key]` paired with the non-null `right[value]`s intersecting it, in
+    left/right order, plus one row with a missing value per left feature
+    that intersects none (like a left sjoin). Columns: key, value, `pct`.
+
+    Where a left feature touches a single distinct value there is nothing to
+    weigh and `pct` stays NaN. For the others it is the share of the left
+    feature's area covered, per right feature (`by="feature"`) or summed over
+    all right features with the same value (`by="value"`). Pairs that only
+    touch (no common area) are dropped there.
+    """
+    if by not in BY:
+        raise ValueError(f"by must be one of {BY}, not {by!r}")
+    keep = right[value].notna().to_numpy()
+    right_geoms = right.geometry.values[keep]
+    right_values = right[value].to_numpy()[keep]
+    left_geoms = left.geometry.values
+
+    li, ri = shapely.STRtree(right_geoms).query(left_geoms, predicate="intersects")
+    order = np.lexsort((ri, li))
+    li, ri = li[order], ri[order]
+    pairs = pd.DataFrame({"_left": li, "_right": ri, value: right_values[ri], "pct": np.nan})
+
+    n_values = np.zeros(len(left), dtype=np.int64)
+    counts = pairs.groupby("_left")[value].nunique()
+    n_values[counts.index.to_numpy()] = counts.to_numpy()
+    ambiguous = n_values[li] > 1
+    if ambiguous.any():
+        la, ra = li[ambiguous], ri[ambiguous]
+        covered = shapely.area(shapely.intersection(left_geoms[la], right_geoms[ra]))
+        left_area = shapely.area(left_geoms[la])
+        with np.errstate(invalid="ignore", divide="ignore"):
+            pairs.loc[ambiguous, "pct"] = np.where(left_area > 0, covered / left_area * 100.0, np.nan)
+        touching = np.zeros(len(pairs), dtype=bool)
+        touching[np.flatnonzero(ambiguous)[covered <= 0]] = True
+        pairs = pairs[~touching]
+    if by == "value":
+        grouped = pairs.groupby(["_left", value], sort=False)
+        pairs = pd.concat([grouped["_right"].first(), grouped["pct"].sum(min_count=1)], axis=1).reset_index()
+
+    unmatched = np.flatnonzero(n_values == 0)
+    pairs = pd.concat([
+        pairs,
+        pd.DataFrame({"_left": unmatched, "_right": -1, value: np.nan, "pct": np.nan}),
+    ], ignore_index=True).sort_values(["_left", "_right"], kind="stable")
+    pairs[key] = left[key].to_numpy()[pairs["_left"].to_numpy()]
+    return pairs[[key, value, "pct"]].reset_index(drop=True)
+
+
+def majority(pairs, key, value):
+    """
+    Per key the value with the largest `pct` (the first on ties), or its only
+    value; returns (best, stats). `best` has key, value, `pct` and `ambiguous`.
+    """
+    matched = pairs.dropna(subset=[value])
+    n_values = matched.groupby(key)[value].nunique()
+    ambiguous_keys = n_values.index[n_values > 1]
+    is_ambiguous = matched[key].isin(ambiguous_keys)
+
+    single = matched[~is_ambiguous].drop_duplicates(subset=[key]).assign(ambiguous=False)
+    weighed = matched[is_ambiguous].dropna(subset=["pct"])
+    best_ambiguous = weighed.loc[weighed.groupby(key, sort=False)["pct"].idxmax()].assign(ambiguous=True)
+    best = pd.concat([single, best_ambiguous], ignore_index=True)[[key, value, "pct", "ambiguous"]]
+
+    pct = best_ambiguous["pct"].astype(float)
+    stats = {
+        "ambiguous": len(ambiguous_keys),
+        "resolved": int(best_ambiguous[key].nunique()),
+        "unresolved": len(ambiguous_keys) - int(best_ambiguous[key].nunique()),
+        "pct_summary": {
+            "min": float(np.nanmin(pct)) if len(pct) else None,
+            "median": float(np.nanmedian(pct)) if len(pct) else None,
+            "max": float(np.nanmax(pct)) if len(pct) else None,
+        },
+    }
+    return best, stats
+
+
+def area_weighted_majority_join(left, right, key, value, *, by="value"):
+    """
+    For each feature of `left` (identified by `key`), the `value` of `right`
+    that covers most of its area; returns (best, stats). Features touching a
+    single value take it without any area computed. See weighted_pairs / majority.
+    """
+    return majority(weighted_pairs(left, right, key, value, by=by), key, value)
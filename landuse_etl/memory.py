@@ -0,0 +1,90 @@
+"""
+Low-memory runs (PipelineConfig(low_memory=True)).
+
+  - column projection: the loaded layers keep only the columns some stage
+    reads (see layer_columns); the WFS attributes nothing derives from are
+    dropped right after loading, so the "full" export profile only carries
+    the derived columns in this mode
+  - compact dtypes: repetitive text columns (bs_art_txt, nutzung, category,
+    the colours) become pandas categoricals, the QA distances and shares
+    float32 (see compact_dtypes)
+  - early release: a result is dropped from the pipeline as soon as no
+    stage left in the run reads it (see INTERMEDIATES)
+
+The classification is the same either way; only the exported QA columns lose
+digits beyond float32 precision.
+"""
+import pandas as pd
+
+# intermediate result -> stages that read it; everything else is kept
+INTERMEDIATES = {
+    "gdf_bodenbedeckung": ("normalize", "plan", "classify"),
+    "gdf_gebaeudekategorie": ("normalize", "plan", "categories"),
+    "gdf_oeffentlicher_raum": ("normalize", "plan", "coverage"),
+    "gdf_kultur": ("normalize", "mappings"),
+    "gdf_schulstandorte": ("normalize", "mappings"),
+    "geometry_repairs": (),
+    "buildings_all": ("mappings",),
+    "incremental_contexts": ("classify",),
+    "bb": ("categories", "coverage"),
+    "buildings": (),
+    "joined": (),
+    "ambiguous_buildings": (),
+    "amb_best": (),
+    "gdf_bodenbedeckung_cat": ("classify",),
+    "coverage": ("classify",),
+    "gdf_all": (),
+    "gdf_nutzung_wgs84": ("geojson", "tile_changes"),
+    "gdf_export": ("geojson", "tile_changes"),
+}
+
+CATEGORICAL_COLUMNS = (
+    "bs_art_txt", "oeffentlicher Raum", "nutzung", "category",
+    "color", "color_spring", "color_summer", "color_autumn", "color_winter",
+)
+FLOAT32_COLUMNS = ("oeffentlicher_raum_pct", "kultur_dist_m", "schule_dist_m")
+
+
+def rule_columns(rules):
+    """Feature columns the nutzung `rules` read (see NutzungRules); POI labels are merged in later."""
+    columns = set()
+    for rule in rules["rules"]:
+        if "column" in rule:
+            columns.add(rule["column"])
+        columns.update(rule.get("where", {}))
+        columns.update(rule.get("present", ()))
+    return columns
+
+
+def layer_columns(rules, poi_layers, points):
+    """
+    {layer: attribute columns to keep} of the loaded layers, for `rules` and
+    `poi_layers` (see POI_LAYERS); `points` names the layer of each POI layer.
+    """
+    columns = {
+        "gdf_bodenbedeckung": {"laufnr"} | rule_columns(rules),
+        "gdf_gebaeudekategorie": {"gebaeudekategorieid"},
+        "gdf_oeffentlicher_raum": set(),
+    }
+    for name, spec in poi_layers.items():
+        columns[points[name]] = {spec["label_col"]}
+    return columns
+
+
+def project_columns(gdf, columns):
+    """`gdf` with only the attribute `columns` it has, and its geometry, in their original order."""
+    keep = [c for c in gdf.columns if c in columns or c == gdf.geometry.name]
+    return gdf if len(keep) == len(gdf.columns) else gdf[keep]
+
+
+def compact_dtypes(frame, categorical=CATEGORICAL_COLUMNS, float32=FLOAT32_COLUMNS):
+    """`frame` with its `categorical` columns as pandas categoricals and its `float32` columns as float32."""
+    converted = {}
+    for column in categorical:
+        if column in frame.columns and not isinstance(frame[column].dtype, pd.CategoricalDtype):
+            converted[column] = frame[column].astype("category")
+    for column in float32:
+        if column in frame.columns and frame[column].dtype != "float32":
+            converted[column] = frame[column].astype("float32")
+    return frame.assign(**converted) if converted else frame
+
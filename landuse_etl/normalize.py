@@ -0,0 +1,80 @@
+"""
+Geometry normalization, run once right after loading: every geometry is
+repaired, snapped to a fixed grid in EPSG:2056 and stripped of repeated
+vertices, in whole-array shapely calls. The overlays and joins downstream
+can then take their inputs as valid and skip any healing of their own.
+"""
+import numpy as np
+import pandas as pd
+import shapely
+
+from .dataset import CRS_CH, in_crs
+
+# snapping grid in metres: 1 mm, far below the survey accuracy of the sources
+GRID_SIZE_M = 0.001
+
+# what happened to a feature; "" for features left as loaded
+REPAIRS = ("invalid", "snapped_invalid", "collapsed", "repeated_points")
+
+
+def normalize_geometries(frame, *, grid_size=GRID_SIZE_M):
+    """
+    `frame` in EPSG:2056 with valid geometries on a `grid_size` grid and no
+    repeated vertices; returns (frame, repairs), where `repairs` holds one
+    entry of REPAIRS (or "") per row:
+      - "invalid": not valid as loaded; repaired with make_valid,
+      - "snapped_invalid": valid, but not once snapped; repaired after snapping,
+      - "collapsed": snapping would leave nothing (a sliver below the grid
+        size); the repaired geometry is kept unsnapped,
+      - "repeated_points": consecutive vertices equal on the grid were merged.
+    Missing geometries stay missing.
+    """
+    frame = in_crs(frame, CRS_CH)
+    geoms = np.asarray(frame.geometry.values, dtype=object)
+    repairs = np.full(len(geoms), "", dtype=object)
+    present = ~shapely.is_missing(geoms)
+
+    invalid = present & ~shapely.is_valid(geoms)
+    repaired = geoms.copy()
+    repaired[invalid] = shapely.make_valid(geoms[invalid], method="structure", keep_collapsed=False)
+    repairs[invalid] = "invalid"
+
+    # snap coordinate by coordinate, which keeps ring order and orientation
+    snapped = shapely.set_precision(repaired, grid_size, mode="pointwise")
+    repeated = _has_repeated_points(snapped)
+    broken = present & ~shapely.is_valid(snapped)
+    # where vertices fell together or a ring got pinched, let GEOS rebuild the
+    # geometry on the grid: that merges the vertices and keeps it valid
+    rework = present & (repeated | broken)
+    snapped[rework] = shapely.set_precision(repaired[rework], grid_size)
+    repairs[repeated & ~broken & ~invalid] = "repeated_points"
+    repairs[broken & ~invalid] = "snapped_invalid"
+
+    collapsed = present & shapely.is_empty(snapped) & ~shapely.is_empty(repaired)
+    snapped[collapsed] = repaired[collapsed]
+    repairs[collapsed] = "collapsed"
+
+    frame = frame.copy()
+    frame["geometry"] = snapped
+    return frame, pd.Series(repairs, index=frame.index, name="repair")
+
+
+def repair_stats(repairs):
+    """Feature count and count per kind of repair, for the log."""
+    return {"features": int(len(repairs)), **{kind: int((repairs == kind).sum()) for kind in REPAIRS}}
+
+
+def _has_repeated_points(geoms):
+    """Per geometry: whether two consecutive vertices of one of its rings or lines are equal."""
+    parts, index = shapely.get_parts(geoms, return_index=True)
+    # collections (from make_valid) can hold multi-part geometries in turn
+    while (shapely.get_type_id(parts) >= 4).any():
+        parts, flat_index = shapely.get_parts(parts, return_index=True)
+        index = index[flat_index]
+    rings, ring_index = shapely.get_rings(parts, return_index=True)
+    lines = np.isin(shapely.get_type_id(parts), (1, 2))  # LineString, LinearRing
+    pieces = np.concatenate([rings, parts[lines]])
+    owner = np.concatenate([index[ring_index], index[lines]])
+    coords, piece = shapely.get_coordinates(pieces, return_index=True)
+    same = (coords[1:] == coords[:-1]).all(axis=1) & (piece[1:] == piece[:-1])
+    return np.bincount(owner[piece[1:][same]], minlength=len(geoms)) > 0
@@ -0,0 +1,105 @@
+"""
+Spatial partitioning for the transform stages.
+
+A frame is cut into parts of about `part_rows` features along a Hilbert curve
+(so each part is spatially compact). Every feature belongs to exactly one part,
+the owner rule, so nothing is counted twice. Each part is handed the features of
+the context layers within `halo` metres of it, so joins inside a part see
+everything they would see on the whole frame. Parts run in a process pool
+when `workers` > 1. Results come back in part order, and the callers restore
+input order, so the output does not depend on `workers` or `part_rows`.
+"""
+from concurrent.futures import ProcessPoolExecutor
+
+import geopandas as gpd
+import numpy as np
+import pandas as pd
+import shapely
+
+PART_ROWS = 20000
+
+
+def spatial_parts(geoms, part_rows=PART_ROWS):
+    """Positions of `geoms` (GeoSeries) split into Hilbert-ordered parts of at most `part_rows`."""
+    n = len(geoms)
+    if n <= part_rows:
+        return [np.arange(n)]
+    valid = geoms.notna().to_numpy() & ~geoms.is_empty.to_numpy()
+    key = np.full(n, -1, dtype=np.int64)
+    key[valid] = geoms[valid].hilbert_distance(total_bounds=geoms[valid].total_bounds)
+    order = np.argsort(key, kind="stable")
+    return [np.sort(order[i:i + part_rows]) for i in range(0, n, part_rows)]
+
+
+def context_rows(part_geoms, context, halo=0.0):
+    """Positions of `context` (GeoDataFrame or GeoSeries) within `halo` of any of `part_geoms`."""
+    part_geoms = part_geoms[~shapely.is_missing(part_geoms)]
+    if not len(part_geoms) or not len(context):
+        return np.zeros(0, dtype=np.int64)
+    if halo:
+        hits = context.sindex.query(part_geoms, predicate="dwithin", distance=halo)[1]
+    else:
+        hits = context.sindex.query(part_geoms)[1]
+    return np.unique(hits)
+
+
+def _grid_sizes(arg):
+    """Precision grid of each geometry of a GeoDataFrame/GeoSeries (0: none), or None when there is none to keep."""
+    if not isinstance(arg, (gpd.GeoDataFrame, gpd.GeoSeries)):
+        return None
+    grid = np.nan_to_num(shapely.get_precision(np.asarray(arg.geometry.values if isinstance(arg, gpd.GeoDataFrame) else arg.values)))
+    return grid if grid.any() else None
+
+
+def _with_grid_sizes(arg, grid):
+    if grid is None:
+        return arg
+    geoms = shapely.set_precision(np.asarray(arg.geometry.values if isinstance(arg, gpd.GeoDataFrame) else arg.values), grid, mode="pointwise")
+    if isinstance(arg, gpd.GeoSeries):
+        return gpd.GeoSeries(geoms, index=arg.index, crs=arg.crs, name=arg.name)
+    arg = arg.copy()
+    arg[arg.geometry.name] = gpd.GeoSeries(geoms, index=arg.index, crs=arg.crs)
+    return arg
+
+
+def _call(fn, args, kwargs, grids=None):
+    # pickling goes through WKB, which drops the precision grid set by
+    # normalize; it is put back (coordinates are on it already), so overlays
+    # in a worker snap their results as they do in the parent
+    if grids is not None:
+        args = [_with_grid_sizes(arg, grid) for arg, grid in zip(args, grids)]
+    return fn(*args, **kwargs)
+
+
+def run_parts(fn, jobs, workers=1, **kwargs):
+    """`fn(*job, **kwargs)` for every job, in a process pool when `workers` > 1 and there is more than one job."""
+    if workers and workers > 1 and len(jobs) > 1:
+        grids = [[_grid_sizes(arg) for arg in job] for job in jobs]
+        with ProcessPoolExecutor(max_workers=min(workers, len(jobs))) as pool:
+            return list(pool.map(_call, [fn] * len(jobs), jobs, [kwargs] * len(jobs), grids))
+    return [fn(*job, **kwargs) for job in jobs]
+
+
+def map_partitions(fn, frame, contexts=(), *, halo=0.0, workers=1, part_rows=PART_ROWS, **kwargs):
+    """
+    `fn(part, *context_parts, **kwargs)` for each spatial part of `frame`,
+    where each context part holds the rows of that context layer within
+    `halo` of the part. Returns the results in part order.
+    """
+    jobs = []
+    for rows in spatial_parts(frame.geometry, part_rows):
+        part = frame.iloc[rows]
+        geoms = part.geometry.values
+        jobs.append((part, *(c.iloc[context_rows(geoms, c, halo)] for c in contexts)))
+    return run_parts(fn, jobs, workers, **kwargs)
+
+
+def map_chunks(fn, frame, *, workers=1, part_rows=PART_ROWS, ignore_index=False, **kwargs):
+    """
+    `fn(chunk, **kwargs)` over consecutive row chunks of `frame`, for
+    row-wise transforms; the results are concatenated in input order.
+    """
+    if len(frame) <= part_rows or not workers or workers < 2:
+        return fn(frame, **kwargs)
+    jobs = [(frame.iloc[i:i + part_rows],) for i in range(0, len(frame), part_rows)]
+    return pd.concat(run_parts(fn, jobs, workers, **kwargs), ignore_index=ignore_index)
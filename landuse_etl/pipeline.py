@@ -0,0 +1,487 @@
+"""
+The land-use ETL as an importable pipeline.
+
+    from landuse_etl import Pipeline, PipelineConfig
+    results = Pipeline(PipelineConfig(incremental=True)).run(["geojson"])
+
+Stages run in a fixed order and pull in the stages they depend on; results of
+a stage are kept on the pipeline, so asking for a stage twice runs it once.
+"""
+import glob
+import json
+import logging
+import os
+import time
+
+import pandas as pd
+
+from . import stages as st
+from .checkpoint import StageCache
+from .dataset import Dataset
+from .composition import CompositionEngine, district_composition, nutzung_categories, write_composition
+from .incremental import merge_incremental, params_fingerprint, plan_incremental, save_incremental_state
+from .memory import INTERMEDIATES, compact_dtypes, layer_columns, project_columns
+from .normalize import GRID_SIZE_M, repair_stats
+from .partition import PART_ROWS
+from .pmtiles import write_pmtiles
+from .profiling import Profiler
+from .raster import load_category_raster, write_category_raster
+from .districts import load_districts
+from .export import CODES_PATH, COORD_PRECISION, export_frame, quantize, write_features
+from .svg import export_district_svgs, export_to_svg
+from .tilediff import plan_tile_changes, promote_tile_state
+from .wfs import DEFAULT_WFS_URL, HttpCache
+
+# stage -> stages whose results it reads; the order is the execution order
+STAGES = {
+    "load": (),
+    "normalize": ("load",),
+    "mappings": ("normalize",),
+    "plan": ("normalize", "mappings"),
+    "categories": ("plan",),
+    "coverage": ("plan",),
+    "classify": ("categories", "coverage", "mappings"),
+    "geojson": ("classify",),
+    "svg": ("classify",),
+    "composition": ("classify",),
+    "raster": ("classify",),
+    "district_svg": ("classify",),
+    "tile_changes": ("classify",),
+    "pmtiles": (),
+}
+
+# stages that only run when asked for by name
+OPTIONAL_STAGES = ("raster", "district_svg", "tile_changes", "pmtiles")
+DEFAULT_STAGES = tuple(name for name in STAGES if name not in OPTIONAL_STAGES)
+
+# POI layer (see POI_LAYERS) -> loaded layer with its points
+POI_POINTS = {"kultur": "gdf_kultur", "schulen": "gdf_schulstandorte"}
+
+
+class PipelineConfig:
+    """
+    Everything a run depends on besides the data itself.
+      - `output` / `svg_output`: where the geojson and svg stages write
+      - `export_profile`, `codes_path`: columns of the GeoJSON, "full" or the
+        slim "tiles" profile with a `code` per nutzung and its lookup table
+        at `codes_path` (see export_frame)
+      - `coord_precision`: decimal places the exported WGS84 coordinates are
+        rounded to (None keeps them); the format follows the extension of
+        `output` (see write_features)
+      - `composition_output`: per-district landuse composition (JSON) of the
+        composition stage, for the area modes in `district_modes`
+      - `raster_output`, `raster_cell_size`: category raster with summed-area
+        tables written by the raster stage (see CategoryRaster)
+      - `tiles_dir`, `pmtiles_output`: the pmtiles stage packs the tippecanoe
+        tile directory into one PMTiles archive (see write_pmtiles)
+      - `tile_changes_dir`: where the tile_changes stage writes which tiles
+        changed since the last run (see plan_tile_changes); `dirty_tiles`:
+        its changes.json, to update only those tiles in the archive
+      - `district_svg_dir`, `district_modes`: where the district_svg stage writes
+        one level-of-detail SVG per district of each area mode
+      - `profile_output`: per-stage profiling report (JSON); defaults to
+        `<output>.profile.json` next to the GeoJSON, None disables it
+      - `colors_path`, `rules_path`: colour configuration and nutzung rules
+        (src/lib/colors.json, src/lib/nutzungRules.json; see NutzungRules)
+      - `grid_size`: snapping grid of the normalize stage, in metres
+      - `workers`, `part_rows`: processes for the stages that run on spatial
+        parts, and the features per part (see partition)
+      - `bbox`: (minx, miny, maxx, maxy) in EPSG:2056 to load only the
+        features intersecting it, e.g. a sub-area for tests (None: the whole
+        canton; see load_data_from_wfs)
+      - `offline`, `cache_dir`: HTTP cache (see HttpCache)
+      - `incremental`, `state_dir`: incremental runs (see plan_incremental);
+        the tile state of tile_changes is kept there too, and the pmtiles
+        stage makes it current once the tiles are built (see promote_tile_state)
+      - `low_memory`: project the loaded layers to the columns the stages
+        read, store repetitive columns as categoricals and release
+        intermediates once no stage of the run reads them (see memory);
+        `memory_budget_mb`: peak RSS the profiling report checks every
+        stage against
+      - `checkpoints`, `stage_dir`, `source_token`: stage checkpoints (see StageCache);
+        the Bodenbedeckung load is only checkpointed under a `source_token`
+    """
+    def __init__(
+        self, url_wfs=DEFAULT_WFS_URL, *,
+        output="landuse.geojson", svg_output="landuse.svg", export_profile="full", codes_path=CODES_PATH, coord_precision=COORD_PRECISION, colors_path=st.COLORS_PATH, rules_path=st.RULES_PATH, profile_output="",
+        composition_output="composition.json", raster_output="landuse.raster", raster_cell_size=2.0,
+        tiles_dir="tiles", pmtiles_output="landuse.pmtiles", tile_changes_dir="tile_changes", dirty_tiles=None,
+        district_svg_dir="districts", district_modes=("wohnviertel", "wahlkreis"),
+        grid_size=GRID_SIZE_M, workers=1, part_rows=PART_ROWS, bbox=None, offline=False, cache_dir=os.path.join(".cache", "http"),
+        incremental=False, state_dir=os.path.join(".cache", "incremental"),
+        low_memory=False, memory_budget_mb=None, checkpoints=True, stage_dir=os.path.join(".cache", "stages"), source_token=None,
+    ):
+        self.url_wfs = url_wfs
+        self.output = output
+        self.svg_output = svg_output
+        self.export_profile = export_profile
+        self.codes_path = codes_path
+        self.coord_precision = coord_precision
+        self.composition_output = composition_output
+        self.raster_output = raster_output
+        self.raster_cell_size = raster_cell_size
+        self.tiles_dir = tiles_dir
+        self.pmtiles_output = pmtiles_output
+        self.tile_changes_dir = tile_changes_dir
+        self.dirty_tiles = dirty_tiles
+        self.district_svg_dir = district_svg_dir
+        self.district_modes = tuple(district_modes)
+        self.profile_output = (os.path.splitext(output)[0] + ".profile.json") if profile_output == "" else profile_output
+        self.colors_path = colors_path
+        self.rules_path = rules_path
+        self.grid_size = grid_size
+        self.workers = workers
+        self.part_rows = part_rows
+        self.bbox = None if bbox is None else tuple(float(v) for v in bbox)
+        self.offline = offline
+        self.cache_dir = cache_dir
+        self.incremental = incremental
+        self.state_dir = state_dir
+        self.low_memory = low_memory
+        self.memory_budget_mb = memory_budget_mb
+        self.checkpoints = checkpoints
+        self.stage_dir = stage_dir
+        self.source_token = None if source_token is None else str(source_token)
+
+
+def resolve_stages(targets=None, skip=()):
+    """The requested stages (default: DEFAULT_STAGES) plus everything they depend on, in execution order."""
+    targets = list(DEFAULT_STAGES) if not targets else list(targets)
+    unknown = sorted((set(targets) | set(skip)) - set(STAGES))
+    if unknown:
+        raise ValueError(f"Unknown stage(s) {unknown}; choose from {list(STAGES)}")
+    needed = set()
+
+    def visit(name):
+        if name not in needed:
+            needed.add(name)
+            for dep in STAGES[name]:
+                visit(dep)
+
+    for name in targets:
+        if name not in skip:
+            visit(name)
+    return [name for name in STAGES if name in needed]
+
+
+def code_fingerprint(colors_path=st.COLORS_PATH, rules_path=st.RULES_PATH):
+    """Hash of the pipeline code, colour configuration and nutzung rules; incremental state and stage checkpoints are only reused if it matches."""
+    sources = sorted(glob.glob(os.path.join(os.path.dirname(os.path.abspath(__file__)), "*.py")))
+    return params_fingerprint(*sources, colors_path, rules_path)
+
+
+class Pipeline:
+    """
+    Runs the ETL stages as plain function calls. `results` maps result names
+    (gdf_bodenbedeckung, mapping_kultur, gdf_nutzung, ...) to values and
+    `timings` maps stage names to wall-clock seconds; `profiler` holds the finer
+    per-step measurements that end up in the profiling report.
+    """
+    def __init__(self, config=None):
+        self.config = config or PipelineConfig()
+        self.http_cache = HttpCache(self.config.cache_dir, offline=self.config.offline)
+        self.stage_cache = StageCache(
+            self.config.stage_dir, enabled=self.config.checkpoints,
+            code_token=code_fingerprint(self.config.colors_path, self.config.rules_path) if self.config.checkpoints else "",
+        )
+        budget_mb = self.config.memory_budget_mb
+        self.profiler = Profiler(
+            enabled=self.config.profile_output is not None or budget_mb is not None,
+            budget_bytes=None if budget_mb is None else int(budget_mb * 2**20), workers=self.config.workers,
+        )
+        self.results = {}
+        self.timings = {}
+        self.released = set()
+
+    def run(self, targets=None, skip=()):
+        """
+        Run `targets` (default: all stages) and their dependencies; returns
+        `results`. Low-memory runs release intermediates no stage left in this
+        call reads, so ask for every stage you need in one call.
+        """
+        names = resolve_stages(targets, skip)
+        for i, name in enumerate(names):
+            if name in self.timings:
+                continue
+            t0 = time.perf_counter()
+            self.results.update(getattr(self, f"_stage_{name}")())
+            self.timings[name] = time.perf_counter() - t0
+            logging.info(f"Stage {name} finished in {self.timings[name]:.2f}s")
+            if self.config.low_memory:
+                self._release(names[i + 1:])
+        if self.config.profile_output and self.profiler.records:
+            self.profiler.write(self.config.profile_output)
+        return self.results
+
+    def _release(self, remaining):
+        # drop intermediates (see INTERMEDIATES) none of the `remaining` stages reads
+        for name, readers in INTERMEDIATES.items():
+            if name in self.results and not set(readers) & set(remaining):
+                del self.results[name]
+                self.released.add(name)
+                if name == "gdf_nutzung_wgs84":
+                    self.results["nutzung"].drop_views()
+
+    def get(self, name):
+        """One result by name, running the stage that produces it if necessary."""
+        if name not in self.results:
+            for stage in STAGES:
+                self.run([stage])
+                if name in self.results or name in self.released:
+                    break
+            else:
+                raise KeyError(name)
+            if name not in self.results:
+                raise KeyError(f"{name} was released by this low-memory run")
+        return self.results[name]
+
+    def composition_engine(self):
+        """CompositionEngine over this run's gdf_nutzung (built once)."""
+        if "composition_engine" not in self.results:
+            self.results["composition_engine"] = CompositionEngine(self.get("gdf_nutzung"), self.get("color_config"))
+        return self.results["composition_engine"]
+
+    # --------------------------------------------------------------- stages
+
+    def _stage_load(self):
+        cfg, cache = self.config, self.http_cache
+        # the other layers are always narrowed to what the stages read (see stages)
+        bb_properties = None
+        if cfg.low_memory:
+            columns = layer_columns(st.load_rules(cfg.rules_path), st.POI_LAYERS, POI_POINTS)
+            bb_properties = sorted(columns["gdf_bodenbedeckung"] - {*st.ATTACHED_COLUMNS, "geometry"})
+        with self.profiler.stage("load") as rec:
+            loaded = {
+                "gdf_bodenbedeckung": st.load_bodenbedeckung(
+                    cfg.url_wfs, cache, self.stage_cache, cfg.source_token, properties=bb_properties, bbox=cfg.bbox,
+                ),
+                "gdf_gebaeudekategorie": st.load_gebaeudekategorie(cfg.url_wfs, cache, bbox=cfg.bbox),
+                "gdf_oeffentlicher_raum": st.load_oeffentlicher_raum(cfg.url_wfs, cache, bbox=cfg.bbox),
+                "gdf_kultur": st.load_kultur(cfg.url_wfs, cache, bbox=cfg.bbox),
+                "gdf_schulstandorte": st.load_schulstandorte(cfg.url_wfs, cache, bbox=cfg.bbox),
+            }
+            if cfg.low_memory:
+                # only the columns some stage reads, repetitive text as categoricals
+                loaded = {name: compact_dtypes(project_columns(gdf, columns[name])) for name, gdf in loaded.items()}
+            rec.outputs = list(loaded.values())
+        return loaded
+
+    def _stage_normalize(self):
+        # valid, mm-snapped geometries for every overlay and join downstream
+        r, cfg = self.results, self.config
+        layers = ("gdf_bodenbedeckung", "gdf_gebaeudekategorie", "gdf_oeffentlicher_raum", "gdf_kultur", "gdf_schulstandorte")
+        normalized, repairs = {}, {}
+        with self.profiler.stage("normalize", inputs=[r[name] for name in layers]) as rec:
+            for name in layers:
+                normalized[name], repairs[name] = st.normalize_layer(
+                    name.removeprefix("gdf_"), r[name], self.stage_cache, grid_size=cfg.grid_size,
+                )
+            rec.outputs = list(normalized.values())
+        for name, layer_repairs in repairs.items():
+            logging.info(f"Normalized {name}: {repair_stats(layer_repairs)}")
+        geometry_repairs = pd.concat(
+            [layer_repairs[layer_repairs != ""].to_frame().assign(layer=name) for name, layer_repairs in repairs.items()]
+        )
+        # all buildings; the nearest-POI mappings always look at every building
+        normalized["buildings_all"] = st.select_buildings(normalized["gdf_bodenbedeckung"])
+        return {**normalized, "geometry_repairs": geometry_repairs}
+
+    def _stage_mappings(self):
+        r = self.results
+        points = {name: r[layer] for name, layer in POI_POINTS.items()}
+        with self.profiler.stage("poi_mapping", inputs=(*points.values(), r["buildings_all"])) as rec:
+            poi_mappings = st.map_pois(points, r["buildings_all"], self.stage_cache)
+            rec.outputs = list(poi_mappings.values())
+        return {"poi_mappings": poi_mappings, **{f"mapping_{name}": mapping for name, mapping in poi_mappings.items()}}
+
+    def _stage_plan(self):
+        # Which features need recomputing? Everything on a full run; on an
+        # incremental run only what changed inputs can reach.
+        r, cfg = self.results, self.config
+        params_hash = code_fingerprint(cfg.colors_path, cfg.rules_path)
+        if cfg.low_memory:
+            # fingerprints over the projected columns: state of the other mode is not reused
+            params_hash += ":low_memory"
+        incremental_contexts = {
+            "gebaeudekategorie": r["gdf_gebaeudekategorie"],
+            "oeffentlicher_raum": r["gdf_oeffentlicher_raum"],
+        }
+        with self.profiler.stage("incremental_plan", inputs=[r["gdf_bodenbedeckung"], *incremental_contexts.values()]) as rec:
+            incremental_plan = plan_incremental(
+                cfg.state_dir, params_hash, r["gdf_bodenbedeckung"], incremental_contexts,
+                r["poi_mappings"],
+                enabled=cfg.incremental,
+            )
+            # nothing downstream modifies bb: a full run works on the layer itself
+            bb = r["gdf_bodenbedeckung"]
+            if not incremental_plan.affected.all():
+                bb = bb[incremental_plan.affected].copy()
+            rec.outputs = bb
+        return {
+            "params_hash": params_hash,
+            "incremental_contexts": incremental_contexts,
+            "incremental_plan": incremental_plan,
+            "bb": bb,
+        }
+
+    def _stage_categories(self):
+        r, cache, cfg = self.results, self.stage_cache, self.config
+        buildings = st.select_buildings(r["bb"])
+        with self.profiler.stage("category_join", inputs=(buildings, r["gdf_gebaeudekategorie"])) as rec:
+            joined = st.join_building_categories(
+                buildings, r["gdf_gebaeudekategorie"], cache, workers=cfg.workers, part_rows=cfg.part_rows,
+            )
+            rec.outputs = joined
+        with self.profiler.stage("ambiguity_resolution", inputs=(r["bb"], joined)) as rec:
+            ambiguous_ids, ambiguous_buildings = st.find_ambiguous(joined)
+            amb_best, amb_stats = st.resolve_ambiguous(joined)
+            gdf_bodenbedeckung_cat, stats_final = st.assign_building_categories(r["bb"], joined, ambiguous_ids, amb_best)
+            rec.outputs = gdf_bodenbedeckung_cat
+        logging.info(f"Ambiguous buildings: {amb_stats}")
+        logging.info(f"Gebäudekategorie mapping: {stats_final}")
+        return {
+            "buildings": buildings,
+            "joined": joined,
+            "ambiguous_ids": ambiguous_ids,
+            "ambiguous_buildings": ambiguous_buildings,
+            "amb_best": amb_best,
+            "amb_stats": amb_stats,
+            "gdf_bodenbedeckung_cat": gdf_bodenbedeckung_cat,
+            "stats_final": stats_final,
+        }
+
+    def _stage_coverage(self):
+        r, cfg = self.results, self.config
+        with self.profiler.stage("public_space_coverage", inputs=(r["bb"], r["gdf_oeffentlicher_raum"])) as rec:
+            coverage, coverage_stats = st.public_coverage(
+                r["bb"], r["gdf_oeffentlicher_raum"], self.stage_cache,
+                mode=r["incremental_plan"].mode, workers=cfg.workers, part_rows=cfg.part_rows,
+            )
+            rec.outputs = coverage
+        logging.info(f"Öffentlicher Raum coverage: {coverage_stats}")
+        return {"coverage": coverage, "coverage_stats": coverage_stats}
+
+    def _stage_classify(self):
+        r, cfg = self.results, self.config
+        with self.profiler.stage("classification", inputs=(r["gdf_bodenbedeckung_cat"], r["coverage"])) as rec:
+            gdf_all = st.attach_coverage(r["gdf_bodenbedeckung_cat"], r["coverage"])
+            color_config = st.load_color_config(cfg.colors_path)
+            rules = st.load_rules(cfg.rules_path)
+            gdf_nutzung = st.classify_nutzung(
+                gdf_all, r["poi_mappings"], rules, color_config, self.stage_cache,
+                workers=cfg.workers, part_rows=cfg.part_rows,
+            )
+
+            # Incremental runs only computed the affected rows; fill in the rest from the
+            # previous run, then keep this run's result as the base for the next one
+            gdf_nutzung = merge_incremental(r["incremental_plan"], r["gdf_bodenbedeckung"], gdf_nutzung)
+            if cfg.low_memory:
+                gdf_nutzung = compact_dtypes(gdf_nutzung)
+                # the previous run's output was only needed for the merge
+                r["incremental_plan"].previous = None
+            rec.outputs = gdf_nutzung
+        with self.profiler.stage("incremental_state", inputs=gdf_nutzung):
+            save_incremental_state(cfg.state_dir, r["params_hash"], r["incremental_plan"], gdf_nutzung, r["incremental_contexts"])
+        # gdf_nutzung stays in EPSG:2056; the export reads its WGS84 view
+        nutzung = Dataset(gdf_nutzung, workers=cfg.workers, part_rows=cfg.part_rows)
+        return {"gdf_all": gdf_all, "color_config": color_config, "gdf_nutzung": nutzung.frame, "nutzung": nutzung}
+
+    def _wgs84(self):
+        if "gdf_nutzung_wgs84" not in self.results:
+            self.results["gdf_nutzung_wgs84"] = self.results["nutzung"].view(4326)
+        return self.results["gdf_nutzung_wgs84"]
+
+    def _export(self):
+        # what the geojson stage writes (and the tiles are built from)
+        if "gdf_export" not in self.results:
+            cfg = self.config
+            self.results["gdf_export"] = quantize(
+                export_frame(self._wgs84(), cfg.export_profile, cfg.codes_path), cfg.coord_precision,
+            )
+        return self.results["gdf_export"]
+
+    def _stage_geojson(self):
+        with self.profiler.stage("geojson_write", inputs=self.results["gdf_nutzung"]):
+            write_features(self._export(), self.config.output, decimals=self.config.coord_precision)
+        logging.info(f"Land use written to {self.config.output}")
+        return {"geojson_path": self.config.output}
+
+    def _stage_svg(self):
+        # drawn from the EPSG:2056 frame: no round trip through WGS84
+        with self.profiler.stage("svg_export", inputs=self.results["gdf_nutzung"]):
+            svg_path = export_to_svg(
+                self.results["gdf_nutzung"],
+                output_path=self.config.svg_output,
+                bounds=None,
+                width=2000,
+                height=None,
+                stroke_width=0,
+                stroke_color="#000000"
+            )
+        return {"svg_path": svg_path}
+
+    def _stage_composition(self):
+        cfg, r = self.config, self.results
+        gdf_nutzung = r["gdf_nutzung"]
+        categories = nutzung_categories(gdf_nutzung["nutzung"], r["color_config"])
+        composition = {}
+        for mode in cfg.district_modes:
+            districts = load_districts(mode)
+            with self.profiler.stage(f"composition_{mode}", inputs=(gdf_nutzung, districts)):
+                composition[mode] = district_composition(gdf_nutzung, districts, categories)
+        write_composition(composition, cfg.composition_output)
+        logging.info(f"District composition written to {cfg.composition_output}")
+        return {"composition": composition, "composition_path": cfg.composition_output}
+
+    def _stage_raster(self):
+        cfg, r = self.config, self.results
+        with self.profiler.stage("category_raster", inputs=r["gdf_nutzung"]):
+            write_category_raster(
+                r["gdf_nutzung"], nutzung_categories(r["gdf_nutzung"]["nutzung"], r["color_config"]), cfg.raster_output,
+                category_names=r["color_config"].get("categories", {}), cell_size=cfg.raster_cell_size,
+            )
+        return {"raster_path": cfg.raster_output, "category_raster": load_category_raster(cfg.raster_output)}
+
+    def _stage_pmtiles(self):
+        # needs only the tile directory tippecanoe wrote from the geojson stage's output
+        cfg = self.config
+        dirty = None
+        if cfg.dirty_tiles:
+            with open(cfg.dirty_tiles, encoding="utf-8") as f:
+                changes = json.load(f)
+            if changes["mode"] == "dirty":
+                dirty = changes["tiles"]
+        with self.profiler.stage("pmtiles"):
+            stats = write_pmtiles(cfg.tiles_dir, cfg.pmtiles_output, dirty=dirty)
+        # the tiles of the last tile_changes run are in: diff the next run against them
+        if promote_tile_state(cfg.state_dir):
+            logging.info(f"Tile state in {cfg.state_dir} updated")
+        return {"pmtiles_path": cfg.pmtiles_output, "pmtiles_stats": stats}
+
+    def _stage_tile_changes(self):
+        cfg, r = self.config, self.results
+        with self.profiler.stage("tile_changes", inputs=r["gdf_nutzung"]):
+            changes = plan_tile_changes(
+                cfg.state_dir, self._export(), r["incremental_plan"].fingerprints["base"], cfg.tile_changes_dir,
+                decimals=cfg.coord_precision,
+            )
+        return {"tile_changes": changes}
+
+    def _stage_district_svg(self):
+        cfg, gdf_nutzung = self.config, self.results["gdf_nutzung"]
+        paths = {}
+        for mode in cfg.district_modes:
+            districts = load_districts(mode)
+            with self.profiler.stage(f"district_svg_{mode}", inputs=(gdf_nutzung, districts)):
+                paths[mode] = export_district_svgs(
+                    gdf_nutzung, districts, cfg.district_svg_dir, prefix=mode,
+                    width=1000, stroke_width=0, stroke_color="#000000",
+                )
+        return {"district_svg_paths": paths}
+
+
+def run_pipeline(config=None, targets=None, skip=()):
+    """Run the pipeline once; returns the finished Pipeline (results and timings)."""
+    pipeline = Pipeline(config)
+    pipeline.run(targets, skip)
+    return pipeline
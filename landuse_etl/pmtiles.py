@@ -0,0 +1,334 @@
+"""
+PMTiles (v3) packaging of the tippecanoe tile directory: one archive with
+gzip-compressed tiles instead of a directory of loose .pbf files.
+
+The archive is a 127-byte header, the root directory, the metadata (gzip
+JSON), the leaf directories and the tile data. Tiles are keyed by their
+Hilbert tile id; identical tiles (all water, all forest, ...) are stored once
+and runs of consecutive identical tiles take one directory entry. The output
+is deterministic, so an unchanged tile set gives an unchanged file.
+See https://github.com/protomaps/PMTiles/blob/main/spec/v3/spec.md
+"""
+import gzip
+import hashlib
+import json
+import logging
+import os
+import re
+import struct
+
+MAGIC = b"PMTiles"
+VERSION = 3
+HEADER_SIZE = 127
+# the first request reads the header and the root directory together
+ROOT_SIZE = 16384 - HEADER_SIZE
+LEAF_ENTRIES = 4096
+
+COMPRESSION_NONE = 1
+COMPRESSION_GZIP = 2
+TILE_TYPE_MVT = 1
+
+_HEADER = struct.Struct("<7sB8Q3QBBBBBBiiiiBii")
+_TILE_PATH = re.compile(r"(\d+)[/\\](\d+)[/\\](\d+)\.pbf$")
+
+
+def zxy_to_tileid(z, x, y):
+    """Tile id of z/x/y: the tiles of lower zooms first, then the Hilbert index within zoom z."""
+    acc = ((1 << (2 * z)) - 1) // 3
+    n = 1 << z
+    d = 0
+    s = n >> 1
+    while s:
+        rx = 1 if x & s else 0
+        ry = 1 if y & s else 0
+        d += s * s * ((3 * rx) ^ ry)
+        if ry == 0:
+            if rx == 1:
+                x, y = n - 1 - x, n - 1 - y
+            x, y = y, x
+        s >>= 1
+    return acc + d
+
+
+def _varint(value):
+    out = bytearray()
+    while value >= 0x80:
+        out.append((value & 0x7F) | 0x80)
+        value >>= 7
+    out.append(value)
+    return bytes(out)
+
+
+def _read_varint(buf, pos):
+    value = shift = 0
+    while True:
+        b = buf[pos]
+        pos += 1
+        value |= (b & 0x7F) << shift
+        if b < 0x80:
+            return value, pos
+        shift += 7
+
+
+def _gzip(data):
+    # mtime=0: the same bytes give the same archive
+    return gzip.compress(data, compresslevel=9, mtime=0)
+
+
+def serialize_directory(entries):
+    """gzip-compressed directory of (tile_id, offset, length, run_length) entries, sorted by tile id."""
+    out = bytearray(_varint(len(entries)))
+    last = 0
+    for tile_id, _, _, _ in entries:
+        out += _varint(tile_id - last)
+        last = tile_id
+    for entry in entries:
+        out += _varint(entry[3])
+    for entry in entries:
+        out += _varint(entry[2])
+    for i, (_, offset, _, _) in enumerate(entries):
+        # 0: right after the previous entry's data
+        if i and offset == entries[i - 1][1] + entries[i - 1][2]:
+            out += _varint(0)
+        else:
+            out += _varint(offset + 1)
+    return _gzip(bytes(out))
+
+
+def deserialize_directory(data):
+    """Entries of a gzip-compressed directory, as (tile_id, offset, length, run_length)."""
+    buf = gzip.decompress(data)
+    n, pos = _read_varint(buf, 0)
+    tile_ids, run_lengths, lengths = [], [], []
+    last = 0
+    for _ in range(n):
+        delta, pos = _read_varint(buf, pos)
+        last += delta
+        tile_ids.append(last)
+    for column in (run_lengths, lengths):
+        for _ in range(n):
+            value, pos = _read_varint(buf, pos)
+            column.append(value)
+    entries = []
+    for i in range(n):
+        value, pos = _read_varint(buf, pos)
+        offset = entries[i - 1][1] + entries[i - 1][2] if value == 0 and i else value - 1
+        entries.append((tile_ids[i], offset, lengths[i], run_lengths[i]))
+    return entries
+
+
+def _directories(entries):
+    """(root, leaves): all entries in the root when it fits, else leaves of LEAF_ENTRIES and up."""
+    root = serialize_directory(entries)
+    if len(root) <= ROOT_SIZE:
+        return root, b""
+    leaf_entries = LEAF_ENTRIES
+    while True:
+        leaves, pointers = bytearray(), []
+        for i in range(0, len(entries), leaf_entries):
+            chunk = entries[i:i + leaf_entries]
+            leaf = serialize_directory(chunk)
+            # run_length 0 marks a pointer to a leaf directory
+            pointers.append((chunk[0][0], len(leaves), len(leaf), 0))
+            leaves += leaf
+        root = serialize_directory(pointers)
+        if len(root) <= ROOT_SIZE:
+            return root, bytes(leaves)
+        leaf_entries *= 2
+
+
+def read_tile_directory(tile_dir):
+    """{(z, x, y): path} of the .pbf tiles under `tile_dir` (tippecanoe --output-to-directory)."""
+    tiles = {}
+    for root, _, files in os.walk(tile_dir):
+        for name in files:
+            path = os.path.join(root, name)
+            match = _TILE_PATH.search(path)
+            if match:
+                tiles[tuple(int(v) for v in match.groups())] = path
+    return tiles
+
+
+def _metadata(tile_dir):
+    """tippecanoe's metadata.json in PMTiles form: its `json` string spread into the top level."""
+    path = os.path.join(tile_dir, "metadata.json")
+    if not os.path.exists(path):
+        return {}
+    with open(path, encoding="utf-8") as f:
+        metadata = json.load(f)
+    metadata.update(json.loads(metadata.pop("json", "{}")))
+    return metadata
+
+
+def _e7(value):
+    return int(round(float(value) * 1e7))
+
+
+def tileid_zoom(tile_id):
+    """Zoom level of a tile id."""
+    z = 0
+    while ((1 << (2 * (z + 1))) - 1) // 3 <= tile_id:
+        z += 1
+    return z
+
+
+def _tile_content(path):
+    with open(path, "rb") as f:
+        content = f.read()
+    return content if content[:2] == b"\x1f\x8b" else _gzip(content)
+
+
+def _write_archive(path, tiles, metadata, bounds, center):
+    """Write {tile_id: gzipped tile} as a PMTiles archive; returns stats."""
+    entries, data = [], bytearray()
+    stored = {}
+    for tile_id in sorted(tiles):
+        content = tiles[tile_id]
+        digest = hashlib.sha256(content).digest()
+        if digest not in stored:
+            stored[digest] = (len(data), len(content))
+            data += content
+        offset, length = stored[digest]
+        last = entries[-1] if entries else None
+        if last and last[1] == offset and last[0] + last[3] == tile_id:
+            entries[-1] = (last[0], offset, length, last[3] + 1)
+        else:
+            entries.append((tile_id, offset, length, 1))
+
+    root, leaves = _directories(entries)
+    meta = _gzip(json.dumps(metadata, ensure_ascii=False, sort_keys=True).encode("utf-8"))
+    zooms = [tileid_zoom(tile_id) for tile_id in (entries[0][0], entries[-1][0] + entries[-1][3] - 1)]
+
+    root_offset = HEADER_SIZE
+    meta_offset = root_offset + len(root)
+    leaves_offset = meta_offset + len(meta)
+    data_offset = leaves_offset + len(leaves)
+    header = _HEADER.pack(
+        MAGIC, VERSION,
+        root_offset, len(root), meta_offset, len(meta), leaves_offset, len(leaves), data_offset, len(data),
+        len(tiles), len(entries), len(stored),
+        1, COMPRESSION_GZIP, COMPRESSION_GZIP, TILE_TYPE_MVT, zooms[0], zooms[1],
+        _e7(bounds[0]), _e7(bounds[1]), _e7(bounds[2]), _e7(bounds[3]),
+        int(center[2]), _e7(center[0]), _e7(center[1]),
+    )
+
+    directory = os.path.dirname(path)
+    if directory:
+        os.makedirs(directory, exist_ok=True)
+    tmp = f"{path}.{os.getpid()}.tmp"
+    with open(tmp, "wb") as f:
+        for part in (header, root, meta, leaves, data):
+            f.write(part)
+    os.replace(tmp, path)
+    return {
+        "tiles": len(tiles),
+        "entries": len(entries),
+        "contents": len(stored),
+        "leaf_directories": bool(leaves),
+        "bytes": data_offset + len(data),
+    }
+
+
+def write_pmtiles(tile_dir, path, *, dirty=None):
+    """
+    Pack the tiles under `tile_dir` (z/x/y.pbf plus metadata.json) into the
+    PMTiles archive `path`; returns stats. Tiles are gzip-compressed unless
+    they already are. The file is written atomically.
+
+    With `dirty` ({zoom: [(x, y), ...]}, see plan_tile_changes) the archive at
+    `path` is updated instead: the dirty tiles are taken from `tile_dir`, or
+    dropped where it has none, and every other tile is kept as it is.
+    """
+    tiles = read_tile_directory(tile_dir)
+    if dirty is None:
+        if not tiles:
+            raise ValueError(f"No tiles (z/x/y.pbf) under {tile_dir}")
+        metadata = _metadata(tile_dir)
+        zooms = [z for z, _, _ in tiles]
+        bounds = [float(v) for v in str(metadata.get("bounds", "-180,-85,180,85")).split(",")]
+        center = [float(v) for v in str(metadata.get(
+            "center", f"{(bounds[0] + bounds[2]) / 2},{(bounds[1] + bounds[3]) / 2},{min(zooms)}"
+        )).split(",")]
+        contents = {zxy_to_tileid(*zxy): _tile_content(tile_path) for zxy, tile_path in tiles.items()}
+        stats = _write_archive(path, contents, metadata, bounds, center)
+        logging.info(f"PMTiles written to {path}: {stats}")
+        return stats
+
+    base = PMTilesReader(path)
+    dirty_ids = {zxy_to_tileid(int(z), x, y) for z, xys in dirty.items() for x, y in xys}
+    contents = {tile_id: content for tile_id, content in base.tiles() if tile_id not in dirty_ids}
+    replaced = 0
+    for zxy, tile_path in tiles.items():
+        tile_id = zxy_to_tileid(*zxy)
+        if tile_id in dirty_ids:
+            contents[tile_id] = _tile_content(tile_path)
+            replaced += 1
+    h = base.header
+    bounds = [h[k] / 1e7 for k in ("min_lon_e7", "min_lat_e7", "max_lon_e7", "max_lat_e7")]
+    center = [h["center_lon_e7"] / 1e7, h["center_lat_e7"] / 1e7, h["center_zoom"]]
+    stats = _write_archive(path, contents, base.metadata, bounds, center)
+    stats.update(dirty=len(dirty_ids), replaced=replaced, dropped=len(dirty_ids) - replaced)
+    logging.info(f"PMTiles updated in {path}: {stats}")
+    return stats
+
+
+class PMTilesReader:
+    """A PMTiles archive on disk; `tile(z, x, y)` returns the stored (compressed) tile bytes or None."""
+    def __init__(self, path):
+        self.path = path
+        with open(path, "rb") as f:
+            values = _HEADER.unpack(f.read(HEADER_SIZE))
+        if values[0] != MAGIC or values[1] != VERSION:
+            raise ValueError(f"{path} is not a PMTiles v{VERSION} archive")
+        names = (
+            "root_offset", "root_length", "metadata_offset", "metadata_length", "leaves_offset", "leaves_length",
+            "data_offset", "data_length", "addressed_tiles", "tile_entries", "tile_contents",
+            "clustered", "internal_compression", "tile_compression", "tile_type", "min_zoom", "max_zoom",
+            "min_lon_e7", "min_lat_e7", "max_lon_e7", "max_lat_e7", "center_zoom", "center_lon_e7", "center_lat_e7",
+        )
+        self.header = dict(zip(names, values[2:]))
+        self._root = deserialize_directory(self._read(self.header["root_offset"], self.header["root_length"]))
+
+    def _read(self, offset, length):
+        with open(self.path, "rb") as f:
+            f.seek(offset)
+            return f.read(length)
+
+    @property
+    def metadata(self):
+        return json.loads(gzip.decompress(self._read(self.header["metadata_offset"], self.header["metadata_length"])))
+
+    def _directory(self, offset, length):
+        return deserialize_directory(self._read(self.header["leaves_offset"] + offset, length))
+
+    def tiles(self):
+        """(tile_id, stored bytes) of every tile, by tile id."""
+        pending = list(reversed(self._root))
+        while pending:
+            tile_id, offset, length, run_length = pending.pop()
+            if not run_length:
+                pending.extend(reversed(self._directory(offset, length)))
+                continue
+            content = self._read(self.header["data_offset"] + offset, length)
+            for i in range(run_length):
+                yield tile_id + i, content
+
+    def tile(self, z, x, y):
+        tile_id = zxy_to_tileid(z, x, y)
+        entries = self._root
+        while True:
+            lo, hi = 0, len(entries)
+            while lo < hi:
+                mid = (lo + hi) // 2
+                if entries[mid][0] <= tile_id:
+                    lo = mid + 1
+                else:
+                    hi = mid
+            if not lo:
+                return None
+            first, offset, length, run_length = entries[lo - 1]
+            if run_length:
+                if tile_id >= first + run_length:
+                    return None
+                return self._read(self.header["data_offset"] + offset, length)
+            entries = self._directory(offset, length)
@@ -0,0 +1,164 @@
+"""
+Per-stage instrumentation: wall time, CPU time, peak-RSS growth, row and
+vertex counts, written as a JSON report next to the GeoJSON output. With a
+memory budget, every stage is checked against it too.
+"""
+import datetime
+import json
+import logging
+import os
+import sys
+import time
+from contextlib import contextmanager
+
+import geopandas as gpd
+import pandas as pd
+import shapely
+
+try:
+    import resource
+except ImportError:  # Windows
+    resource = None
+
+
+def _peak_rss_bytes(children=False):
+    # RUSAGE_CHILDREN: the largest of the finished (pool) worker processes
+    if resource is None:
+        return None
+    peak = resource.getrusage(resource.RUSAGE_CHILDREN if children else resource.RUSAGE_SELF).ru_maxrss
+    # ru_maxrss is in bytes on macOS, in kilobytes everywhere else
+    return peak if sys.platform == "darwin" else peak * 1024
+
+
+def _frames(objs):
+    if objs is None:
+        return []
+    if isinstance(objs, (pd.DataFrame, gpd.GeoSeries)):
+        return [objs]
+    return [o for o in objs if isinstance(o, (pd.DataFrame, gpd.GeoSeries))]
+
+
+def count_rows(objs):
+    return int(sum(len(f) for f in _frames(objs)))
+
+
+def count_vertices(objs):
+    """Total coordinates over all geometry columns of the given frames."""
+    total = 0
+    for f in _frames(objs):
+        if isinstance(f, gpd.GeoSeries):
+            total += int(shapely.get_num_coordinates(f.values).sum())
+        elif isinstance(f, gpd.GeoDataFrame) and f._geometry_column_name in f.columns:
+            total += int(shapely.get_num_coordinates(f.geometry.values).sum())
+    return total
+
+
+class StageRecord:
+    """Measurements of one stage; set `outputs` inside the `with` block."""
+    def __init__(self, name, inputs=()):
+        self.name = name
+        self.inputs = inputs
+        self.outputs = None
+        self.metrics = {}
+
+
+class Profiler:
+    """
+    Collects one record per `with profiler.stage(name, inputs=...) as rec:` block.
+    Peak RSS is the process high-water mark, so `peak_rss_delta_bytes` is how
+    far a stage pushed it up (0 when an earlier stage already peaked higher).
+    `peak_rss_children_bytes` is the largest worker process so far, and
+    `peak_rss_total_bytes` the parent plus `workers` such workers at once, an
+    upper bound of the whole run (forked workers count pages they share with
+    the parent too). With `budget_bytes`, stages record whether that total went
+    over it, and the first stage that does logs a warning.
+    """
+    def __init__(self, enabled=True, budget_bytes=None, workers=1):
+        self.enabled = enabled
+        self.budget_bytes = budget_bytes
+        self.workers = max(1, int(workers))
+        self.records = []
+        self.started_at = datetime.datetime.now(datetime.timezone.utc)
+
+    @contextmanager
+    def stage(self, name, inputs=()):
+        rec = StageRecord(name, inputs)
+        if not self.enabled:
+            yield rec
+            return
+        rss0 = _peak_rss_bytes()
+        cpu0 = time.process_time()
+        t0 = time.perf_counter()
+        yield rec
+        wall = time.perf_counter() - t0
+        cpu = time.process_time() - cpu0
+        rss1 = _peak_rss_bytes()
+        children, total = self.peak_rss_total()
+        rec.metrics = {
+            "stage": name,
+            "wall_s": round(wall, 4),
+            "cpu_s": round(cpu, 4),
+            "peak_rss_bytes": rss1,
+            "peak_rss_delta_bytes": None if rss0 is None else rss1 - rss0,
+            "peak_rss_children_bytes": children,
+            "peak_rss_total_bytes": total,
+            "rows_in": count_rows(rec.inputs),
+            "rows_out": count_rows(rec.outputs),
+            "vertices_in": count_vertices(rec.inputs),
+            "vertices_out": count_vertices(rec.outputs),
+        }
+        if self.budget_bytes is not None and total is not None:
+            rec.metrics["over_budget"] = total > self.budget_bytes
+            if total > self.budget_bytes and not self.over_budget():
+                logging.warning(
+                    f"Peak RSS {total / 2**20:.0f} MiB (workers included) went over the memory budget of "
+                    f"{self.budget_bytes / 2**20:.0f} MiB in stage {name}"
+                )
+        # frames are not kept alive by the report
+        rec.inputs = rec.outputs = None
+        self.records.append(rec)
+        logging.info(
+            f"Profile {name}: {wall:.2f}s wall, {cpu:.2f}s cpu, "
+            f"rows {rec.metrics['rows_in']}->{rec.metrics['rows_out']}, "
+            f"vertices {rec.metrics['vertices_in']}->{rec.metrics['vertices_out']}"
+        )
+
+    def peak_rss_total(self):
+        """(largest worker's peak RSS, parent's peak RSS plus `workers` times that), or (None, None) where unknown."""
+        parent, children = _peak_rss_bytes(), _peak_rss_bytes(children=True)
+        if parent is None:
+            return None, None
+        return children, parent + self.workers * children
+
+    def over_budget(self):
+        """Whether a recorded stage pushed the peak RSS over the budget."""
+        return any(r.metrics.get("over_budget") for r in self.records)
+
+    def report(self):
+        stages = [r.metrics for r in self.records]
+        total = {
+            "wall_s": round(sum(s["wall_s"] for s in stages), 4),
+            "cpu_s": round(sum(s["cpu_s"] for s in stages), 4),
+            "peak_rss_bytes": _peak_rss_bytes(),
+        }
+        total["peak_rss_children_bytes"], total["peak_rss_total_bytes"] = self.peak_rss_total()
+        if self.budget_bytes is not None:
+            total["budget_bytes"] = self.budget_bytes
+            total["over_budget"] = self.over_budget()
+        return {
+            "started_at": self.started_at.isoformat(timespec="seconds"),
+            "python": sys.version.split()[0],
+            "total": total,
+            "stages": stages,
+        }
+
+    def write(self, path):
+        """Write the report as JSON (atomically, so a reader never sees half a file)."""
+        directory = os.path.dirname(path)
+        if directory:
+            os.makedirs(directory, exist_ok=True)
+        tmp = f"{path}.{os.getpid()}.tmp"
+        with open(tmp, "w", encoding="utf-8") as f:
+            json.dump(self.report(), f, indent=2)
+        os.replace(tmp, path)
+        return path
@@ -0,0 +1,294 @@
+"""
+Category raster of the classified land use with per-category summed-area
+tables, for composition queries whose cost does not depend on the number of
+features.
+
+The file (`landuse.raster`) is a fixed-size JSON header followed by two
+arrays that are memory-mapped on load:
+  - the category grid, uint8, one cell per `cell_size` metres in EPSG:2056,
+    row 0 at the south edge; 0 is "no land use", i is `categories[i - 1]`
+  - the summed-area table over blocks of `block` x `block` cells, uint32,
+    shape (len(categories), block_rows + 1, block_cols + 1)
+
+A query sums whole blocks inside the shape from the table and only looks at
+the cells of blocks on its boundary. A cell belongs to a shape when its centre
+does.
+"""
+import json
+import logging
+import os
+
+import numpy as np
+import shapely
+
+from .stages import CRS_CH
+
+MAGIC = b"LURAST01"
+HEADER_SIZE = 4096
+_POLYGON = shapely.GeometryType.POLYGON
+
+
+def _polygon_edges(geoms):
+    """Non-horizontal ring edges of all polygons, oriented bottom-up, with the index of their geometry."""
+    parts, part_geom = shapely.get_parts(geoms, return_index=True)
+    is_polygon = shapely.get_type_id(parts) == _POLYGON
+    parts, part_geom = parts[is_polygon], part_geom[is_polygon]
+    rings, ring_part = shapely.get_rings(parts, return_index=True)
+    coords, ring_of_coord = shapely.get_coordinates(rings, return_index=True)
+    same_ring = ring_of_coord[1:] == ring_of_coord[:-1]
+    a, b = coords[:-1][same_ring], coords[1:][same_ring]
+    owner = part_geom[ring_part[ring_of_coord[:-1][same_ring]]]
+    # both polygons sharing an edge must compute the same crossings, whatever
+    # direction their rings run in
+    flip = a[:, 1] > b[:, 1]
+    lo = np.where(flip[:, None], b, a)
+    hi = np.where(flip[:, None], a, b)
+    slanted = lo[:, 1] < hi[:, 1]
+    return lo[slanted], hi[slanted], owner[slanted]
+
+
+def _row_range(y, y0, cell_size):
+    # first row whose cell centre lies at or above y
+    return np.ceil((y - y0) / cell_size - 0.5).astype(np.int64)
+
+
+def _rasterize_band(lo, hi, owner, labels, n_labels, y0, x0, cell_size, row0, nrows, ncols):
+    """Label grid of rows [row0, row0 + nrows) by even-odd filling at cell centres."""
+    r0 = np.clip(_row_range(lo[:, 1], y0, cell_size), row0, row0 + nrows)
+    r1 = np.clip(_row_range(hi[:, 1], y0, cell_size), row0, row0 + nrows)
+    n = r1 - r0
+    grid = np.zeros((nrows, ncols), dtype=np.uint8)
+    if not n.sum():
+        return grid, 0
+    edge = np.repeat(np.arange(len(n)), n)
+    row = np.repeat(r0, n) + np.arange(n.sum()) - np.repeat(np.cumsum(n) - n, n)
+    yc = y0 + (row + 0.5) * cell_size
+    t = (yc - lo[edge, 1]) / (hi[edge, 1] - lo[edge, 1])
+    x = lo[edge, 0] + t * (hi[edge, 0] - lo[edge, 0])
+    geom = owner[edge]
+
+    # crossings of one geometry on one row pair up into spans
+    order = np.lexsort((x, geom, row))
+    row, geom, x = row[order], geom[order], x[order]
+    if len(row) % 2 or np.any(row[0::2] != row[1::2]) or np.any(geom[0::2] != geom[1::2]):
+        raise ValueError("Unclosed rings: row crossings do not pair up")
+    row, geom = row[0::2] - row0, geom[0::2]
+    c0 = np.clip(_row_range(x[0::2], x0, cell_size), 0, ncols)
+    c1 = np.clip(_row_range(x[1::2], x0, cell_size), 0, ncols)
+    filled = c1 > c0
+    row, geom, c0, c1 = row[filled], geom[filled], c0[filled], c1[filled]
+    label = labels[geom]
+
+    # one coverage mask per label; on overlaps the lower label wins
+    width = ncols + 1
+    covered = np.zeros((nrows, ncols), dtype=np.uint8)
+    for lab in range(n_labels, 0, -1):
+        sel = label == lab
+        if not sel.any():
+            continue
+        diff = (np.bincount(row[sel] * width + c0[sel], minlength=nrows * width)
+                - np.bincount(row[sel] * width + c1[sel], minlength=nrows * width))
+        mask = np.cumsum(diff.reshape(nrows, width), axis=1)[:, :ncols] > 0
+        grid[mask] = lab
+        covered += mask
+    return grid, int((covered > 1).sum())
+
+
+def _grid_extent(bounds, cell_size, block):
+    """Origin and shape of a grid covering `bounds`, snapped to whole cells and blocks."""
+    minx, miny, maxx, maxy = bounds
+    x0 = np.floor(minx / cell_size) * cell_size
+    y0 = np.floor(miny / cell_size) * cell_size
+    step = block * cell_size
+    ncols = int(np.ceil((maxx - x0) / step)) * block
+    nrows = int(np.ceil((maxy - y0) / step)) * block
+    return float(x0), float(y0), nrows, ncols
+
+
+def write_category_raster(gdf, categories, path, *, category_names, cell_size=2.0, block=16, band_blocks=16):
+    """
+    Rasterize `gdf` (EPSG:2056) into `path`. `categories` is aligned with `gdf`
+    (see nutzung_categories); `category_names` fixes the label order.
+    The grid is written band by band, so memory stays at a few bands.
+    """
+    gdf = gdf.to_crs(CRS_CH) if gdf.crs is not None and gdf.crs.to_epsg() != CRS_CH else gdf
+    category_names = list(category_names)
+    code = {name: i + 1 for i, name in enumerate(category_names)}
+    labels = np.array([code.get(c, 0) for c in categories], dtype=np.uint8)
+    x0, y0, nrows, ncols = _grid_extent(gdf.total_bounds, cell_size, block)
+    lo, hi, owner = _polygon_edges(gdf.geometry.values)
+    edge_r0 = _row_range(lo[:, 1], y0, cell_size)
+    edge_r1 = _row_range(hi[:, 1], y0, cell_size)
+
+    n_labels = len(category_names)
+    block_rows, block_cols = nrows // block, ncols // block
+    counts = np.zeros((n_labels + 1, block_rows, block_cols), dtype=np.int64)
+    grid_offset = HEADER_SIZE
+    sat_offset = grid_offset + nrows * ncols
+    header = {
+        "crs": f"EPSG:{CRS_CH}",
+        "cell_size": cell_size,
+        "origin": [x0, y0],
+        "shape": [nrows, ncols],
+        "block": block,
+        "categories": category_names,
+        "grid_offset": grid_offset,
+        "sat_offset": sat_offset,
+    }
+    encoded = MAGIC + json.dumps(header).encode("utf-8")
+    if len(encoded) > HEADER_SIZE:
+        raise ValueError("Raster header does not fit")
+
+    directory = os.path.dirname(path)
+    if directory:
+        os.makedirs(directory, exist_ok=True)
+    tmp = f"{path}.{os.getpid()}.tmp"
+    overlaps = 0
+    band_rows = band_blocks * block
+    with open(tmp, "wb") as f:
+        f.write(encoded.ljust(HEADER_SIZE, b" "))
+        for row0 in range(0, nrows, band_rows):
+            n = min(band_rows, nrows - row0)
+            in_band = (edge_r0 < row0 + n) & (edge_r1 > row0)
+            grid, band_overlaps = _rasterize_band(
+                lo[in_band], hi[in_band], owner[in_band], labels, n_labels, y0, x0, cell_size, row0, n, ncols,
+            )
+            overlaps += band_overlaps
+            f.write(grid.tobytes())
+            # cells per label and block of this band
+            block_id = (np.arange(n)[:, None] // block) * block_cols + np.arange(ncols)[None, :] // block
+            per_block = np.bincount((block_id * (n_labels + 1) + grid).ravel(), minlength=(n // block) * block_cols * (n_labels + 1))
+            counts[:, row0 // block:(row0 + n) // block, :] = per_block.reshape(n // block, block_cols, n_labels + 1).transpose(2, 0, 1)
+        sat = np.zeros((n_labels, block_rows + 1, block_cols + 1), dtype=np.uint32)
+        sat[:, 1:, 1:] = counts[1:].cumsum(axis=1).cumsum(axis=2)
+        f.write(sat.astype("<u4").tobytes())
+    os.replace(tmp, path)
+    if overlaps:
+        logging.warning(f"Category raster: {overlaps} cells covered by more than one feature")
+    logging.info(f"Category raster written to {path}: {nrows}x{ncols} cells of {cell_size} m, {os.path.getsize(path) / 1e6:.1f} MB")
+    return path
+
+
+class CategoryRaster:
+    """
+    A category raster read from disk (memory-mapped by default). Coordinates
+    are EPSG:2056 metres; `composition_circle` / `composition` answer like
+    getLanduseSizes.js: {"sizes": {category: {"m": m2, "p": percent}}, "sumSizes": m2}.
+    """
+    def __init__(self, path, mmap=True):
+        with open(path, "rb") as f:
+            head = f.read(HEADER_SIZE)
+        if not head.startswith(MAGIC):
+            raise ValueError(f"{path} is not a category raster")
+        meta = json.loads(head[len(MAGIC):].decode("utf-8").rstrip())
+        self.path = path
+        self.cell_size = float(meta["cell_size"])
+        self.x0, self.y0 = meta["origin"]
+        self.nrows, self.ncols = meta["shape"]
+        self.block = int(meta["block"])
+        self.categories = list(meta["categories"])
+        block_shape = (len(self.categories), self.nrows // self.block + 1, self.ncols // self.block + 1)
+        if mmap:
+            self.grid = np.memmap(path, dtype=np.uint8, mode="r", offset=meta["grid_offset"], shape=(self.nrows, self.ncols))
+            self.sat = np.memmap(path, dtype="<u4", mode="r", offset=meta["sat_offset"], shape=block_shape)
+        else:
+            with open(path, "rb") as f:
+                f.seek(meta["grid_offset"])
+                self.grid = np.fromfile(f, dtype=np.uint8, count=self.nrows * self.ncols).reshape(self.nrows, self.ncols)
+                self.sat = np.fromfile(f, dtype="<u4", count=int(np.prod(block_shape))).reshape(block_shape)
+
+    # ---------------------------------------------------------------- blocks
+
+    def _block_window(self, minx, miny, maxx, maxy):
+        step = self.block * self.cell_size
+        bx0 = max(int(np.floor((minx - self.x0) / step)), 0)
+        by0 = max(int(np.floor((miny - self.y0) / step)), 0)
+        bx1 = min(int(np.floor((maxx - self.x0) / step)) + 1, self.ncols // self.block)
+        by1 = min(int(np.floor((maxy - self.y0) / step)) + 1, self.nrows // self.block)
+        return bx0, by0, bx1, by1
+
+    def _centre_rects(self, bx, by):
+        """Bounds of the cell centres of blocks (bx, by)."""
+        step, half = self.block * self.cell_size, 0.5 * self.cell_size
+        xmin = self.x0 + bx * step + half
+        ymin = self.y0 + by * step + half
+        return xmin, ymin, xmin + step - self.cell_size, ymin + step - self.cell_size
+
+    def _count(self, window, inside, boundary, contains_xy):
+        """Cells per category: whole `inside` blocks from the table, `boundary` blocks cell by cell."""
+        bx0, by0, bx1, by1 = window
+        counts = np.zeros(len(self.categories), dtype=np.int64)
+
+        # runs of inside blocks along each block row are rectangles of the table
+        edges = np.diff(np.pad(inside, ((0, 0), (1, 1))).astype(np.int8), axis=1)
+        run_row, run_start = np.nonzero(edges == 1)
+        _, run_end = np.nonzero(edges == -1)
+        if len(run_row):
+            r, j0, j1 = run_row + by0, run_start + bx0, run_end + bx0
+            s = self.sat
+            counts += (s[:, r + 1, j1].astype(np.int64) - s[:, r, j1] - s[:, r + 1, j0] + s[:, r, j0]).sum(axis=1)
+
+        by, bx = np.nonzero(boundary)
+        if len(by):
+            offsets = np.arange(self.block)
+            rows = (by + by0)[:, None] * self.block + offsets
+            cols = (bx + bx0)[:, None] * self.block + offsets
+            cells = self.grid[rows[:, :, None], cols[:, None, :]]
+            xc = self.x0 + (cols[:, None, :] + 0.5) * self.cell_size
+            yc = self.y0 + (rows[:, :, None] + 0.5) * self.cell_size
+            member = contains_xy(np.broadcast_to(xc, cells.shape), np.broadcast_to(yc, cells.shape))
+            counts += np.bincount(cells[member], minlength=len(self.categories) + 1)[1:]
+        return counts
+
+    # --------------------------------------------------------------- queries
+
+    def counts_circle(self, x, y, radius):
+        """Cells per category whose centre lies within `radius` metres of (x, y)."""
+        window = self._block_window(x - radius, y - radius, x + radius, y + radius)
+        bx0, by0, bx1, by1 = window
+        if bx1 <= bx0 or by1 <= by0:
+            return np.zeros(len(self.categories), dtype=np.int64)
+        by, bx = np.mgrid[by0:by1, bx0:bx1]
+        xmin, ymin, xmax, ymax = self._centre_rects(bx, by)
+        r2 = radius * radius
+        # farthest and nearest point of each block's centre rectangle
+        far = np.maximum(np.abs(xmin - x), np.abs(xmax - x)) ** 2 + np.maximum(np.abs(ymin - y), np.abs(ymax - y)) ** 2
+        near = (np.clip(x, xmin, xmax) - x) ** 2 + (np.clip(y, ymin, ymax) - y) ** 2
+        inside = far <= r2
+        boundary = ~inside & (near <= r2)
+        return self._count(window, inside, boundary, lambda px, py: (px - x) ** 2 + (py - y) ** 2 <= r2)
+
+    def counts_polygon(self, geom):
+        """Cells per category whose centre lies in `geom` (EPSG:2056)."""
+        window = self._block_window(*shapely.bounds(geom))
+        bx0, by0, bx1, by1 = window
+        if bx1 <= bx0 or by1 <= by0:
+            return np.zeros(len(self.categories), dtype=np.int64)
+        by, bx = np.mgrid[by0:by1, bx0:bx1]
+        boxes = shapely.box(*self._centre_rects(bx, by))
+        shapely.prepare(geom)
+        inside = shapely.contains(geom, boxes)
+        boundary = ~inside & shapely.intersects(geom, boxes)
+        return self._count(window, inside, boundary, lambda px, py: shapely.contains_xy(geom, px, py))
+
+    def _sizes(self, counts):
+        area = counts * self.cell_size ** 2
+        total = float(area.sum())
+        sizes = {
+            name: {"m": float(m), "p": float(m) / total * 100}
+            for name, m in zip(self.categories, area) if m > 0
+        }
+        return {"sizes": sizes, "sumSizes": total}
+
+    def composition_circle(self, x, y, radius):
+        """Land-use composition within `radius` metres of (x, y)."""
+        return self._sizes(self.counts_circle(x, y, radius))
+
+    def composition(self, geom):
+        """Land-use composition inside a polygon (EPSG:2056)."""
+        return self._sizes(self.counts_polygon(geom))
+
+
+def load_category_raster(path, mmap=True):
+    """Open a file written by write_category_raster."""
+    return CategoryRaster(path, mmap=mmap)
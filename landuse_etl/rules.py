@@ -0,0 +1,98 @@
+"""
+Rule-based derivation of `nutzung`, its category and its colours.
+
+The rules live in src/lib/nutzungRules.json, next to colors.json (see
+stages.load_rules). They are listed in precedence order: every rule overrides
+the rules before it on the rows it applies to. A rule takes its value from a
+`column` of the features or from a POI layer (`poi`, see POI_LAYERS) and
+applies where that value is present, every `where` condition
+({column: value or [values]}) holds and the columns in `present` are not
+missing. The value is rewritten by, in this order:
+  - `integer`: numbers are written without decimals, strings are stripped
+  - `replace`: [[old, new], ...] substring replacements
+  - `lookup`: {value: replacement}, values not listed are kept
+  - `template`: a format string with `{value}`
+
+Rules run on integer codes. Each source column is factorized once, and the
+rewrites only touch its distinct values. `nutzung`, the colors.json category
+and the colour of every palette then come from the winning code by array
+lookups.
+"""
+import numpy as np
+import pandas as pd
+
+# column of the label a POI layer assigned to a row
+POI_COLUMN = "_poi_{}"
+
+
+class NutzungRules:
+    """
+    The rules of `rules` (see stages.load_rules) with the colours of `color_config`.
+
+        engine = NutzungRules(load_rules(), load_color_config())
+        columns = engine.apply(gdf)   # nutzung, category, color, color_<season>
+    """
+    def __init__(self, rules, color_config):
+        self.rules = list(rules["rules"])
+        self.landuse_mapping = color_config.get("landuseMapping", {})
+        self.palettes = color_config["palettes"]
+
+    @staticmethod
+    def format_value(value, rule):
+        """`value` rewritten by `rule` (integer, replace, lookup, template)."""
+        if rule.get("integer"):
+            value = str(int(value)) if isinstance(value, (int, float, np.integer, np.floating)) else str(value).strip()
+        else:
+            value = str(value)
+        for old, new in rule.get("replace", ()):
+            value = value.replace(old, new)
+        value = rule.get("lookup", {}).get(value, value)
+        return rule.get("template", "{value}").format(value=value)
+
+    def _source(self, frame, rule):
+        column = POI_COLUMN.format(rule["poi"]) if "poi" in rule else rule["column"]
+        return frame[column] if column in frame.columns else None
+
+    def _where(self, frame, rule):
+        mask = np.ones(len(frame), dtype=bool)
+        for column, value in rule.get("where", {}).items():
+            values = value if isinstance(value, list) else [value]
+            mask &= frame[column].isin(values).to_numpy()
+        for column in rule.get("present", ()):
+            mask &= frame[column].notna().to_numpy()
+        return mask
+
+    def nutzung_codes(self, frame):
+        """(code per row into the vocabulary, -1 where no rule applies; vocabulary of nutzung values)."""
+        vocabulary, index = [], {}
+        winner = np.full(len(frame), -1, dtype=np.int32)
+        for rule in self.rules:
+            source = self._source(frame, rule)
+            if source is None:
+                continue
+            codes, uniques = pd.factorize(source)
+            labels = np.empty(len(uniques), dtype=np.int32)
+            for i, value in enumerate(uniques):
+                label = self.format_value(value, rule)
+                if label not in index:
+                    index[label] = len(vocabulary)
+                    vocabulary.append(label)
+                labels[i] = index[label]
+            applies = (codes >= 0) & self._where(frame, rule)
+            winner[applies] = labels[codes[applies]]
+        return winner, vocabulary
+
+    def apply(self, frame):
+        """`nutzung`, its `category`, `color` (the "always" palette) and `color_<season>` for every other palette, aligned with `frame`."""
+        winner, vocabulary = self.nutzung_codes(frame)
+        # one extra slot at the end for rows without nutzung (code -1)
+        categories = [self.landuse_mapping.get(label.strip(), "other") for label in vocabulary] + ["other"]
+        columns = {
+            "nutzung": np.array(vocabulary + [None], dtype=object)[winner],
+            "category": np.array(categories, dtype=object)[winner],
+        }
+        # "always" first, as `color`
+        for season, palette in sorted(self.palettes.items(), key=lambda item: item[0] != "always"):
+            colors = [palette.get(category, "#ffffff") for category in categories]
+            columns["color" if season == "always" else f"color_{season}"] = np.array(colors, dtype=object)[winner]
+        return pd.DataFrame(columns, index=frame.index)
@@ -0,0 +1,483 @@
+"""
+The processing steps of the land-use ETL as plain functions. Each takes the
+frames it needs and returns new ones; expensive steps run through a StageCache.
+"""
+import json
+import logging
+import os
+
+import geopandas as gpd
+import numpy as np
+import pandas as pd
+import shapely
+
+from .dataset import in_crs
+from .joins import majority, weighted_pairs
+from .normalize import GRID_SIZE_M, normalize_geometries
+from .partition import PART_ROWS, map_chunks, map_partitions
+from .poi import BuildingIndex
+from .rules import POI_COLUMN, NutzungRules
+from .wfs import load_data_from_wfs
+
+CRS_CH = 2056
+
+REPO_ROOT = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+COLORS_PATH = os.path.join(REPO_ROOT, "src", "lib", "colors.json")
+RULES_PATH = os.path.join(REPO_ROOT, "src", "lib", "nutzungRules.json")
+
+TARGET_BB = "befestigt.uebrige_befestigte.uebrige_befestigte"
+BUILDING_BB = "Gebaeude.Gebaeude"
+
+BODENBEDECKUNG_PREFIX = "ms:BS_Bodenbedeckungen"
+GEBAEUDEKATEGORIE_LAYERS = ["DM_Gebaeudeinformationen_DatenmarktGebaeudekategorie"]
+OEFFENTLICHER_RAUM_LAYERS = ["OR_OeffentlicherRaum_Allmend", "OR_OeffentlicherRaum_Noerg"]
+KULTUR_LAYERS = ["BI_KulturUnterhaltung"]
+
+# the attributes read of each WFS layer, the only ones requested (propertyName);
+# the geometry always comes along. Bodenbedeckung is requested in full unless
+# the caller narrows it: the "full" export carries its WFS attributes.
+GEBAEUDEKATEGORIE_PROPERTIES = ("gebaeudekategorieid",)
+OEFFENTLICHER_RAUM_PROPERTIES = ()
+KULTUR_PROPERTIES = ("bi_subkategorie",)
+SCHULEN_PROPERTIES = {"ms:SC": ("sc_schultyp",), "ms:SO": ("so_schultyp",)}
+# columns of the Bodenbedeckung features the pipeline adds itself, never requested
+ATTACHED_COLUMNS = ("laufnr", "gebaeudekategorieid", "oeffentlicher Raum", "oeffentlicher_raum_pct")
+
+KULTUR_MAX_DISTANCE_M = 30.0
+SCHULEN_MAX_DISTANCE_M = 0.0
+
+# POI layers that override the nutzung of the buildings they are assigned to
+# ("Gebäude - <label>"), in precedence order: a later layer wins, so schools
+# take precedence over Kultur. `dist_col` keeps the distance for QA.
+POI_LAYERS = {
+    "kultur": {"label_col": "bi_subkategorie", "max_distance_m": KULTUR_MAX_DISTANCE_M, "dist_col": "kultur_dist_m"},
+    "schulen": {"label_col": "schultyp", "max_distance_m": SCHULEN_MAX_DISTANCE_M, "dist_col": "schule_dist_m"},
+}
+
+# percent area threshold to call something "öffentlicher Raum"
+PCT_THRESHOLD = 50
+
+
+# ---------------------------------------------------------------- load
+
+def load_bodenbedeckung(url_wfs, http_cache, stage_cache, source_token, *, properties=None, bbox=None):
+    """
+    All Bodenbedeckung layers with a run-local running number `laufnr`; only
+    the attributes in `properties` (None: all of them) of the features
+    intersecting `bbox` (EPSG:2056, None: the whole canton).
+
+    Checkpointed only under an explicit `source_token`: without one every run
+    asks the WFS, and the HttpCache revalidates what it has on disk.
+    """
+    def _load_bodenbedeckung():
+        gdf = load_data_from_wfs(url_wfs, prefix=BODENBEDECKUNG_PREFIX, cache=http_cache, properties=properties, bbox=bbox)
+        return gdf.reset_index(drop=True).assign(laufnr=lambda df: df.index + 1)
+
+    if source_token is None:
+        return _load_bodenbedeckung()
+    return stage_cache.run(
+        "gdf_bodenbedeckung", _load_bodenbedeckung,
+        params={
+            "url": url_wfs, "prefix": BODENBEDECKUNG_PREFIX, "source": source_token,
+            "properties": properties, "bbox": bbox,
+        },
+    )
+
+
+def load_gebaeudekategorie(url_wfs, http_cache, *, bbox=None):
+    return load_data_from_wfs(
+        url_wfs, shapes_to_load=GEBAEUDEKATEGORIE_LAYERS, cache=http_cache, properties=GEBAEUDEKATEGORIE_PROPERTIES, bbox=bbox,
+    )
+
+
+def load_oeffentlicher_raum(url_wfs, http_cache, *, bbox=None):
+    return load_data_from_wfs(
+        url_wfs, shapes_to_load=OEFFENTLICHER_RAUM_LAYERS, cache=http_cache, properties=OEFFENTLICHER_RAUM_PROPERTIES, bbox=bbox,
+    )
+
+
+def load_kultur(url_wfs, http_cache, *, bbox=None):
+    return load_data_from_wfs(url_wfs, shapes_to_load=KULTUR_LAYERS, cache=http_cache, properties=KULTUR_PROPERTIES, bbox=bbox)
+
+
+def load_schulstandorte(url_wfs, http_cache, *, bbox=None):
+    """School locations of Basel (SC) and Riehen/Bettingen (SO) as points with a unified `schultyp`."""
+    gdf_schulstandorte_basel = load_data_from_wfs(
+        url_wfs, prefix="ms:SC", cache=http_cache, properties=SCHULEN_PROPERTIES["ms:SC"], bbox=bbox,
+    )
+    gdf_schulstandorte_riehen_bettingen = load_data_from_wfs(
+        url_wfs, prefix="ms:SO", cache=http_cache, properties=SCHULEN_PROPERTIES["ms:SO"], bbox=bbox,
+    )
+
+    def _unwrap(x):
+        return x[0] if isinstance(x, tuple) else x
+
+    gdf_b = in_crs(_unwrap(gdf_schulstandorte_basel), CRS_CH).copy()
+    gdf_rb = in_crs(_unwrap(gdf_schulstandorte_riehen_bettingen), CRS_CH).copy()
+
+    # Basel: centroid for non-point geometries
+    non_point = ~gdf_b.geometry.geom_type.isin(["Point", "MultiPoint"])
+    if non_point.any():
+        gdf_b.loc[non_point, "geometry"] = gdf_b.loc[non_point, "geometry"].centroid
+
+    # Build unified 'schultyp'
+    if "sc_schultyp" not in gdf_b.columns:
+        raise KeyError("Expected column 'sc_schultyp' in Basel dataset.")
+    if "so_schultyp" not in gdf_rb.columns:
+        raise KeyError("Expected column 'so_schultyp' in Riehen/Bettingen dataset.")
+
+    gdf_b["schultyp"]  = gdf_b["sc_schultyp"]
+    gdf_rb["schultyp"] = gdf_rb["so_schultyp"]
+
+    basel_pts = gdf_b[["schultyp", "geometry"]].copy()
+    rb_pts    = gdf_rb[["schultyp", "geometry"]].copy()
+
+    gdf_schulstandorte = gpd.GeoDataFrame(
+        pd.concat([basel_pts, rb_pts], ignore_index=True),
+        crs=CRS_CH
+    )
+
+    # Clean up (optional)
+    return gdf_schulstandorte[
+        gdf_schulstandorte.geometry.notna() & gdf_schulstandorte["schultyp"].notna()
+        ].reset_index(drop=True)
+
+
+# ---------------------------------------------------------------- normalization
+
+def normalize_layer(name, gdf, stage_cache, *, grid_size=GRID_SIZE_M):
+    """`gdf` repaired and snapped to `grid_size` (see normalize_geometries); returns (gdf, repairs)."""
+    def _normalize():
+        normalized, repairs = normalize_geometries(gdf, grid_size=grid_size)
+        return normalized.assign(_repair=repairs)
+
+    normalized = stage_cache.run(
+        f"normalized_{name}", _normalize,
+        inputs=(gdf, normalize_geometries),
+        params={"grid_size": grid_size},
+    )
+    return normalized.drop(columns="_repair"), normalized["_repair"].rename("repair")
+
+
+# ---------------------------------------------------------------- Gebäudekategorie
+
+def select_buildings(gdf_bodenbedeckung):
+    return gdf_bodenbedeckung[gdf_bodenbedeckung["bs_art_txt"] == BUILDING_BB].copy()
+
+
+def join_building_categories(buildings, gdf_gebaeudekategorie, stage_cache, *, workers=1, part_rows=PART_ROWS):
+    """
+    Gebäudekategorie ids intersecting each building (see weighted_pairs); where
+    a building touches more than one id, `pct` is the share of the building
+    each Gebäudekategorie polygon covers. Runs over spatial parts of the buildings.
+    """
+    gk = gdf_gebaeudekategorie[["gebaeudekategorieid", "geometry"]]
+
+    def _join():
+        parts = map_partitions(
+            weighted_pairs, buildings, (gk,), workers=workers, part_rows=part_rows,
+            key="laufnr", value="gebaeudekategorieid", by="feature",
+        )
+        joined = pd.concat(parts, ignore_index=True)
+        # back to building order
+        position = pd.Series(np.arange(len(buildings)), index=buildings["laufnr"].to_numpy())
+        order = np.argsort(position.loc[joined["laufnr"]].to_numpy(), kind="stable")
+        return joined.iloc[order].reset_index(drop=True)
+
+    return stage_cache.run("joined", _join, inputs=(buildings, gk, weighted_pairs))
+
+
+def find_ambiguous(joined):
+    """Buildings mapped to >1 distinct category; returns (ids, report frame)."""
+    required = {"laufnr", "gebaeudekategorieid"}
+    missing = required - set(joined.columns)
+    if missing:
+        logging.info(f"'joined' is missing required columns: {missing}")
+
+    per_bldg_ncats = joined.groupby("laufnr")["gebaeudekategorieid"].nunique(dropna=True)
+    ambiguous_ids = per_bldg_ncats[per_bldg_ncats > 1].index.tolist()
+
+    logging.info("Found ambiguous ids (building mapped to >1 distinct category)")
+    ambiguous_buildings = (
+        joined.loc[joined["laufnr"].isin(ambiguous_ids), ["laufnr", "gebaeudekategorieid"]]
+        .drop_duplicates()
+        .sort_values(["laufnr", "gebaeudekategorieid"])
+        .reset_index(drop=True)
+    )
+    return ambiguous_ids, ambiguous_buildings
+
+
+def resolve_ambiguous(joined):
+    """Pick, per ambiguous building, the category with the largest overlap; returns (amb_best, stats)."""
+    best, stats = majority(joined, "laufnr", "gebaeudekategorieid")
+    amb_best = (
+        best.loc[best["ambiguous"], ["laufnr", "gebaeudekategorieid", "pct"]]
+        .rename(columns={"pct": "pct_bldg"})
+        .reset_index(drop=True)
+    )
+    amb_stats = {
+        "ambiguous_buildings": stats["ambiguous"],
+        "with_overlay_match": stats["resolved"],
+        "no_overlay_match": stats["unresolved"],
+        "pct_bldg_summary_pct": stats["pct_summary"],
+    }
+    return amb_best, amb_stats
+
+
+def assign_building_categories(bb, joined, ambiguous_ids, amb_best):
+    """Attach `gebaeudekategorieid` to every feature of `bb`; returns (frame, stats)."""
+    # Unambiguous mapping straight from the spatial join
+    mapping_unamb = (
+        joined.loc[~joined["laufnr"].isin(ambiguous_ids), ["laufnr", "gebaeudekategorieid"]]
+        .dropna(subset=["gebaeudekategorieid"])
+        .drop_duplicates(subset=["laufnr"])
+    )
+    # Ambiguous resolved by largest intersection
+    mapping_amb = amb_best.loc[:, ["laufnr", "gebaeudekategorieid"]]
+
+    # (an empty side must not decide the dtype of gebaeudekategorieid)
+    mapping_final = (
+        pd.concat([m for m in (mapping_unamb, mapping_amb) if len(m)] or [mapping_unamb], ignore_index=True)
+        .drop_duplicates(subset=["laufnr"], keep="last")
+    )
+
+    gdf_bodenbedeckung_cat = bb.merge(mapping_final, on="laufnr", how="left")
+
+    stats_final = {
+        "joined_buildings_total": int(joined["laufnr"].nunique()),
+        "mapped_unambiguous": int(mapping_unamb["laufnr"].nunique()),
+        "mapped_ambiguous": int(mapping_amb["laufnr"].nunique()),
+        "mapped_total": int(mapping_final["laufnr"].nunique()),
+    }
+    return gdf_bodenbedeckung_cat, stats_final
+
+
+# ---------------------------------------------------------------- öffentlicher Raum
+
+def _covered_chunk(targets, publics):
+    """
+    Area of each of `targets` covered by the union of `publics`, both arrays
+    of geometries. Pieces are intersected pair by pair; only targets whose
+    candidate public shapes overlap each other have their pieces unioned.
+    """
+    covered = np.zeros(len(targets))
+    if not len(targets) or not len(publics):
+        return covered
+    tree = shapely.STRtree(publics)
+    t_idx, p_idx = tree.query(targets, predicate="intersects")
+    if not len(t_idx):
+        return covered
+    pieces = shapely.intersection(targets[t_idx], publics[p_idx])
+    piece_area = shapely.area(pieces)
+
+    # public shapes whose interiors overlap another public shape
+    a, b = tree.query(publics)
+    pair = a < b
+    a, b = a[pair], b[pair]
+    overlapping = np.zeros(len(publics), dtype=bool)
+    if len(a):
+        hit = shapely.relate_pattern(publics[a], publics[b], "T********")
+        overlapping[a[hit]] = overlapping[b[hit]] = True
+
+    n_overlapping = np.bincount(t_idx, weights=overlapping[p_idx], minlength=len(targets))
+    needs_union = n_overlapping[t_idx] >= 2
+    covered += np.bincount(t_idx[~needs_union], weights=piece_area[~needs_union], minlength=len(targets))
+    if needs_union.any():
+        t_u, pieces_u = t_idx[needs_union], pieces[needs_union]
+        starts = np.flatnonzero(np.r_[True, t_u[1:] != t_u[:-1]])
+        for start, end in zip(starts, np.r_[starts[1:], len(t_u)]):
+            covered[t_u[start]] += shapely.area(shapely.union_all(pieces_u[start:end]))
+    return covered
+
+
+def _covered_part(targets, publics):
+    return pd.Series(_covered_chunk(targets.values, publics.values), index=targets.index)
+
+
+def covered_areas(targets, publics, *, workers=1, part_rows=PART_ROWS):
+    """
+    `_covered_chunk` over spatial parts of `targets` (GeoSeries), each with
+    only the public shapes near it. Returns areas aligned with `targets`.
+    """
+    if targets.empty or publics.empty:
+        return np.zeros(len(targets))
+    targets = targets.reset_index(drop=True)
+    parts = map_partitions(_covered_part, targets, (publics,), workers=workers, part_rows=part_rows)
+    return pd.concat(parts).sort_index().to_numpy()
+
+
+def public_coverage(bb, gdf_oeffentlicher_raum, stage_cache, *, mode="full", pct_threshold=PCT_THRESHOLD, workers=1, part_rows=PART_ROWS):
+    """
+    Share of each "uebrige befestigte" feature covered by public space; returns
+    (coverage, stats). `mode="incremental"` limits the public shapes to those
+    near the features in `bb`; `workers` > 1 computes the coverage in parallel.
+    Both frames must hold valid geometries (see normalize_layer).
+    """
+    def _public_coverage():
+        oraw = gdf_oeffentlicher_raum.copy()
+
+        # target subset
+        tgt = bb[bb["bs_art_txt"] == TARGET_BB].copy()
+
+        # on incremental runs only public shapes whose bbox touches a target matter
+        if mode == "incremental":
+            oraw = oraw.iloc[np.unique(oraw.sindex.query(tgt.geometry.values)[1])]
+
+        # areas
+        tgt["area"] = tgt.geometry.area
+
+        # covered area per target, pair by pair: no city-wide union of the public shapes
+        tgt["public_area"] = covered_areas(tgt.geometry, oraw.geometry, workers=workers, part_rows=part_rows)
+        coverage = tgt.groupby("laufnr", as_index=False)["public_area"].sum()
+
+        coverage = coverage.merge(tgt[["laufnr", "area"]], on="laufnr", how="right")
+        coverage["public_area"] = coverage["public_area"].fillna(0.0)
+        coverage["oeffentlicher_raum_pct"] = np.where(
+            coverage["area"] > 0,
+            coverage["public_area"] / coverage["area"] * 100.0,
+            0.0
+        )
+
+        # labels
+        coverage["oeffentlicher Raum"] = np.where(
+            coverage["oeffentlicher_raum_pct"] >= pct_threshold,
+            "öffentlicher Raum",
+            "kein öffentlicher Raum"
+        )
+        return coverage
+
+    coverage = stage_cache.run(
+        "coverage", _public_coverage,
+        inputs=(bb, gdf_oeffentlicher_raum, covered_areas, _covered_part, _covered_chunk),
+        params={"pct_threshold": pct_threshold, "target": TARGET_BB, "mode": mode},
+    )
+
+    # quick stats
+    n_total  = int(coverage["laufnr"].nunique())
+    n_public = int((coverage["oeffentlicher Raum"] == "öffentlicher Raum").sum())
+    stats = {
+        "threshold_pct": pct_threshold,
+        "total_befestigt_uebrige": n_total,
+        "öffentlicher_Raum": {"count": n_public, "pct": round(100.0 * n_public / max(n_total, 1), 2)},
+        "kein_öffentlicher_Raum": {
+            "count": n_total - n_public,
+            "pct": round(100.0 * (n_total - n_public) / max(n_total, 1), 2),
+        },
+    }
+    return coverage, stats
+
+
+def attach_coverage(gdf_bodenbedeckung_cat, coverage):
+    cols = ["laufnr", "oeffentlicher Raum", "oeffentlicher_raum_pct"]
+    return gdf_bodenbedeckung_cat.merge(coverage[cols], on="laufnr", how="left")
+
+
+# ---------------------------------------------------------------- Kultur & Schulen
+
+def build_nearest_point_to_building_mapping(points_gdf, buildings_gdf, *, label_col, max_distance_m=0.0, crs_metric=2056):
+    """
+    Closest labelled point per building; returns (mapping at any distance,
+    mapping within `max_distance_m`, stats), where `buildings_matched` counts
+    the unbounded mapping. To assign several POI layers build the index once
+    and use map_pois, which bounds the search by the cutoff instead.
+    """
+    mapping, stats = BuildingIndex(buildings_gdf, crs=crs_metric).assign(
+        points_gdf, label_col=label_col, max_distance_m=None,
+    )
+    mapping_filtered = mapping[mapping["dist_m"] <= max_distance_m].copy() if max_distance_m is not None else mapping.copy()
+    stats["max_distance_m"] = float(max_distance_m) if max_distance_m is not None else None
+    return mapping, mapping_filtered, stats
+
+
+def map_pois(points, buildings_all, stage_cache, *, layers=POI_LAYERS):
+    """
+    {name: mapping} of the POI layers in `points` ({name: GeoDataFrame}),
+    each as configured in `layers`. The building index is built once, and
+    only when a layer's mapping is not in the stage cache.
+    """
+    index = None
+
+    def _assign(name):
+        nonlocal index
+        if index is None:
+            index = BuildingIndex(buildings_all)
+        spec = layers[name]
+        mapping, stats = index.assign(points[name], label_col=spec["label_col"], max_distance_m=spec["max_distance_m"])
+        logging.info(f"POI mapping {name}: {stats}")
+        return mapping
+
+    return {
+        name: stage_cache.run(
+            f"mapping_{name}", lambda name=name: _assign(name),
+            inputs=(points[name], buildings_all, BuildingIndex.assign, BuildingIndex.match),
+            params=layers[name],
+        )
+        for name in layers
+    }
+
+
+# ---------------------------------------------------------------- classification
+
+def load_color_config(config_path=COLORS_PATH):
+    """Load the colour configuration shared with the frontend (src/lib/colors.json)."""
+    try:
+        with open(config_path, "r", encoding="utf-8") as f:
+            color_config = json.load(f)
+        logging.info(f"Loaded color configuration from {config_path}")
+    except FileNotFoundError:
+        logging.error(f"Color configuration file not found: {config_path}")
+        raise
+    except json.JSONDecodeError as e:
+        logging.error(f"Error parsing color configuration JSON: {e}")
+        raise
+    return color_config
+
+
+def load_rules(rules_path=RULES_PATH):
+    """Load the nutzung rules (src/lib/nutzungRules.json, see NutzungRules)."""
+    with open(rules_path, "r", encoding="utf-8") as f:
+        rules = json.load(f)
+    logging.info(f"Loaded {len(rules['rules'])} nutzung rules from {rules_path}")
+    return rules
+
+
+def _classify_rows(gdf_all, poi_mappings, rules, color_config):
+    # the POI labels are matched by laufnr; the distances are kept for QA
+    gdf_nutzung = gdf_all
+    for name, spec in POI_LAYERS.items():
+        gdf_nutzung = gdf_nutzung.merge(
+            poi_mappings[name].rename(columns={spec["label_col"]: POI_COLUMN.format(name), "dist_m": spec["dist_col"]}),
+            on="laufnr",
+            how="left",
+        )
+
+    # nutzung, category and the colour of every season, by the rules in precedence order
+    derived = NutzungRules(rules, color_config).apply(gdf_nutzung)
+    gdf_nutzung = gdf_nutzung.drop(columns=[POI_COLUMN.format(name) for name in POI_LAYERS])
+    gdf_nutzung.insert(len(gdf_all.columns), "nutzung", derived["nutzung"])
+    for column in derived.columns.drop("nutzung"):
+        gdf_nutzung[column] = derived[column]
+
+    if gdf_nutzung.crs is None:
+        gdf_nutzung = gdf_nutzung.set_crs(CRS_CH)
+    return gdf_nutzung
+
+
+def classify_nutzung(gdf_all, poi_mappings, rules, color_config, stage_cache, *, workers=1, part_rows=PART_ROWS):
+    """
+    Derive `nutzung`, `category`, `color` and `color_<season>` for every
+    feature of `gdf_all` (EPSG:2056) by the nutzung `rules` (see
+    NutzungRules), in row chunks over `workers` processes; `poi_mappings`
+    holds the mapping of every layer of POI_LAYERS (see map_pois).
+    """
+    def _classify():
+        return map_chunks(
+            _classify_rows, gdf_all, workers=workers, part_rows=part_rows, ignore_index=True,
+            poi_mappings=poi_mappings, rules=rules, color_config=color_config,
+        )
+
+    return stage_cache.run(
+        "gdf_nutzung", _classify,
+        inputs=(gdf_all, *(poi_mappings[name] for name in POI_LAYERS), _classify_rows, NutzungRules.format_value, NutzungRules.nutzung_codes, NutzungRules.apply),
+        params={"rules": rules, "colors": color_config, "poi_layers": POI_LAYERS},
+    )
@@ -0,0 +1,306 @@
+"""SVG export of the classified land use."""
+import logging
+import os
+
+import geopandas as gpd
+import numpy as np
+import shapely
+from shapely.geometry import box
+
+from .stages import CRS_CH
+
+_POLYGONAL = np.array([shapely.GeometryType.POLYGON, shapely.GeometryType.MULTIPOLYGON])
+_PUNTAL = np.array([shapely.GeometryType.POINT, shapely.GeometryType.MULTIPOINT])
+
+
+def _ring_paths(coords, ring_starts, ring_counts, precision):
+    """One "M x y L x y ... Z" string per ring from transformed, rounded coordinates."""
+    fmt = f"%.{precision}f %.{precision}f"
+    move, line = f"M {fmt} ", f"L {fmt} "
+    flat = coords.ravel().tolist()
+    out = []
+    for start, n in zip(ring_starts.tolist(), ring_counts.tolist()):
+        out.append(move % (flat[2 * start], flat[2 * start + 1])
+                   + (line * (n - 1)) % tuple(flat[2 * start + 2:2 * (start + n)]) + "Z")
+    return out
+
+
+def _point_paths(coords, precision):
+    fmt = f"M %.{precision}f %.{precision}f L %.{precision}f %.{precision}f"
+    return [fmt % (x, y, x, y) for x, y in coords.tolist()]
+
+
+def _chunk_paths(geoms, transform, precision):
+    """
+    SVG path data for a chunk of geometries, one string per geometry ("" when
+    nothing is drawable). Coordinates of all rings are pulled out in one go
+    with ragged offsets and transformed with a single affine.
+    """
+    n = len(geoms)
+    pieces = [[] for _ in range(n)]
+
+    types = shapely.get_type_id(geoms)
+    poly_idx = np.flatnonzero(np.isin(types, _POLYGONAL))
+    if len(poly_idx):
+        parts, part_geom = shapely.get_parts(geoms[poly_idx], return_index=True)
+        rings, ring_part = shapely.get_rings(parts, return_index=True)
+        coords, ring_of_coord = shapely.get_coordinates(rings, return_index=True)
+        counts = np.bincount(ring_of_coord, minlength=len(rings))
+        starts = np.concatenate(([0], np.cumsum(counts)[:-1]))
+
+        # rings with fewer than 3 coordinates are dropped; a polygon whose
+        # exterior is dropped is dropped entirely
+        is_exterior = np.r_[True, ring_part[1:] != ring_part[:-1]] if len(rings) else np.zeros(0, bool)
+        keep = counts >= 3
+        bad_parts = np.unique(ring_part[is_exterior & ~keep])
+        keep &= ~np.isin(ring_part, bad_parts)
+
+        xy = transform(coords)
+        paths = _ring_paths(xy, starts[keep], counts[keep], precision)
+        owners = poly_idx[part_geom[ring_part[keep]]]
+        for owner, path in zip(owners.tolist(), paths):
+            pieces[owner].append(path)
+
+    point_idx = np.flatnonzero(np.isin(types, _PUNTAL))
+    if len(point_idx):
+        coords, owner = shapely.get_coordinates(geoms[point_idx], return_index=True)
+        for o, path in zip(point_idx[owner].tolist(), _point_paths(transform(coords), precision)):
+            pieces[o].append(path)
+
+    for t in np.unique(types[~np.isin(types, np.concatenate([_POLYGONAL, _PUNTAL])) & (types >= 0)]):
+        logging.warning(f"Unsupported geometry type: {shapely.GeometryType(t).name}")
+
+    return [" ".join(p) for p in pieces]
+
+
+def export_to_svg(gdf, output_path="landuse.svg", bounds=None, width=2000, height=None, stroke_width=0.5, stroke_color="#000000", target_crs=None, precision=2, chunk_size=10000, lod=False, tolerance_px=1.0):
+    """
+    Export GeoDataFrame to SVG with colors.
+
+    Coordinates are extracted and transformed with NumPy per chunk of
+    `chunk_size` features and the paths are streamed to the file chunk by
+    chunk; numbers are written with `precision` decimals, so the same input
+    always gives the same bytes.
+
+    Parameters:
+    -----------
+    gdf : GeoDataFrame
+        GeoDataFrame with 'color' column and geometries
+    output_path : str
+        Output SVG file path
+    bounds : tuple or None
+        (minx, miny, maxx, maxy) in CRS coordinates. If None, uses gdf.total_bounds
+    width : int
+        SVG width in pixels
+    height : int or None
+        SVG height in pixels. If None, calculated from aspect ratio
+    stroke_width : float
+        Stroke width for polygon outlines
+    stroke_color : str
+        Stroke color for polygon outlines
+    target_crs : int or None
+        Target CRS for projection (default: CRS_CH = 2056 for Swiss coordinates).
+        Use a projected CRS for correct aspect ratios.
+    precision : int
+        Decimals of the SVG pixel coordinates (default 2, i.e. 1/100 px)
+    chunk_size : int
+        Features formatted and written per chunk
+    lod : bool
+        Level-of-detail mode: only features intersecting `bounds` are drawn
+        (spatial index lookup), clipped to `bounds` and simplified to
+        `tolerance_px` output pixels with shared borders kept intact
+    tolerance_px : float
+        Simplification tolerance in output pixels (lod mode only)
+    """
+    if "color" not in gdf.columns:
+        raise ValueError("GeoDataFrame must have a 'color' column")
+
+    if gdf.empty:
+        logging.warning("GeoDataFrame is empty, creating empty SVG")
+        with open(output_path, "w") as f:
+            f.write('<?xml version="1.0" encoding="UTF-8"?>\n<svg xmlns="http://www.w3.org/2000/svg" width="{}" height="{}"/>\n'.format(width, height or width))
+        return
+
+    # Convert to target CRS for proper projection (use Swiss coordinates by default)
+    if target_crs is None:
+        target_crs = CRS_CH
+
+    # only geometries and colours are needed; no copy of the attribute table
+    geoms = gdf.geometry
+    if geoms.crs is None:
+        logging.warning("GeoDataFrame has no CRS, assuming EPSG:4326")
+        geoms = geoms.set_crs(4326)
+
+    # Convert to target CRS if different
+    if geoms.crs.to_epsg() != target_crs:
+        geoms = geoms.to_crs(target_crs)
+        logging.info(f"Converted to CRS {target_crs} for SVG export")
+
+    # Get bounds in projected CRS
+    if bounds is None:
+        bounds = geoms.total_bounds  # minx, miny, maxx, maxy
+    else:
+        # If bounds provided, they should be in the original CRS, so convert them
+        if gdf.crs is not None and gdf.crs.to_epsg() != target_crs:
+            bounds_geom = box(bounds[0], bounds[1], bounds[2], bounds[3])
+            bounds_gdf = gpd.GeoDataFrame([1], geometry=[bounds_geom], crs=gdf.crs)
+            bounds_gdf = bounds_gdf.to_crs(target_crs)
+            bounds = bounds_gdf.total_bounds
+
+    minx, miny, maxx, maxy = bounds
+
+    height, transform = _svg_transform(bounds, width, height, precision)
+
+    values = np.asarray(geoms.values)
+    colors = gdf["color"].to_numpy(dtype=object)
+    if lod:
+        tolerance = tolerance_px * (maxx - minx) / width
+        idx, values = _lod_geometries(values, geoms.sindex, box(minx, miny, maxx, maxy), tolerance)
+        colors = colors[idx]
+
+    _write_svg(output_path, values, colors, transform, width, height, stroke_width, stroke_color, precision, chunk_size)
+    logging.info(f"SVG exported to {output_path} ({width}x{height}px)")
+    return output_path
+
+
+def _svg_transform(bounds, width, height, precision):
+    """Output height (from the aspect ratio if None) and the CRS -> SVG pixel transform."""
+    minx, miny, maxx, maxy = bounds
+
+    # Calculate aspect ratio and height if not provided
+    aspect_ratio = (maxy - miny) / (maxx - minx) if (maxx - minx) > 0 else 1.0
+    if height is None:
+        height = int(width * aspect_ratio)
+
+    # Scale factors
+    scale_x = width / (maxx - minx) if (maxx - minx) > 0 else 1.0
+    scale_y = height / (maxy - miny) if (maxy - miny) > 0 else 1.0
+
+    # geographic -> SVG coordinates (flipped y axis) as one affine over an (n, 2) array;
+    # "+ 0.0" turns -0.0 into 0.0 so both print the same
+    scale = np.array([scale_x, -scale_y])
+    offset = np.array([-minx * scale_x, height + miny * scale_y])
+
+    def transform(coords):
+        return np.round(coords * scale + offset, precision) + 0.0
+
+    return height, transform
+
+
+def _write_svg(output_path, values, colors, transform, width, height, stroke_width, stroke_color, precision, chunk_size):
+    drawable = ~(shapely.is_missing(values) | shapely.is_empty(values))
+    tail = f'" stroke="{stroke_color}" stroke-width="{stroke_width}" />'
+
+    with open(output_path, "w", encoding="utf-8") as f:
+        f.write("\n".join([
+            '<?xml version="1.0" encoding="UTF-8"?>',
+            f'<svg xmlns="http://www.w3.org/2000/svg" width="{width}" height="{height}" viewBox="0 0 {width} {height}">',
+            '  <g id="landuse">'
+        ]))
+        idx = np.flatnonzero(drawable)
+        for lo in range(0, len(idx), chunk_size):
+            chunk = idx[lo:lo + chunk_size]
+            lines = [
+                f'\n    <path d="{d}" fill="{"#ffffff" if color is None or color != color else color}{tail}'
+                for d, color in zip(_chunk_paths(values[chunk], transform, precision), colors[chunk].tolist())
+                if d
+            ]
+            f.write("".join(lines))
+        f.write("\n  </g>\n</svg>")
+
+
+def _polygonal_part(geom):
+    # intersections can yield collections with slivers of lower dimension
+    polys = [g for g in shapely.get_parts(geom) if shapely.get_type_id(g) in _POLYGONAL]
+    return shapely.multipolygons(polys) if len(polys) > 1 else (polys[0] if polys else shapely.Polygon())
+
+
+def _lod_geometries(values, tree, region, tolerance, candidates=None):
+    """
+    Features of `values` intersecting `region`, clipped to it and simplified
+    with `tolerance` (CRS units). Returns (indices into `values`, geometries),
+    without features that vanish.
+
+    Polygons are simplified as a coverage, so borders shared by neighbouring
+    features stay shared and no gaps or overlaps open up between them.
+    """
+    idx = np.sort(tree.query(region, predicate="intersects") if candidates is None else candidates)
+    geoms = values[idx]
+    polygonal = np.isin(shapely.get_type_id(geoms), _POLYGONAL)
+    xmin, ymin, xmax, ymax = region.bounds
+    if region.equals(box(xmin, ymin, xmax, ymax)):
+        geoms = shapely.clip_by_rect(geoms, xmin, ymin, xmax, ymax)
+    else:
+        geoms = shapely.intersection(geoms, region)
+
+    collections = np.flatnonzero(shapely.get_type_id(geoms) == shapely.GeometryType.GEOMETRYCOLLECTION)
+    for i in collections:
+        geoms[i] = _polygonal_part(geoms[i])
+    # a polygon touching the region only along an edge or at a corner leaves
+    # a line or point, which is not drawn
+    geoms[polygonal & ~np.isin(shapely.get_type_id(geoms), _POLYGONAL)] = shapely.Polygon()
+
+    if tolerance > 0:
+        poly = np.isin(shapely.get_type_id(geoms), _POLYGONAL) & ~shapely.is_empty(geoms)
+        if poly.any():
+            if hasattr(shapely, "coverage_simplify"):
+                geoms[poly] = shapely.coverage_simplify(geoms[poly], tolerance)
+            else:  # shapely < 2.1: per-feature topology only
+                geoms[poly] = shapely.simplify(geoms[poly], tolerance, preserve_topology=True)
+
+    keep = ~(shapely.is_missing(geoms) | shapely.is_empty(geoms))
+    return idx[keep], geoms[keep]
+
+
+def export_district_svgs(gdf, districts, output_dir, *, prefix="district", width=1000, height=None, stroke_width=0, stroke_color="#000000", target_crs=None, precision=2, tolerance_px=1.0, chunk_size=10000):
+    """
+    One level-of-detail SVG per district, in a single pass over the data.
+
+    The features are projected and indexed once; one bulk index query pairs
+    every district with the features it intersects. Each file is clipped to
+    its district polygon and simplified to its own pixel size (see
+    `export_to_svg(..., lod=True)`).
+
+    Parameters:
+    -----------
+    gdf : GeoDataFrame
+        GeoDataFrame with 'color' column and geometries
+    districts : GeoDataFrame
+        District polygons with an `id` column (see districts.load_districts)
+    output_dir : str
+        Directory for the `<prefix>-<id>.svg` files
+    width, height, stroke_width, stroke_color, target_crs, precision, tolerance_px, chunk_size
+        As for export_to_svg, applied to every district
+
+    Returns the list of written paths, in the order of `districts`.
+    """
+    if "color" not in gdf.columns:
+        raise ValueError("GeoDataFrame must have a 'color' column")
+    if target_crs is None:
+        target_crs = CRS_CH
+
+    geoms = gdf.geometry
+    if geoms.crs is None:
+        logging.warning("GeoDataFrame has no CRS, assuming EPSG:4326")
+        geoms = geoms.set_crs(4326)
+    if geoms.crs.to_epsg() != target_crs:
+        geoms = geoms.to_crs(target_crs)
+    district_geoms = districts.geometry.to_crs(target_crs) if districts.crs is not None else districts.geometry
+
+    values = np.asarray(geoms.values)
+    colors = gdf["color"].to_numpy(dtype=object)
+    tree = geoms.sindex
+    d_idx, f_idx = tree.query(np.asarray(district_geoms.values), predicate="intersects")
+
+    os.makedirs(output_dir, exist_ok=True)
+    paths = []
+    for i, (district_id, region) in enumerate(zip(districts["id"].astype(str), district_geoms.values)):
+        minx, miny, maxx, maxy = region.bounds
+        h, transform = _svg_transform((minx, miny, maxx, maxy), width, height, precision)
+        tolerance = tolerance_px * (maxx - minx) / width
+        idx, clipped = _lod_geometries(values, tree, region, tolerance, candidates=f_idx[d_idx == i])
+        path = os.path.join(output_dir, f"{prefix}-{district_id}.svg")
+        _write_svg(path, clipped, colors[idx], transform, width, h, stroke_width, stroke_color, precision, chunk_size)
+        paths.append(path)
+    logging.info(f"Exported {len(paths)} district SVGs to {output_dir}")
+    return paths
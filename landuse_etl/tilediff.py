@@ -0,0 +1,174 @@
+"""
+Which vector tiles a run changed, so only those are rebuilt.
+
+Every exported feature is kept between runs as (fid, hash, bounds): `fid` is
+its stable id, the fingerprint of its Bodenbedeckung source feature (the
+running `laufnr` is not stable and is left out of the tiles), and `hash`
+covers its exported geometry and attributes. A feature version that is new or
+gone marks every tile its bounds touch at every zoom, the tile buffer
+included, as dirty. Each zoom then gets the features that reach its dirty
+tiles, for tippecanoe to rebuild just those (see write_pmtiles(dirty=...)).
+"""
+import glob
+import json
+import logging
+import math
+import os
+
+import numpy as np
+import pandas as pd
+import shapely
+
+from .export import COORD_PRECISION, write_features
+from .incremental import feature_fingerprints
+
+MIN_ZOOM = 12
+MAX_ZOOM = 17
+# tippecanoe's default tile buffer: 5 units of a 256-unit tile
+BUFFER = 5 / 256
+# above this share of changed features a full rebuild is cheaper
+FULL_SHARE = 0.25
+
+STATE_FILE = "tiles.parquet"
+# this run's state until its tiles are built (see promote_tile_state)
+PENDING_FILE = "tiles.pending.parquet"
+CHANGES_FILE = "changes.json"
+
+
+def tile_state(gdf_wgs84, fids):
+    """(fid, hash, minx, miny, maxx, maxy) per exported feature (EPSG:4326)."""
+    bounds = gdf_wgs84.geometry.bounds
+    return pd.DataFrame({
+        "fid": np.asarray(fids, dtype=np.uint64),
+        "hash": feature_fingerprints(gdf_wgs84),
+        "minx": bounds["minx"].to_numpy(),
+        "miny": bounds["miny"].to_numpy(),
+        "maxx": bounds["maxx"].to_numpy(),
+        "maxy": bounds["maxy"].to_numpy(),
+    })
+
+
+def _tile_x(lon, z):
+    return (np.asarray(lon) + 180.0) / 360.0 * (1 << z)
+
+
+def _tile_y(lat, z):
+    lat = np.radians(np.clip(lat, -85.0511, 85.0511))
+    return (1.0 - np.arcsinh(np.tan(lat)) / math.pi) / 2.0 * (1 << z)
+
+
+def tile_bounds(z, x, y, buffer=0.0):
+    """(west, south, east, north) of tile z/x/y in degrees, grown by `buffer` tiles on every side."""
+    n = 1 << z
+
+    def lon(tx):
+        return tx / n * 360.0 - 180.0
+
+    def lat(ty):
+        return math.degrees(math.atan(math.sinh(math.pi * (1 - 2 * ty / n))))
+
+    return lon(x - buffer), lat(y + 1 + buffer), lon(x + 1 + buffer), lat(y - buffer)
+
+
+def tiles_for_bounds(bounds, z, buffer=BUFFER):
+    """Set of (x, y) at zoom `z` whose buffered extent the (minx, miny, maxx, maxy) rows of `bounds` touch."""
+    bounds = np.asarray(bounds, dtype=float).reshape(-1, 4)
+    bounds = bounds[np.isfinite(bounds).all(axis=1)]
+    top = (1 << z) - 1
+    x0 = np.clip(np.floor(_tile_x(bounds[:, 0], z) - buffer), 0, top).astype(np.int64)
+    x1 = np.clip(np.floor(_tile_x(bounds[:, 2], z) + buffer), 0, top).astype(np.int64)
+    # tile rows count southwards
+    y0 = np.clip(np.floor(_tile_y(bounds[:, 3], z) - buffer), 0, top).astype(np.int64)
+    y1 = np.clip(np.floor(_tile_y(bounds[:, 1], z) + buffer), 0, top).astype(np.int64)
+    tiles = set()
+    for a, b, c, d in zip(x0, x1, y0, y1):
+        tiles.update((x, y) for x in range(a, b + 1) for y in range(c, d + 1))
+    return tiles
+
+
+def diff_tiles(previous, current, *, zooms=range(MIN_ZOOM, MAX_ZOOM + 1), buffer=BUFFER):
+    """Dirty tiles ({zoom: sorted [(x, y)]}) between two tile states, and counts of what changed."""
+    gone = previous[~previous["hash"].isin(current["hash"])]
+    new = current[~current["hash"].isin(previous["hash"])]
+    changed = pd.concat([gone, new])[["minx", "miny", "maxx", "maxy"]].to_numpy()
+    dirty = {z: sorted(tiles_for_bounds(changed, z, buffer)) for z in zooms}
+    modified = np.intersect1d(gone["fid"].to_numpy(), new["fid"].to_numpy())
+    stats = {
+        "added": int((~new["fid"].isin(previous["fid"])).sum()),
+        "removed": int((~gone["fid"].isin(current["fid"])).sum()),
+        "modified": int(len(modified)),
+        "dirty_tiles": {str(z): len(tiles) for z, tiles in dirty.items()},
+    }
+    return {z: tiles for z, tiles in dirty.items() if tiles}, stats
+
+
+def _write_changes(out_dir, changes):
+    tmp = os.path.join(out_dir, f"{CHANGES_FILE}.{os.getpid()}.tmp")
+    with open(tmp, "w", encoding="utf-8") as f:
+        json.dump(changes, f, indent=1)
+    os.replace(tmp, os.path.join(out_dir, CHANGES_FILE))
+
+
+def plan_tile_changes(state_dir, gdf_wgs84, fids, out_dir, *, zooms=range(MIN_ZOOM, MAX_ZOOM + 1),
+                      buffer=BUFFER, full_share=FULL_SHARE, decimals=COORD_PRECISION):
+    """
+    Compare the exported features (EPSG:4326, aligned with `fids`) with the
+    tile state of the previous run and write `out_dir/changes.json`:
+      - mode "full": no usable state, or more than `full_share` of the
+        features changed; rebuild every tile
+      - mode "none": nothing changed; keep the tiles
+      - mode "dirty": `tiles` lists the dirty (x, y) per zoom, and
+        `out_dir/z<zoom>.geojsonl` holds the features tippecanoe needs for them,
+        one per line
+    This run's state goes to `state_dir/tiles.pending.parquet`, to replace the
+    previous one once its tiles are built (see promote_tile_state); with mode
+    "none" it replaces it right away. Returns the changes.
+    """
+    os.makedirs(out_dir, exist_ok=True)
+    for stale in glob.glob(os.path.join(out_dir, "z*.geojson*")):
+        os.remove(stale)
+    current = tile_state(gdf_wgs84, fids)
+    state_path = os.path.join(state_dir, STATE_FILE)
+    zooms = list(zooms)
+    changes = {"mode": "full", "zooms": zooms, "tiles": {}, "stats": {}}
+    if not os.path.exists(state_path):
+        changes["reason"] = f"no tile state in {state_dir}"
+    else:
+        dirty, stats = diff_tiles(pd.read_parquet(state_path), current, zooms=zooms, buffer=buffer)
+        changed = stats["added"] + stats["removed"] + stats["modified"]
+        changes["stats"] = stats
+        if changed > full_share * max(len(current), 1):
+            changes["reason"] = f"{changed} of {len(current)} features changed"
+        elif not dirty:
+            changes.update(mode="none", reason="no feature changed")
+        else:
+            changes.update(mode="dirty", reason=f"{changed} features changed")
+            changes["tiles"] = {str(z): [list(xy) for xy in tiles] for z, tiles in dirty.items()}
+            sindex = gdf_wgs84.sindex
+            for z, tiles in dirty.items():
+                # the buffered tile extents: every feature tippecanoe would clip into them
+                boxes = np.array([tile_bounds(z, x, y, buffer) for x, y in tiles])
+                rows = np.unique(sindex.query(shapely.box(*boxes.T))[1])
+                write_features(gdf_wgs84.iloc[rows], os.path.join(out_dir, f"z{z}.geojsonl"), decimals=decimals)
+
+    _write_changes(out_dir, changes)
+    os.makedirs(state_dir, exist_ok=True)
+    current.to_parquet(os.path.join(state_dir, PENDING_FILE))
+    if changes["mode"] == "none":
+        promote_tile_state(state_dir)
+    logging.info(f"Tile changes: {changes['mode']} ({changes.get('reason', '')}) {changes['stats']}")
+    return changes
+
+
+def promote_tile_state(state_dir):
+    """
+    Make the pending tile state of the last plan_tile_changes the one the next
+    run compares with; call it once the tiles are built. Until then a failed
+    build leaves the previous state, and the next run plans against the tiles
+    actually built. Returns whether there was a pending state.
+    """
+    pending = os.path.join(state_dir, PENDING_FILE)
+    if not os.path.exists(pending):
+        return False
+    os.replace(pending, os.path.join(state_dir, STATE_FILE))
+    return True
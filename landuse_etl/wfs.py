@@ -0,0 +1,520 @@
+"""
+WFS retrieval: a shared rate limiter, an on-disk HTTP cache, retrying sessions
+and a paging GetFeature loader for the Geodienste of Kanton Basel-Stadt.
+"""
+import hashlib
+import io
+import json
+import logging
+import os
+import random
+import threading
+import time
+from concurrent.futures import ThreadPoolExecutor
+from urllib.parse import parse_qsl, urlencode, urlsplit
+
+import geopandas as gpd
+import pandas as pd
+import requests
+from owslib.wfs import WebFeatureService
+from requests.adapters import HTTPAdapter
+from urllib3.util.retry import Retry
+
+DEFAULT_WFS_URL = "https://wfs.geo.bs.ch/"
+# MapServer's name for the feature geometry: a propertyName list without it
+# gets features without geometry
+GEOMETRY_PROPERTY = "msGeometry"
+
+
+class RateLimiter:
+    """
+    Token bucket shared by all threads talking to one server.
+      - `rate` tokens per second are added, up to `burst`; every request takes one.
+      - `defer(seconds)` blocks all callers, e.g. after a Retry-After header.
+    """
+    def __init__(self, rate, burst=1):
+        if rate <= 0:
+            raise ValueError("rate must be > 0 requests per second")
+        self.rate = float(rate)
+        self.burst = max(1, int(burst))
+        self._tokens = float(self.burst)
+        self._updated = time.monotonic()
+        self._blocked_until = 0.0
+        self._lock = threading.Lock()
+
+    def acquire(self):
+        while True:
+            with self._lock:
+                now = time.monotonic()
+                if now < self._blocked_until:
+                    wait = self._blocked_until - now
+                else:
+                    self._tokens = min(self.burst, self._tokens + (now - self._updated) * self.rate)
+                    self._updated = now
+                    if self._tokens >= 1:
+                        self._tokens -= 1
+                        return
+                    wait = (1 - self._tokens) / self.rate
+            time.sleep(wait)
+
+    def defer(self, seconds):
+        with self._lock:
+            until = time.monotonic() + float(seconds)
+            if until > self._blocked_until:
+                self._blocked_until = until
+                # no tokens accrue while the server asked us to back off
+                self._tokens = 0.0
+                self._updated = until
+
+
+class HttpCache:
+    """
+    Persistent on-disk cache for GET responses, keyed on URL + sorted query params.
+      - Entries are revalidated with If-None-Match / If-Modified-Since; a 304
+        is answered from disk.
+      - Servers that send neither validator are re-downloaded, but a body with
+        the same sha256 as the cached one is reported as unchanged.
+      - `offline=True` never touches the network and fails on a cache miss.
+    Every response passing through gets an `X-Cache` header:
+    miss | changed | revalidated | unchanged | offline.
+    """
+    def __init__(self, directory=os.path.join(".cache", "http"), offline=False):
+        self.directory = directory
+        self.offline = offline
+        os.makedirs(directory, exist_ok=True)
+
+    @staticmethod
+    def key(method, url):
+        parts = urlsplit(url)
+        query = urlencode(sorted(parse_qsl(parts.query, keep_blank_values=True)))
+        canonical = f"{method.upper()} {parts.scheme}://{parts.netloc}{parts.path}?{query}"
+        return hashlib.sha256(canonical.encode("utf-8")).hexdigest()
+
+    def _paths(self, key):
+        base = os.path.join(self.directory, key[:2], key)
+        return base + ".json", base + ".body"
+
+    def lookup(self, key):
+        meta_path, body_path = self._paths(key)
+        try:
+            with open(meta_path, "r", encoding="utf-8") as f:
+                meta = json.load(f)
+            with open(body_path, "rb") as f:
+                body = f.read()
+        except (FileNotFoundError, json.JSONDecodeError):
+            return None
+        return meta, body
+
+    def store(self, key, url, headers, body):
+        meta_path, body_path = self._paths(key)
+        os.makedirs(os.path.dirname(meta_path), exist_ok=True)
+        meta = {
+            "url": url,
+            "etag": headers.get("ETag"),
+            "last_modified": headers.get("Last-Modified"),
+            "content_type": headers.get("Content-Type"),
+            "sha256": hashlib.sha256(body).hexdigest(),
+            "fetched_at": time.time(),
+        }
+        # write-then-rename so concurrent fetch threads never see half an entry
+        for path, data, mode in ((body_path, body, "wb"), (meta_path, json.dumps(meta), "w")):
+            tmp = f"{path}.{os.getpid()}.tmp"
+            with open(tmp, mode) as f:
+                f.write(data)
+            os.replace(tmp, path)
+        return meta
+
+    def response(self, request, meta, body, status):
+        r = requests.Response()
+        r.status_code = 200
+        r.reason = "OK"
+        r._content = body
+        r.headers = requests.structures.CaseInsensitiveDict(
+            {k: v for k, v in (("ETag", meta.get("etag")),
+                               ("Last-Modified", meta.get("last_modified")),
+                               ("Content-Type", meta.get("content_type"))) if v}
+        )
+        r.headers["X-Cache"] = status
+        r.encoding = requests.utils.get_encoding_from_headers(r.headers)
+        r.url = request.url
+        r.request = request
+        return r
+
+
+class _LimitedRetry(Retry):
+    # Retry that takes a token before every re-attempt and forwards
+    # Retry-After to the shared limiter so all threads back off together.
+    def __init__(self, *args, limiter=None, **kwargs):
+        super().__init__(*args, **kwargs)
+        self.limiter = limiter
+
+    def new(self, **kw):
+        kw.setdefault("limiter", self.limiter)
+        return super().new(**kw)
+
+    def sleep(self, response=None):
+        if self.limiter is not None and response is not None:
+            retry_after = self.get_retry_after(response)
+            if retry_after:
+                self.limiter.defer(retry_after)
+        super().sleep(response)
+        if self.limiter is not None:
+            self.limiter.acquire()
+
+
+class _LimitedAdapter(HTTPAdapter):
+    def __init__(self, *args, limiter=None, **kwargs):
+        self.limiter = limiter
+        super().__init__(*args, **kwargs)
+
+    def send(self, request, **kwargs):
+        if self.limiter is not None:
+            self.limiter.acquire()
+        return super().send(request, **kwargs)
+
+
+class _CachingAdapter(_LimitedAdapter):
+    # Serves GETs through an HttpCache; everything else goes straight through.
+    def __init__(self, *args, cache=None, **kwargs):
+        self.cache = cache
+        super().__init__(*args, **kwargs)
+
+    def send(self, request, **kwargs):
+        if request.method != "GET":
+            return super().send(request, **kwargs)
+        key = self.cache.key(request.method, request.url)
+        entry = self.cache.lookup(key)
+        if self.cache.offline:
+            if entry is None:
+                raise requests.ConnectionError(f"Offline and not cached: {request.url}")
+            return self.cache.response(request, *entry, status="offline")
+
+        if entry is not None:
+            meta, _ = entry
+            if meta.get("etag"):
+                request.headers["If-None-Match"] = meta["etag"]
+            if meta.get("last_modified"):
+                request.headers["If-Modified-Since"] = meta["last_modified"]
+
+        resp = super().send(request, **kwargs)
+        if resp.status_code == 304 and entry is not None:
+            resp.close()
+            return self.cache.response(request, *entry, status="revalidated")
+        if not resp.ok:
+            return resp
+
+        body = resp.content
+        if entry is not None and entry[0].get("sha256") == hashlib.sha256(body).hexdigest():
+            status = "unchanged"
+        else:
+            status = "changed" if entry is not None else "miss"
+        self.cache.store(key, request.url, resp.headers, body)
+        resp.headers["X-Cache"] = status
+        return resp
+
+
+def retry_session(total=8, backoff=1.5, ua="landuse-etl/1.0 (+github-actions)", *, rate_limiter=None, pool_size=10, cache=None):
+    r = _LimitedRetry(
+        total=total, connect=total, read=total,
+        backoff_factor=backoff,
+        status_forcelist=(429, 500, 502, 503, 504),
+        allowed_methods=frozenset(["GET", "POST"]),
+        raise_on_status=False,
+        limiter=rate_limiter,
+    )
+    s = requests.Session()
+    s.headers.update({"User-Agent": ua})
+    if cache is not None:
+        a = _CachingAdapter(max_retries=r, pool_connections=pool_size, pool_maxsize=pool_size, limiter=rate_limiter, cache=cache)
+    else:
+        a = _LimitedAdapter(max_retries=r, pool_connections=pool_size, pool_maxsize=pool_size, limiter=rate_limiter)
+    s.mount("https://", a); s.mount("http://", a)
+    return s
+
+
+def _parse_page(content):
+    """Parse one GetFeature response into (GeoDataFrame, n_features, numberMatched, feature ids or None)."""
+    # try JSON parse first
+    try:
+        gj = json.loads(content)
+    except (json.JSONDecodeError, UnicodeDecodeError):
+        gj = None
+    # If it's FeatureCollection, load via from_features
+    if isinstance(gj, dict) and gj.get("type") == "FeatureCollection":
+        features = gj.get("features") or []
+        matched = gj.get("numberMatched")
+        del gj
+        ids = [f.get("id") for f in features]
+        frame = gpd.GeoDataFrame.from_features(features, crs=None)
+        return frame, len(features), matched if isinstance(matched, int) else None, ids if None not in ids else None
+    # fallback: let fiona parse from bytes (works for GeoJSON too)
+    frame = gpd.read_file(io.BytesIO(content))
+    return frame, len(frame), None, None
+
+
+def getfeature_params(typename, srs="EPSG:2056", *, properties=None, geometry_property=GEOMETRY_PROPERTY, bbox=None, fes_filter=None, sort_by=None):
+    """
+    GetFeature parameters for one layer, without output format and paging:
+      - `properties`: the attributes to return (propertyName) besides the
+        geometry `geometry_property`; None returns every attribute
+      - `sort_by`: attribute to sort the features on (sortBy, ascending)
+      - `bbox`: (minx, miny, maxx, maxy) in EPSG:2056; only features intersecting it
+      - `fes_filter`: an FES 2.0 <fes:Filter> document; WFS 2.0 takes either
+        a bbox or a filter, so a filter has to carry its own BBOX
+    """
+    if bbox is not None and fes_filter is not None:
+        raise ValueError("bbox and fes_filter cannot be combined; put a BBOX into the filter")
+    params = {"service": "WFS", "version": "2.0.0", "request": "GetFeature", "typenames": typename, "srsName": srs}
+    if properties is not None:
+        params["propertyName"] = ",".join([*properties, geometry_property])
+    if bbox is not None:
+        # EPSG:2056 has easting first in every WFS version: no axis swap
+        params["bbox"] = ",".join(repr(float(v)) for v in bbox) + ",urn:ogc:def:crs:EPSG::2056"
+    if fes_filter is not None:
+        params["filter"] = fes_filter
+    if sort_by is not None:
+        params["sortBy"] = f"{sort_by} ASC"
+    return params
+
+
+def _get_page(session, url, params, timeout):
+    """One parsed GetFeature response (see _parse_page), or None if the request or its parsing failed."""
+    resp = session.get(url, params=params, timeout=timeout)
+    content = resp.content if resp.ok else b""
+    resp.close()
+    del resp
+    if not content:
+        return None
+    try:
+        return _parse_page(content)
+    except Exception:
+        return None
+
+
+def _sort_key(session, url, params, page_size, timeout):
+    """
+    (attribute to sort the pages of a layer on, or None where one page holds
+    the layer) from a one-feature request with every attribute; False if that
+    request failed. The first attribute of a feature is the layer's key column
+    on MapServer, as far as it has one.
+    """
+    probe = {k: v for k, v in params.items() if k != "propertyName"}
+    page = _get_page(session, url, {**probe, "count": 1, "startIndex": 0}, timeout)
+    if page is None:
+        return False
+    frame, _, matched, _ = page
+    if matched is not None and matched <= page_size:
+        return None
+    attributes = [c for c in frame.columns if c != frame.geometry.name] if "geometry" in frame.columns else list(frame.columns)
+    return attributes[0] if attributes else None
+
+
+def getfeature_pages(session, url, typename, srs="EPSG:2056", timeout=120, page_size=5000, sort_by="auto", **query):
+    """
+    Fetch one layer as a list of GeoDataFrame pages (in `srs`) using WFS 2.0
+    paging (`count`/`startIndex`). Only one page of raw bytes and parsed JSON
+    is alive at a time; callers concatenate the pages once. `page_size=None`
+    requests the whole layer in one response. `query` narrows the request
+    server-side (see getfeature_params).
+
+    WFS 2.0 only pages in a stable order when the request is sorted, so a
+    layer of more than one page is sorted on `sort_by` ("auto": its first
+    attribute, see _sort_key; None: unsorted). Pages that still overlap, i.e.
+    repeat a feature id, raise a RuntimeError.
+    """
+    # try common GeoJSON output formats in order
+    for fmt in ("application/json; subtype=geojson", "application/json", "json", "geojson"):
+        params = {**getfeature_params(typename, srs, **query), "outputFormat": fmt}
+        key = sort_by
+        if page_size and sort_by == "auto":
+            key = _sort_key(session, url, params, page_size, timeout)
+            if key is False:
+                continue  # try next format
+        added = None
+        if page_size and key is not None:
+            params["sortBy"] = f"{key} ASC"
+            if "propertyName" in params and key not in params["propertyName"].split(","):
+                # the sort attribute comes along, and is dropped again
+                params["propertyName"] = f"{key},{params['propertyName']}"
+                added = key
+        pages, ids, start = [], [], 0
+        while True:
+            if page_size:
+                params.update(count=page_size, startIndex=start)
+            page = _get_page(session, url, params, timeout)
+            if page is None:
+                if pages:
+                    raise RuntimeError(f"Page at startIndex={start} of {typename} failed")
+                break  # try next format
+            frame, n, matched, page_ids = page
+            if n or not pages:
+                if added is not None and added in frame.columns:
+                    frame = frame.drop(columns=added)
+                # the response is in `srs`, whatever its GeoJSON says
+                pages.append(frame.set_crs(srs, allow_override=True))
+            if ids is not None:
+                ids = ids + page_ids if page_ids is not None else None
+            start += n
+            # With numberMatched, page until it is reached: servers cap `count`
+            # (maxFeatures), so a short page is no sign of the end. Without it,
+            # stop on a short page, or one longer than asked for (the server
+            # ignored `count` and sent everything at once).
+            if matched is not None:
+                done = start >= matched
+            else:
+                done = n != page_size
+            if not page_size or n == 0 or done:
+                if matched is not None and start < matched:
+                    logging.warning(f"{typename}: got {start} of {matched} features (numberMatched)")
+                if ids and len(set(ids)) < len(ids):
+                    raise RuntimeError(
+                        f"{typename}: {len(ids) - len(set(ids))} feature(s) on more than one page "
+                        f"(sortBy {key!r} does not give a stable order)"
+                    )
+                return pages
+    raise RuntimeError("GeoJSON fetch failed for all formats")
+
+
+def getfeature_geojson(session, url, typename, srs="EPSG:2056", timeout=120, page_size=5000, **query):
+    pages = getfeature_pages(session, url, typename, srs=srs, timeout=timeout, page_size=page_size, **query)
+    return pages[0] if len(pages) == 1 else pd.concat(pages, ignore_index=True)
+
+
+def load_data_from_wfs(
+    url_wfs, shapes_to_load=None, prefix=None, *,
+    sleep_min=0.3, sleep_max=0.8, max_workers=4, requests_per_second=2.0, page_size=5000,
+    cache=None, properties=None, geometry_property=GEOMETRY_PROPERTY, bbox=None, fes_filter=None, srs="EPSG:2056",
+):
+    """
+    Robust WFS loader:
+      - Fetches capabilities through the session and parses them with OWSLib.
+      - Uses requests+retries for GetFeature (GeoJSON first, then GML fallback).
+      - Fetches up to `max_workers` layers concurrently over one pooled session.
+      - `requests_per_second` caps all requests (incl. retries) via a shared token
+        bucket that also honours Retry-After. Set it to None to fall back to the
+        polite random sleep of `sleep_min`..`sleep_max` before each layer.
+      - Pages through each layer `page_size` features at a time; all pages of all
+        layers are concatenated once at the end.
+      - `cache` (an HttpCache) revalidates every response against disk; in offline
+        mode everything is replayed from it.
+      - `properties`, `bbox`, `fes_filter` narrow every layer server-side and
+        `srs` is the CRS it is returned in (see getfeature_params). Columns
+        beyond `properties` are dropped even if the server sends them; a layer
+        whose narrowed request fails, or comes back without geometries, is
+        fetched again with every attribute.
+    Returns: GeoDataFrame with layers concatenated in request order; the list of
+    failed layers (same order) is in `gdf.attrs["failed_layers"]`.
+    """
+    if bbox is not None and fes_filter is not None:
+        raise ValueError("bbox and fes_filter cannot be combined; put a BBOX into the filter")
+    logging.info(f"Connecting to WFS at {url_wfs}")
+
+    max_workers = max(1, int(max_workers))
+    limiter = RateLimiter(requests_per_second, burst=max_workers) if requests_per_second else None
+    sess = retry_session(rate_limiter=limiter, pool_size=max(10, max_workers), cache=cache)
+    offline = cache is not None and cache.offline
+
+    # Capabilities with a few manual retries; fetched through the session so the
+    # document is cached, parsed by OWSLib
+    last_exc = None
+    tries = 1 if offline else 3
+    for i in range(tries):
+        try:
+            resp = sess.get(
+                url_wfs, params={"service": "WFS", "version": "2.0.0", "request": "GetCapabilities"}, timeout=120
+            )
+            resp.raise_for_status()
+            wfs = WebFeatureService(url=url_wfs, version="2.0.0", xml=resp.content, timeout=120)
+            contents = list(wfs.contents)
+            logging.info(f"Capabilities loaded ({resp.headers.get('X-Cache', 'uncached')}); {len(contents)} layers advertised.")
+            break
+        except Exception as e:
+            last_exc = e
+            if i + 1 == tries:
+                continue
+            wait = (i + 1) * 5
+            logging.error(f"GetCapabilities failed (try {i+1}/{tries}): {e} — retrying in {wait}s")
+            time.sleep(wait)
+    else:
+        raise RuntimeError(f"Failed to load WFS capabilities: {last_exc}")
+
+    # Auto-discover by prefix
+    if prefix:
+        shapes_to_load = [name for name in contents if name.startswith(prefix)]
+        logging.info(f"Discovered {len(shapes_to_load)} layers with prefix '{prefix}'")
+
+    if not shapes_to_load:
+        raise ValueError("No shapes_to_load provided and no prefix matched any layers.")
+
+    query = {"bbox": bbox, "fes_filter": fes_filter}
+
+    def project(frame):
+        keep = [c for c in frame.columns if c in properties or c == frame.geometry.name]
+        return frame[keep] if len(keep) < len(frame.columns) else frame
+
+    def fetch_projected(typename):
+        # only the requested attributes, but never a layer without its geometries
+        try:
+            pages = getfeature_pages(
+                sess, url_wfs, typename, srs=srs, page_size=page_size,
+                properties=properties, geometry_property=geometry_property, **query,
+            )
+            if any(len(p) and p.geometry.isna().all() for p in pages):
+                raise RuntimeError(f"no geometries with propertyName {geometry_property!r}")
+        except Exception as e:
+            logging.warning(f"{typename}: request for {list(properties)} failed ({e}); fetching every attribute")
+            pages = getfeature_pages(sess, url_wfs, typename, srs=srs, page_size=page_size, **query)
+        return [project(p) for p in pages]
+
+    def fetch(typename):
+        logging.info(f"Fetching layer: {typename}")
+        if limiter is None:
+            time.sleep(random.uniform(sleep_min, sleep_max))  # be polite
+
+        # 1) Try GeoJSON via requests (fastest to parse, resilient)
+        try:
+            if properties is not None:
+                return fetch_projected(typename)
+            return getfeature_pages(sess, url_wfs, typename, srs=srs, page_size=page_size, **query)
+        except Exception:
+            # 2) Fallback: OWSLib GetFeature (likely GML); bypasses the session (and its
+            # cache), so it is skipped offline and takes a rate-limit token by hand
+            if offline:
+                raise
+            if limiter is not None:
+                limiter.acquire()
+            narrow = {"bbox": (*bbox, "urn:ogc:def:crs:EPSG::2056")} if bbox is not None else {}
+            if fes_filter is not None:
+                narrow["filter"] = fes_filter
+            resp = wfs.getfeature(typename=typename, srsname=srs, **narrow)
+            frame = gpd.read_file(io.BytesIO(resp.read()))
+            return [project(frame) if properties is not None else frame]
+
+    with ThreadPoolExecutor(max_workers=max_workers, thread_name_prefix="wfs") as pool:
+        futures = [(typename, pool.submit(fetch, typename)) for typename in shapes_to_load]
+
+        frames, failed_layers = [], []
+        for typename, future in futures:
+            try:
+                frames.extend(future.result())
+            except Exception as e:
+                logging.error(f"ERROR: Failed to fetch {typename}: {e}")
+                failed_layers.append(typename)
+
+    # single concat in request order, independent of completion order;
+    # empty pages are skipped so they cannot upcast column dtypes
+    frames = [f for f in frames if len(f)] or frames[:1]
+    gdf_combined = pd.concat(frames, ignore_index=True) if frames else gpd.GeoDataFrame()
+    if properties is not None:
+        # the requested columns, even when no feature matched
+        for column in properties:
+            if column not in gdf_combined.columns:
+                gdf_combined[column] = None
+    gdf_combined.attrs["failed_layers"] = failed_layers
+
+    if failed_layers:
+        logging.info(f"Completed with {len(failed_layers)} failure(s): {failed_layers}")
+    else:
+        logging.info("Completed all layers successfully.")
+
+    return gdf_combined
@@ -0,0 +1,18 @@
+# /// script
+# requires-python = ">=3.12"
+# dependencies = [
+#     "geopandas==1.1.1",
+#     "numpy==2.2.6",
+#     "owslib==0.34.1",
+#     "pandas==2.3.3",
+#     "pyarrow",
+#     "requests==2.32.5",
+#     "shapely==2.1.2",
+#     "urllib3==2.5.0",
+# ]
+# ///
+"""Headless entry point for the land-use ETL (no marimo); see landuse_etl/cli.py for the flags."""
+from landuse_etl.cli import main
+
+if __name__ == "__main__":
+    raise SystemExit(main())
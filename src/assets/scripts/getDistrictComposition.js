@@ -0,0 +1,24 @@
+// Landuse composition per district, precomputed by the ETL (composition.json):
+// { mode: { districtId: { name, sumSizes, sizes: { category: { m, p } } } } }
+let composition = null;
+
+export function loadDistrictComposition(location) {
+  return fetch(location + "composition.json")
+    .then((response) => (response.ok ? response.json() : null))
+    .then((data) => {
+      composition = data;
+      return data;
+    })
+    .catch(() => null);
+}
+
+// { sizes, sumSizes } like getLanduseSizes, or null if the district is not precomputed
+export default function (mode, districtId) {
+  const entry = composition?.[mode]?.[String(districtId)];
+  if (!entry || !entry.sumSizes) return null;
+  const sizes = {};
+  Object.keys(entry.sizes).forEach(function (key) {
+    sizes[key] = { m: entry.sizes[key].m, p: entry.sizes[key].p };
+  });
+  return { sizes, sumSizes: entry.sumSizes };
+}
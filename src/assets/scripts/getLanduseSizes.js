@@ -1,6 +1,6 @@
 import intersect from "@turf/intersect";
 import area from "@turf/area";
-import { landuseFieldname } from "$lib/settings";
+import { landuseOf } from "$lib/settings";
 
 export default function (map, polygonGeom, landuses) {
   let sizes = {};
@@ -17,7 +17,7 @@ export default function (map, polygonGeom, landuses) {
     });
     if (intersection) {
       const size = area(intersection);
-      const category = landuses[feature.properties[landuseFieldname]].category;
+      const category = landuses[landuseOf(feature.properties)].category;
       if (!sizes[category]) {
         sizes[category] = {};
         sizes[category].m = size;
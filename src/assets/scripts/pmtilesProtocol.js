@@ -0,0 +1,143 @@
+// Reads vector tiles out of a PMTiles (v3) archive with HTTP range requests,
+// for maplibregl.addProtocol("pmtiles", pmtilesProtocol). Tile URLs look like
+// pmtiles://<archive url>/{z}/{x}/{y}. Written by landuse_etl/pmtiles.py.
+const FIRST_REQUEST_BYTES = 16384;
+
+const archives = {};
+
+async function fetchRange(url, offset, length, signal) {
+  const response = await fetch(url, {
+    headers: { Range: `bytes=${offset}-${offset + length - 1}` },
+    signal,
+  });
+  if (!response.ok) throw new Error(`${url}: HTTP ${response.status}`);
+  const buffer = await response.arrayBuffer();
+  // a server without range support sends the whole file
+  return response.status === 206 ? buffer : buffer.slice(offset, offset + length);
+}
+
+async function gunzip(buffer) {
+  const stream = new Blob([buffer]).stream().pipeThrough(new DecompressionStream("gzip"));
+  return new Response(stream).arrayBuffer();
+}
+
+// tile ids exceed 2^32 from zoom 16 on: no bit operations on them
+export function zxyToTileId(z, x, y) {
+  const acc = (4 ** z - 1) / 3;
+  const n = 2 ** z;
+  let d = 0;
+  for (let s = n / 2; s >= 1; s /= 2) {
+    const rx = (x & s) > 0 ? 1 : 0;
+    const ry = (y & s) > 0 ? 1 : 0;
+    d += s * s * ((3 * rx) ^ ry);
+    if (ry === 0) {
+      if (rx === 1) {
+        x = n - 1 - x;
+        y = n - 1 - y;
+      }
+      [x, y] = [y, x];
+    }
+  }
+  return acc + d;
+}
+
+function readVarint(bytes, state) {
+  let value = 0;
+  let factor = 1;
+  let b;
+  do {
+    b = bytes[state.pos++];
+    value += (b & 0x7f) * factor;
+    factor *= 128;
+  } while (b >= 0x80);
+  return value;
+}
+
+function parseDirectory(buffer) {
+  const bytes = new Uint8Array(buffer);
+  const state = { pos: 0 };
+  const n = readVarint(bytes, state);
+  const entries = [];
+  let tileId = 0;
+  for (let i = 0; i < n; i++) {
+    tileId += readVarint(bytes, state);
+    entries.push({ tileId, offset: 0, length: 0, runLength: 0 });
+  }
+  for (const entry of entries) entry.runLength = readVarint(bytes, state);
+  for (const entry of entries) entry.length = readVarint(bytes, state);
+  entries.forEach(function (entry, i) {
+    const value = readVarint(bytes, state);
+    entry.offset = value === 0 && i > 0 ? entries[i - 1].offset + entries[i - 1].length : value - 1;
+  });
+  return entries;
+}
+
+async function openArchive(url) {
+  const first = await fetchRange(url, 0, FIRST_REQUEST_BYTES);
+  const view = new DataView(first);
+  const magic = new TextDecoder().decode(new Uint8Array(first, 0, 7));
+  if (magic !== "PMTiles" || view.getUint8(7) !== 3) throw new Error(`${url} is not a PMTiles v3 archive`);
+  const u64 = (at) => Number(view.getBigUint64(at, true));
+  const header = {
+    rootOffset: u64(8),
+    rootLength: u64(16),
+    leavesOffset: u64(40),
+    dataOffset: u64(56),
+    internalCompression: view.getUint8(97),
+    tileCompression: view.getUint8(98),
+  };
+  const rootBytes =
+    header.rootOffset + header.rootLength <= first.byteLength
+      ? first.slice(header.rootOffset, header.rootOffset + header.rootLength)
+      : await fetchRange(url, header.rootOffset, header.rootLength);
+  const root = parseDirectory(header.internalCompression === 2 ? await gunzip(rootBytes) : rootBytes);
+  return { header, root, leaves: {} };
+}
+
+function findEntry(entries, tileId) {
+  let lo = 0;
+  let hi = entries.length;
+  while (lo < hi) {
+    const mid = (lo + hi) >> 1;
+    if (entries[mid].tileId <= tileId) lo = mid + 1;
+    else hi = mid;
+  }
+  return lo ? entries[lo - 1] : null;
+}
+
+async function getTile(url, z, x, y, signal) {
+  if (!archives[url]) {
+    // shared by all tile requests, so not tied to one request's abort signal
+    archives[url] = openArchive(url);
+    archives[url].catch(() => delete archives[url]);
+  }
+  const archive = await archives[url];
+  const { header } = archive;
+  const tileId = zxyToTileId(z, x, y);
+  let entries = archive.root;
+  for (;;) {
+    const entry = findEntry(entries, tileId);
+    if (!entry) return null;
+    if (entry.runLength > 0) {
+      if (tileId >= entry.tileId + entry.runLength) return null;
+      const tile = await fetchRange(url, header.dataOffset + entry.offset, entry.length, signal);
+      return header.tileCompression === 2 ? gunzip(tile) : tile;
+    }
+    // run length 0: pointer to a leaf directory
+    const key = entry.offset;
+    if (!archive.leaves[key]) {
+      archive.leaves[key] = fetchRange(url, header.leavesOffset + entry.offset, entry.length)
+        .then((bytes) => (header.internalCompression === 2 ? gunzip(bytes) : bytes))
+        .then(parseDirectory);
+      archive.leaves[key].catch(() => delete archive.leaves[key]);
+    }
+    entries = await archive.leaves[key];
+  }
+}
+
+export default async function pmtilesProtocol(params, abortController) {
+  const match = params.url.match(/^pmtiles:\/\/(.+)\/(\d+)\/(\d+)\/(\d+)$/);
+  if (!match) throw new Error(`Not a pmtiles tile URL: ${params.url}`);
+  const tile = await getTile(match[1], +match[2], +match[3], +match[4], abortController?.signal);
+  return { data: tile ? new Uint8Array(tile) : new Uint8Array() };
+}
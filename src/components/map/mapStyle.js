@@ -1,10 +1,17 @@
-import { landuses, categories, landuseFieldname } from '$lib/settings.js';
+import { landuses, categories, landuseFieldname, landuseCodeFieldname, landuseCodes } from '$lib/settings.js';
 
 const landuseColors = [];
 Object.keys(landuses).forEach((key) => {
 	landuseColors.push(key);
 	landuseColors.push(categories[landuses[key].category].color);
 });
+// codes of the "tiles" export profile resolve to the same colours
+Object.keys(landuseCodes).forEach((code) => {
+	const landuse = landuses[landuseCodes[code]];
+	if (!landuse) return;
+	landuseColors.push(code);
+	landuseColors.push(categories[landuse.category].color);
+});
 
 export default function (location) {
 	return {
@@ -25,7 +32,7 @@ export default function (location) {
 			},
 			'landuse-source': {
 				type: 'vector',
-				tiles: [location + 'tiles/{z}/{x}/{y}.pbf'],
+				tiles: ['pmtiles://' + location + 'landuse.pmtiles/{z}/{x}/{y}'],
 				minzoom: 10,
 				maxzoom: 13
 			}
@@ -46,7 +53,12 @@ export default function (location) {
 				maxzoom: 24,
 				paint: {
 					'fill-opacity': 1,
-					'fill-color': ['match', ['to-string', ['get', landuseFieldname]], ...landuseColors, '#fff']
+					'fill-color': [
+						'match',
+						['to-string', ['coalesce', ['get', landuseFieldname], ['get', landuseCodeFieldname]]],
+						...landuseColors,
+						'#fff'
+					]
 				}
 			},
 			{
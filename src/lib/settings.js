@@ -2,6 +2,8 @@
 
 // Load color configuration from JSON file (single source of truth)
 import colorConfig from './colors.json';
+// nutzung per code, for tiles exported with the "tiles" profile (written by the ETL)
+import landuseCodeTable from './landuseCodes.json';
 
 export const projectTitle = "Quartierfarben Basel-Stadt";
 
@@ -122,6 +124,14 @@ export const categories = buildCategoriesForSeason("always");
 
 // Landuse tiles settings
 export const landuseFieldname = "nutzung";
+// tiles of the "tiles" export profile carry a small integer code instead of the nutzung text
+export const landuseCodeFieldname = "code";
+export const landuseCodes = landuseCodeTable;
+
+// nutzung of a tile feature, whichever of the two it carries
+export function landuseOf(properties) {
+    return properties[landuseFieldname] ?? landuseCodes[properties[landuseCodeFieldname]];
+}
 
 // Basel landuses → categories (loaded from JSON - single source of truth)
 export let landuses = {};
@@ -0,0 +1,80 @@
+"""
+Small synthetic layers in EPSG:2056, shaped like the WFS layers the pipeline
+loads: a grid of Bodenbedeckung cells (buildings, "uebrige befestigte" and
+gardens), Gebäudekategorie polygons that split some buildings, overlapping
+public-space polygons, and Kultur / school points.
+"""
+import geopandas as gpd
+import numpy as np
+import pytest
+import shapely
+
+from landuse_etl.stages import BUILDING_BB, TARGET_BB
+
+X0, Y0 = 2611000.0, 1267000.0
+CELL = 10.0
+GRID = 8
+KINDS = (BUILDING_BB, TARGET_BB, "humusiert.Gartenanlage")
+
+
+def _rect(x0, y0, x1, y1):
+    return shapely.box(X0 + x0, Y0 + y0, X0 + x1, Y0 + y1)
+
+
+def _frame(data, geometry):
+    return gpd.GeoDataFrame(data, geometry=geometry, crs=2056)
+
+
+def make_layers(seed=0):
+    """{result name: GeoDataFrame} as the load stage returns them."""
+    rng = np.random.default_rng(seed)
+    cells, kinds = [], []
+    for i in range(GRID):
+        for j in range(GRID):
+            cells.append(_rect(i * CELL, j * CELL, (i + 1) * CELL, (j + 1) * CELL))
+            kinds.append(KINDS[(i + 2 * j) % len(KINDS)])
+    bodenbedeckung = _frame({"bs_art_txt": kinds}, cells)
+    bodenbedeckung["laufnr"] = np.arange(1, len(bodenbedeckung) + 1)
+
+    # vertical strips of uneven width: buildings on a strip edge are split between two ids
+    edges = np.cumsum(np.r_[0.0, rng.uniform(6.0, 17.0, size=12)])
+    ids = rng.choice([1021, 1025, 1030, 1060], size=len(edges) - 1)
+    gebaeudekategorie = _frame(
+        {"gebaeudekategorieid": ids},
+        [_rect(a, -5.0, b, GRID * CELL + 5.0) for a, b in zip(edges[:-1], edges[1:])],
+    )
+
+    # discs that overlap each other and cover cells partly or fully
+    centers = rng.uniform(0.0, GRID * CELL, size=(10, 2))
+    radii = rng.uniform(4.0, 14.0, size=10)
+    oeffentlicher_raum = _frame(
+        {}, [shapely.Point(X0 + x, Y0 + y).buffer(r) for (x, y), r in zip(centers, radii)],
+    )
+
+    def points(n, labels):
+        xy = rng.uniform(0.0, GRID * CELL, size=(n, 2))
+        return [shapely.Point(X0 + x, Y0 + y) for x, y in xy], rng.choice(labels, size=n)
+
+    geoms, labels = points(6, ["Museum", "Theater", "Kino"])
+    kultur = _frame({"bi_subkategorie": labels}, geoms)
+    geoms, labels = points(4, ["Primarschule", "Gymnasium"])
+    schulstandorte = _frame({"schultyp": labels}, geoms)
+    return {
+        "gdf_bodenbedeckung": bodenbedeckung,
+        "gdf_gebaeudekategorie": gebaeudekategorie,
+        "gdf_oeffentlicher_raum": oeffentlicher_raum,
+        "gdf_kultur": kultur,
+        "gdf_schulstandorte": schulstandorte,
+    }
+
+
+@pytest.fixture
+def layers():
+    return make_layers()
+
+
+@pytest.fixture
+def buildings(layers):
+    bb = layers["gdf_bodenbedeckung"]
+    return bb[bb["bs_art_txt"] == BUILDING_BB].reset_index(drop=True)
+
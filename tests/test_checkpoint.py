@@ -0,0 +1,61 @@
+"""Stage checkpoints: reused for the same code, inputs and parameters only; the load only under a source token."""
+import geopandas as gpd
+import shapely
+
+from landuse_etl import stages
+from landuse_etl.checkpoint import StageCache
+
+
+def _counting(calls, frame):
+    def fn():
+        calls.append(1)
+        return frame
+    return fn
+
+
+def test_checkpoint_is_reused_and_rekeyed(tmp_path, buildings):
+    calls = []
+    fn = _counting(calls, buildings)
+    cache = StageCache(str(tmp_path))
+    first = cache.run("stage", fn, inputs=(buildings,), params={"a": 1})
+    again = cache.run("stage", fn, inputs=(buildings,), params={"a": 1})
+    assert len(calls) == 1
+    assert shapely.equals_exact(again.geometry.values, first.geometry.values, tolerance=0).all()
+
+    cache.run("stage", fn, inputs=(buildings,), params={"a": 2})
+    cache.run("stage", fn, inputs=(buildings.iloc[1:],), params={"a": 1})
+    StageCache(str(tmp_path), code_token="other").run("stage", fn, inputs=(buildings,), params={"a": 1})
+    assert len(calls) == 4
+
+
+def test_only_the_newest_checkpoints_are_kept(tmp_path, buildings):
+    cache = StageCache(str(tmp_path), keep=2)
+    for a in range(4):
+        cache.run("stage", lambda: buildings, params={"a": a})
+    assert len(list(tmp_path.glob("stage-*.parquet"))) == 2
+
+
+def _fake_wfs(monkeypatch, calls):
+    def load_data_from_wfs(url, **kwargs):
+        calls.append(url)
+        return gpd.GeoDataFrame({"bs_art_txt": ["Gebaeude.Gebaeude"]}, geometry=[shapely.box(0, 0, 1, 1)], crs=2056)
+    monkeypatch.setattr(stages, "load_data_from_wfs", load_data_from_wfs)
+
+
+def test_load_without_source_token_asks_the_wfs_every_run(tmp_path, monkeypatch):
+    calls = []
+    _fake_wfs(monkeypatch, calls)
+    cache = StageCache(str(tmp_path))
+    for _ in range(2):
+        gdf = stages.load_bodenbedeckung("http://wfs", None, cache, None)
+    assert len(calls) == 2 and list(gdf["laufnr"]) == [1]
+    assert not list(tmp_path.glob("*.parquet"))
+
+
+def test_load_under_a_source_token_is_checkpointed(tmp_path, monkeypatch):
+    calls = []
+    _fake_wfs(monkeypatch, calls)
+    cache = StageCache(str(tmp_path))
+    for token in ("2026-10-18", "2026-10-18", "reload"):
+        stages.load_bodenbedeckung("http://wfs", None, cache, token)
+    assert len(calls) == 2
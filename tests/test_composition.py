@@ -0,0 +1,100 @@
+"""Category areas per district and per circle, against a plain shapely intersection of every feature."""
+import geopandas as gpd
+import numpy as np
+import pandas as pd
+import pytest
+import shapely
+
+from landuse_etl.composition import CompositionEngine, circle_polygons, district_composition, nutzung_categories
+
+
+def _expected(geoms, categories, region):
+    areas = shapely.area(shapely.intersection(geoms, region))
+    sums = pd.Series(areas).groupby(np.asarray(categories)).sum()
+    return sums[sums > 0]
+
+
+@pytest.fixture
+def districts(layers):
+    x0, y0, x1, y1 = layers["gdf_bodenbedeckung"].total_bounds
+    return gpd.GeoDataFrame(
+        {"id": [3, 4, 5], "name": ["Triangle", "Disc", "Outside"]},
+        geometry=[
+            shapely.Polygon([(x0 - 5, y0 - 5), (x1, y0 + 3), (x0 + 7, y1 - 1)]),
+            shapely.Point(x0 + 52, y0 + 47).buffer(21),
+            shapely.box(x1 + 10, y1 + 10, x1 + 20, y1 + 20),
+        ],
+        crs=2056,
+    )
+
+
+def test_district_composition_matches_intersection(layers, districts):
+    bb = layers["gdf_bodenbedeckung"]
+    result = district_composition(bb, districts, bb["bs_art_txt"], area_decimals=6, percent_decimals=6)
+    assert list(result) == ["3", "4", "5"]
+    for district_id, region in zip(["3", "4"], districts.geometry):
+        expected = _expected(bb.geometry.values, bb["bs_art_txt"], region)
+        got = result[district_id]
+        assert got["sumSizes"] == pytest.approx(expected.sum(), abs=1e-5)
+        assert {c: v["m"] for c, v in got["sizes"].items()} == pytest.approx(expected.to_dict(), abs=1e-5)
+        assert sum(v["p"] for v in got["sizes"].values()) == pytest.approx(100)
+    assert result["5"] == {"name": "Outside", "sumSizes": 0.0, "sizes": {}}
+
+
+def test_unmapped_nutzung_is_other():
+    config = {"landuseMapping": {"Gebäude - Wohnen": "wohnen"}}
+    nutzung = pd.Series(["Gebäude - Wohnen", "Wald"], dtype="category")
+    assert list(nutzung_categories(nutzung, config)) == ["wohnen", "other"]
+
+
+@pytest.fixture
+def engine_input(layers):
+    # holes and multipolygons: the cells with the public discs cut out; the
+    # first kind is left out of landuseMapping and counts as "other"
+    bb = layers["gdf_bodenbedeckung"]
+    public = shapely.union_all(layers["gdf_oeffentlicher_raum"].geometry.values)
+    gdf = gpd.GeoDataFrame({"nutzung": bb["bs_art_txt"]}, geometry=shapely.difference(bb.geometry.values, public), crs=2056)
+    gdf = pd.concat([gdf, gpd.GeoDataFrame({"nutzung": ["Platz"]}, geometry=[public], crs=2056)], ignore_index=True)
+    names = sorted(gdf["nutzung"].unique())
+    config = {"landuseMapping": {n: n for n in names[1:]}, "categories": {n: {} for n in names[1:]}}
+    return gdf, config
+
+
+def test_engine_areas_match_intersection(engine_input):
+    gdf, config = engine_input
+    engine = CompositionEngine(gdf, config)
+    x0, y0 = gdf.total_bounds[:2]
+    xs, ys, radii = x0 + np.array([40.0, 3.3, 71.9, 40.0]), y0 + np.array([40.0, 77.1, 12.5, 40.0]), np.array([25.0, 13.0, 9.7, 250.0])
+    got = engine.areas(xs, ys, radii)
+    categories = nutzung_categories(gdf["nutzung"], config)
+    for row, circle in zip(got, circle_polygons(xs, ys, radii)):
+        expected = _expected(gdf.geometry.values, categories, circle)
+        assert dict(zip(engine.names, row)) == pytest.approx({n: expected.get(n, 0.0) for n in engine.names}, abs=1e-6)
+
+
+def test_engine_caches_snapped_centres(engine_input):
+    gdf, config = engine_input
+    engine = CompositionEngine(gdf, config, radius=20, cache_size=2)
+    x0, y0 = gdf.total_bounds[:2]
+    first = engine.composition(x0 + 30.2, y0 + 30.4)
+    assert engine.composition(x0 + 29.9, y0 + 29.6) == first  # same metre
+    assert len(engine._cache) == 1
+    for dx in (1, 2, 3):
+        engine.composition(x0 + dx, y0)
+    assert len(engine._cache) == 2
+
+    points = gpd.GeoDataFrame(geometry=gpd.points_from_xy([x0 + 30, x0 + 5], [y0 + 30, y0 + 70]), crs=2056, index=[10, 11])
+    table = engine.for_points(points)
+    assert list(table.index) == [10, 11]
+    assert table.loc[10, "sumSizes"] == pytest.approx(first["sumSizes"])
+    assert table.loc[10, [f"p_{n}" for n in engine.names]].sum() == pytest.approx(100)
+
+
+def test_engine_workers_agree(engine_input):
+    gdf, config = engine_input
+    x0, y0 = gdf.total_bounds[:2]
+    rng = np.random.default_rng(1)
+    xs, ys = x0 + rng.uniform(0, 80, 30), y0 + rng.uniform(0, 80, 30)
+    serial = CompositionEngine(gdf, config).compositions(xs, ys, 15)
+    parallel = CompositionEngine(gdf, config).compositions(xs, ys, 15, workers=2, chunk_size=8)
+    assert parallel == serial
@@ -0,0 +1,20 @@
+"""Public-space coverage per target cell gives what the gpd.overlay it replaced gave."""
+import geopandas as gpd
+import numpy as np
+
+from landuse_etl.stages import TARGET_BB, _covered_chunk, covered_areas
+
+
+def test_covered_chunk_matches_overlay(layers):
+    bb = layers["gdf_bodenbedeckung"]
+    targets = bb[bb["bs_art_txt"] == TARGET_BB].reset_index(drop=True)
+    publics = layers["gdf_oeffentlicher_raum"]
+
+    union = gpd.GeoDataFrame(geometry=[publics.union_all()], crs=publics.crs)
+    pieces = gpd.overlay(targets[["laufnr", "geometry"]], union, how="intersection")
+    expected = pieces.geometry.area.groupby(pieces["laufnr"]).sum().reindex(targets["laufnr"], fill_value=0.0)
+
+    covered = _covered_chunk(targets.geometry.values, publics.geometry.values)
+    assert (covered > 0).any() and (covered < targets.geometry.area).any()
+    np.testing.assert_allclose(covered, expected.to_numpy(), rtol=1e-9, atol=1e-6)
+    np.testing.assert_allclose(covered_areas(targets.geometry, publics.geometry, part_rows=5), covered)
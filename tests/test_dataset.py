@@ -0,0 +1,35 @@
+"""Dataset: one EPSG:2056 frame, views in other CRSs projected once."""
+import shapely
+
+from landuse_etl.dataset import Dataset, in_crs, transformer
+
+
+def test_views_match_to_crs_and_are_kept(layers):
+    bb = layers["gdf_bodenbedeckung"]
+    dataset = Dataset(bb)
+    assert dataset.view() is dataset.frame and dataset.view(2056) is dataset.frame
+    wgs84 = dataset.view(4326)
+    assert dataset.view("EPSG:4326") is wgs84
+    assert wgs84.crs.to_epsg() == 4326 and list(wgs84["laufnr"]) == list(bb["laufnr"])
+    assert shapely.equals_exact(wgs84.geometry.values, bb.to_crs(4326).geometry.values, tolerance=1e-9).all()
+    dataset.drop_views()
+    assert dataset.view(4326) is not wgs84
+
+
+def test_chunked_views_over_workers(layers):
+    bb = layers["gdf_bodenbedeckung"]
+    serial = Dataset(bb).geometry(4326)
+    parallel = Dataset(bb, workers=2, part_rows=10).geometry(4326)
+    assert list(parallel.index) == list(serial.index)
+    assert shapely.equals_exact(parallel.values, serial.values, tolerance=0).all()
+
+
+def test_frames_come_in_as_epsg_2056(layers):
+    bb = layers["gdf_bodenbedeckung"]
+    back = Dataset(bb.to_crs(4326)).frame
+    assert back.crs.to_epsg() == 2056
+    # the same transformation as geopandas' (which does not invert exactly without the grids)
+    assert shapely.equals_exact(back.geometry.values, bb.to_crs(4326).to_crs(2056).geometry.values, tolerance=1e-6).all()
+    assert in_crs(bb.set_crs(None, allow_override=True)).crs.to_epsg() == 2056
+    assert in_crs(bb) is bb
+    assert transformer(2056, 4326) is transformer("EPSG:2056", "epsg:4326")
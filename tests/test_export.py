@@ -0,0 +1,87 @@
+"""Export profiles (the tiles profile with its stable code lookup) and the streaming writers."""
+import json
+
+import geopandas as gpd
+import pandas as pd
+import pytest
+import shapely
+
+from landuse_etl.export import CODES_PATH, assign_landuse_codes, export_frame, load_landuse_codes, quantize, write_features
+from landuse_etl.stages import COLORS_PATH
+
+
+def _nutzung(*values):
+    return gpd.GeoDataFrame(
+        {"nutzung": list(values), "laufnr": range(1, len(values) + 1), "color": "#ffffff"},
+        geometry=[shapely.box(i, 0, i + 1, 1) for i in range(len(values))], crs=4326,
+    )
+
+
+def test_tiles_profile_keeps_geometry_and_code(tmp_path):
+    codes_path = tmp_path / "landuseCodes.json"
+    gdf = _nutzung("Wald", "Gebäude - Wohnen", "Wald", None)
+    tiles = export_frame(gdf, "tiles", codes_path=str(codes_path))
+    assert list(tiles.columns) == ["code", "geometry"]
+    assert list(tiles["code"]) == [2, 1, 2, 0]
+    assert tiles.geometry.equals(gdf.geometry)
+    assert json.loads(codes_path.read_text(encoding="utf-8")) == {"1": "Gebäude - Wohnen", "2": "Wald"}
+    assert export_frame(gdf, "full", codes_path=str(codes_path)) is gdf
+    with pytest.raises(ValueError, match="profile"):
+        export_frame(gdf, "web", codes_path=str(codes_path))
+
+
+def test_codes_are_stable_across_runs(tmp_path):
+    codes_path = str(tmp_path / "landuseCodes.json")
+    export_frame(_nutzung("Wald", "Wiese"), "tiles", codes_path=codes_path)
+    # a value gone, new ones in between: existing codes stay, new ones go after the highest
+    second = export_frame(_nutzung("Acker", "Wiese", "Zoo"), "tiles", codes_path=codes_path)
+    assert list(second["code"]) == [3, 2, 4]
+    assert load_landuse_codes(codes_path) == {"Wald": 1, "Wiese": 2, "Acker": 3, "Zoo": 4}
+
+
+def test_categorical_nutzung():
+    values, codes = assign_landuse_codes(pd.Series(["b", None, "a"], dtype="category"), {"b": 5})
+    assert list(values) == [5, 0, 6] and codes == {"b": 5, "a": 6}
+
+
+def test_shipped_lookup_covers_the_palette():
+    # the frontend styles tiles by code: every mapped nutzung needs one, and codes are never reused
+    codes = load_landuse_codes(CODES_PATH)
+    assert sorted(codes.values()) == list(range(1, len(codes) + 1))
+    with open(COLORS_PATH, encoding="utf-8") as f:
+        assert set(json.load(f)["landuseMapping"]) <= set(codes)
+
+
+@pytest.fixture
+def wgs84(layers):
+    bb = layers["gdf_bodenbedeckung"]
+    return quantize(bb[["laufnr", "bs_art_txt", "geometry"]].to_crs(4326))
+
+
+@pytest.mark.parametrize("ext", [".geojson", ".geojsonl", ".fgb"])
+def test_round_trip(tmp_path, wgs84, ext):
+    path = write_features(wgs84, str(tmp_path / f"landuse{ext}"), batch_rows=10)
+    # FlatGeobuf stores the features in the order of its packed R-tree
+    back = gpd.read_file(path).sort_values("laufnr", ignore_index=True)
+    assert list(back["laufnr"]) == list(wgs84["laufnr"]) and list(back["bs_art_txt"]) == list(wgs84["bs_art_txt"])
+    assert back.crs.to_epsg() == 4326
+    assert shapely.equals_exact(back.geometry.values, wgs84.geometry.values, tolerance=1e-9).all()
+    assert not list(tmp_path.glob("*.tmp*"))
+
+
+def test_batches_do_not_change_the_bytes(tmp_path, wgs84):
+    one = write_features(wgs84, str(tmp_path / "a.geojsonl"), batch_rows=len(wgs84))
+    many = write_features(wgs84, str(tmp_path / "b.geojsonl"), batch_rows=7)
+    with open(one, "rb") as a, open(many, "rb") as b:
+        text = a.read()
+        assert text == b.read()
+    # one feature per line, no record separators, 7 decimals at most
+    lines = text.decode("utf-8").splitlines()
+    assert len(lines) == len(wgs84) and all(line.startswith("{") for line in lines)
+    numbers = [n for line in lines for n in json.loads(line)["geometry"]["coordinates"][0][0]]
+    assert all(len(repr(n).split(".")[1]) <= 7 for n in numbers)
+
+
+def test_unknown_extension(tmp_path, wgs84):
+    with pytest.raises(ValueError, match="extension"):
+        write_features(wgs84, str(tmp_path / "landuse.shp"))
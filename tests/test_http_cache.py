@@ -0,0 +1,92 @@
+"""HttpCache: revalidation by ETag, sha256 comparison without validators, and offline runs."""
+import http.server
+import threading
+
+import pytest
+import requests
+
+from landuse_etl.wfs import HttpCache, retry_session
+
+
+class _Server(http.server.BaseHTTPRequestHandler):
+    # /etag answers with an ETag and honours If-None-Match; /plain sends no
+    # validators. `body` is what either path currently serves.
+    body = b"v1"
+    requests = []
+
+    def log_message(self, *args):
+        pass
+
+    def do_GET(self):
+        type(self).requests.append((self.path, dict(self.headers)))
+        etag = f'"{len(self.body)}-{self.body.hex()}"'
+        if self.path.startswith("/etag") and self.headers.get("If-None-Match") == etag:
+            self.send_response(304)
+            self.send_header("ETag", etag)
+            self.end_headers()
+            return
+        self.send_response(200)
+        if self.path.startswith("/etag"):
+            self.send_header("ETag", etag)
+        self.send_header("Content-Type", "application/json")
+        self.send_header("Content-Length", str(len(self.body)))
+        self.end_headers()
+        self.wfile.write(self.body)
+
+
+@pytest.fixture
+def server():
+    _Server.body, _Server.requests = b"v1", []
+    httpd = http.server.ThreadingHTTPServer(("127.0.0.1", 0), _Server)
+    threading.Thread(target=httpd.serve_forever, kwargs={"poll_interval": 0.05}, daemon=True).start()
+    yield f"http://127.0.0.1:{httpd.server_port}"
+    httpd.shutdown()
+    httpd.server_close()
+
+
+def _get(cache, url):
+    resp = retry_session(total=0, backoff=0, cache=cache).get(url, timeout=10)
+    return resp.headers["X-Cache"], resp.content
+
+
+def test_etag_revalidation(tmp_path, server):
+    cache = HttpCache(str(tmp_path))
+    url = f"{server}/etag?b=2&a=1"
+    assert _get(cache, url) == ("miss", b"v1")
+    assert _get(cache, url) == ("revalidated", b"v1")
+    assert _Server.requests[-1][1].get("If-None-Match") == '"2-7631"'
+    _Server.body = b"v2"
+    assert _get(cache, url) == ("changed", b"v2")
+    assert _get(cache, url) == ("revalidated", b"v2")
+
+
+def test_query_order_does_not_matter(tmp_path, server):
+    cache = HttpCache(str(tmp_path))
+    _get(cache, f"{server}/etag?b=2&a=1")
+    assert _get(cache, f"{server}/etag?a=1&b=2")[0] == "revalidated"
+
+
+def test_sha256_without_validators(tmp_path, server):
+    cache = HttpCache(str(tmp_path))
+    url = f"{server}/plain"
+    assert _get(cache, url) == ("miss", b"v1")
+    # downloaded again, but recognised as the same body
+    assert _get(cache, url) == ("unchanged", b"v1")
+    assert "If-None-Match" not in _Server.requests[-1][1]
+    _Server.body = b"v2"
+    assert _get(cache, url) == ("changed", b"v2")
+    assert len(_Server.requests) == 3
+
+
+def test_offline_serves_from_disk(tmp_path, server):
+    url = f"{server}/plain"
+    _get(HttpCache(str(tmp_path)), url)
+    _Server.body = b"v2"
+    assert _get(HttpCache(str(tmp_path), offline=True), url) == ("offline", b"v1")
+    assert len(_Server.requests) == 1
+
+
+def test_offline_miss_fails(tmp_path, server):
+    with pytest.raises(requests.ConnectionError, match="Offline and not cached"):
+        _get(HttpCache(str(tmp_path), offline=True), f"{server}/plain")
+    assert _Server.requests == []
@@ -0,0 +1,63 @@
+"""An incremental run after a change gives what a full run over the changed layers gives."""
+import pandas as pd
+import shapely
+
+from landuse_etl.pipeline import Pipeline, PipelineConfig
+from landuse_etl.stages import BUILDING_BB, TARGET_BB
+
+
+def _classify(layers, state_dir, *, incremental):
+    config = PipelineConfig(incremental=incremental, state_dir=str(state_dir), checkpoints=False, profile_output=None)
+    pipeline = Pipeline(config)
+    # the layers stand in for the load stage
+    pipeline.results.update({name: gdf.copy() for name, gdf in layers.items()})
+    pipeline.timings["load"] = 0.0
+    pipeline.run(["classify"])
+    return pipeline
+
+
+def _changed(layers):
+    layers = {name: gdf.copy() for name, gdf in layers.items()}
+    bb = layers["gdf_bodenbedeckung"]
+    x0, y0 = bb.total_bounds[:2]
+    # a garden paved over, a building torn down
+    bb.loc[bb.index[bb["bs_art_txt"] == "humusiert.Gartenanlage"][0], "bs_art_txt"] = TARGET_BB
+    bb.loc[bb.index[bb["bs_art_txt"] == BUILDING_BB][-1], "bs_art_txt"] = "humusiert.Gartenanlage"
+    # a re-categorized building strip, a new public square and a new museum
+    layers["gdf_gebaeudekategorie"].loc[0, "gebaeudekategorieid"] = 1080
+    public = layers["gdf_oeffentlicher_raum"]
+    layers["gdf_oeffentlicher_raum"] = pd.concat(
+        [public, public.iloc[:1].assign(geometry=[shapely.box(x0 + 40, y0 + 40, x0 + 55, y0 + 52)])], ignore_index=True,
+    )
+    kultur = layers["gdf_kultur"]
+    layers["gdf_kultur"] = pd.concat(
+        [kultur, kultur.iloc[:1].assign(bi_subkategorie="Museum", geometry=[shapely.Point(x0 + 5, y0 + 75)])],
+        ignore_index=True,
+    )
+    return layers
+
+
+def test_incremental_equals_full(layers, tmp_path):
+    changed = _changed(layers)
+    _classify(layers, tmp_path / "state", incremental=True)
+    incremental = _classify(changed, tmp_path / "state", incremental=True)
+    full = _classify(changed, tmp_path / "full", incremental=False)
+
+    plan = incremental.results["incremental_plan"]
+    assert plan.mode == "incremental"
+    assert 0 < plan.n_affected < len(changed["gdf_bodenbedeckung"])
+
+    got, expected = incremental.results["gdf_nutzung"], full.results["gdf_nutzung"]
+    pd.testing.assert_frame_equal(
+        pd.DataFrame(got.drop(columns="geometry")), pd.DataFrame(expected.drop(columns="geometry")),
+    )
+    assert shapely.equals_exact(got.geometry.values, expected.geometry.values, tolerance=0).all()
+
+
+def test_unchanged_rerun_recomputes_nothing(layers, tmp_path):
+    first = _classify(layers, tmp_path, incremental=True)
+    second = _classify(layers, tmp_path, incremental=True)
+    assert second.results["incremental_plan"].n_affected == 0
+    pd.testing.assert_frame_equal(
+        pd.DataFrame(second.results["gdf_nutzung"]), pd.DataFrame(first.results["gdf_nutzung"]),
+    )
@@ -0,0 +1,42 @@
+"""The pairwise joins give what the gpd.overlay they replaced gave."""
+import geopandas as gpd
+import numpy as np
+import pandas as pd
+import pytest
+
+from landuse_etl.joins import majority, weighted_pairs
+
+
+def _overlay_shares(buildings, gk):
+    pieces = gpd.overlay(buildings[["laufnr", "geometry"]], gk, how="intersection", keep_geom_type=True)
+    pieces["area"] = pieces.geometry.area
+    pieces = pieces[pieces["area"] > 0]
+    total = buildings.set_index("laufnr").geometry.area
+    pieces["pct"] = pieces["area"] / total.reindex(pieces["laufnr"]).to_numpy() * 100.0
+    return pieces
+
+
+@pytest.mark.parametrize("by", ["feature", "value"])
+def test_majority_matches_overlay(layers, buildings, by):
+    gk = layers["gdf_gebaeudekategorie"]
+    best, stats = majority(weighted_pairs(buildings, gk, "laufnr", "gebaeudekategorieid", by=by), "laufnr", "gebaeudekategorieid")
+
+    pieces = _overlay_shares(buildings, gk)
+    if by == "value":
+        pieces = pieces.groupby(["laufnr", "gebaeudekategorieid"], as_index=False)["pct"].sum()
+    expected = pieces.loc[pieces.groupby("laufnr")["pct"].idxmax()].set_index("laufnr")
+
+    best = best.set_index("laufnr").sort_index()
+    assert stats["ambiguous"] > 0
+    assert (best.index == expected.index.sort_values()).all()
+    assert (best["gebaeudekategorieid"] == expected["gebaeudekategorieid"].reindex(best.index)).all()
+    weighed = best[best["ambiguous"]]
+    np.testing.assert_allclose(weighed["pct"], expected["pct"].reindex(weighed.index))
+
+
+def test_weighted_pairs_keeps_unmatched(layers, buildings):
+    gk = layers["gdf_gebaeudekategorie"]
+    far = buildings.iloc[:1].assign(laufnr=0, geometry=buildings.geometry.iloc[:1].translate(1000.0).values)
+    pairs = weighted_pairs(pd.concat([buildings, far], ignore_index=True), gk, "laufnr", "gebaeudekategorieid")
+    unmatched = pairs[pairs["laufnr"] == 0]
+    assert len(unmatched) == 1 and unmatched["gebaeudekategorieid"].isna().all()
@@ -0,0 +1,106 @@
+"""Low-memory runs classify like normal ones; the profiler checks peak RSS (workers included) against a budget."""
+import logging
+
+import pandas as pd
+import pytest
+
+from landuse_etl import profiling
+from landuse_etl import stages as st
+from landuse_etl.memory import compact_dtypes, layer_columns, project_columns
+from landuse_etl.pipeline import POI_POINTS, Pipeline, PipelineConfig
+from landuse_etl.profiling import Profiler
+
+MIB = 2**20
+
+
+def test_project_columns_keeps_geometry_and_order(layers):
+    bb = layers["gdf_bodenbedeckung"].assign(unused="x")
+    projected = project_columns(bb, {"laufnr", "bs_art_txt", "missing"})
+    assert list(projected.columns) == ["bs_art_txt", "geometry", "laufnr"]
+    assert project_columns(projected, {"laufnr", "bs_art_txt"}) is projected
+
+
+def test_compact_dtypes():
+    frame = pd.DataFrame({"nutzung": ["a", "b", "a", None], "kultur_dist_m": [0.5, 1.0, None, 2.0], "other": "x"})
+    compact = compact_dtypes(frame)
+    assert isinstance(compact["nutzung"].dtype, pd.CategoricalDtype) and compact["kultur_dist_m"].dtype == "float32"
+    assert compact["other"].dtype == frame["other"].dtype
+    assert list(compact["nutzung"].astype(object).where(compact["nutzung"].notna(), None)) == ["a", "b", "a", None]
+    assert compact_dtypes(compact) is compact
+
+
+def test_layer_columns_cover_the_rules():
+    columns = layer_columns(st.load_rules(), st.POI_LAYERS, POI_POINTS)
+    assert {"laufnr", "bs_art_txt", "gebaeudekategorieid", "oeffentlicher Raum", "geometry"} <= columns["gdf_bodenbedeckung"]
+    assert columns["gdf_kultur"] == {"bi_subkategorie"} and columns["gdf_schulstandorte"] == {"schultyp"}
+
+
+def _run(layers, tmp_path, monkeypatch, **config):
+    # the layers stand in for the WFS, with an attribute nothing reads
+    properties = []
+
+    def loader(name):
+        def load(*args, **kwargs):
+            if "properties" in kwargs:
+                properties.append(kwargs["properties"])
+            return layers[name].assign(unused="x")
+        return load
+
+    for name in layers:
+        monkeypatch.setattr(st, f"load_{name.removeprefix('gdf_')}", loader(name))
+    pipeline = Pipeline(PipelineConfig(state_dir=str(tmp_path), checkpoints=False, profile_output=None, **config))
+    pipeline.run(["classify"])
+    return pipeline, properties
+
+
+def test_low_memory_classifies_the_same(layers, tmp_path, monkeypatch):
+    normal, properties = _run(layers, tmp_path / "normal", monkeypatch)
+    assert properties == [None]
+    low, properties = _run(layers, tmp_path / "low", monkeypatch, low_memory=True)
+    # the Bodenbedeckung is asked only for the rule columns the pipeline does not attach itself
+    assert properties == [["bs_art_txt"]]
+
+    expected, got = normal.results["gdf_nutzung"], low.results["gdf_nutzung"]
+    assert "unused" in expected.columns and "unused" not in got.columns
+    for column in ("nutzung", "category", "color", "color_winter"):
+        assert isinstance(got[column].dtype, pd.CategoricalDtype)
+        assert list(got[column].astype(object)) == list(expected[column])
+    assert got["kultur_dist_m"].dtype == "float32"
+    pd.testing.assert_series_equal(got["kultur_dist_m"], expected["kultur_dist_m"].astype("float32"))
+    assert got.geometry.equals(expected.geometry)
+
+    # intermediates no stage left reads are gone; a normal run keeps them
+    assert {"gdf_all", "joined", "gdf_bodenbedeckung_cat", "coverage"} <= low.released
+    assert not {"gdf_all", "joined"} & set(low.results) and "gdf_all" in normal.results
+    with pytest.raises(KeyError, match="released"):
+        low.get("joined")
+
+
+@pytest.fixture
+def rss(monkeypatch):
+    # parent at 100 MiB, the largest worker at 300 MiB
+    monkeypatch.setattr(profiling, "_peak_rss_bytes", lambda children=False: (300 if children else 100) * MIB)
+
+
+@pytest.mark.parametrize("workers, over", [(1, False), (2, True)])
+def test_budget_counts_the_workers(rss, caplog, workers, over):
+    profiler = Profiler(budget_bytes=500 * MIB, workers=workers)
+    with caplog.at_level(logging.WARNING):
+        for name in ("first", "second"):
+            with profiler.stage(name):
+                pass
+    assert profiler.peak_rss_total() == (300 * MIB, (100 + 300 * workers) * MIB)
+    assert [r.metrics["over_budget"] for r in profiler.records] == [over, over]
+    report = profiler.report()["total"]
+    assert report["over_budget"] is over and report["budget_bytes"] == 500 * MIB
+    assert report["peak_rss_total_bytes"] == (100 + 300 * workers) * MIB
+    # one warning, for the first stage over the budget
+    warnings = [r.getMessage() for r in caplog.records if "memory budget" in r.getMessage()]
+    assert warnings == (["Peak RSS 700 MiB (workers included) went over the memory budget of 500 MiB in stage first"] if over else [])
+
+
+def test_no_budget_no_flag(rss):
+    profiler = Profiler()
+    with profiler.stage("stage"):
+        pass
+    assert "over_budget" not in profiler.records[0].metrics and "over_budget" not in profiler.report()["total"]
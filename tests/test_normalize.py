@@ -0,0 +1,54 @@
+"""Geometry normalization: repairs, snapping to the grid and repeated vertices."""
+import geopandas as gpd
+import numpy as np
+import shapely
+
+from landuse_etl.normalize import GRID_SIZE_M, _has_repeated_points, normalize_geometries, repair_stats
+
+SQUARE = [(0, 0), (10, 0), (10, 10), (0, 10)]
+
+
+def _normalize(*geoms):
+    frame = gpd.GeoDataFrame({"n": range(len(geoms))}, geometry=list(geoms), crs=2056)
+    frame, repairs = normalize_geometries(frame)
+    return frame.geometry.values, list(repairs)
+
+
+def test_repairs():
+    geoms, repairs = _normalize(
+        shapely.Polygon([(0.00012, 0.0004), (10, 0), (10, 10), (0, 10)]),
+        shapely.Polygon([(0, 0), (10, 10), (10, 0), (0, 10)]),              # bow tie
+        shapely.Polygon([*SQUARE[:3], (5, 0.0004), SQUARE[3]]),             # spike onto the bottom edge
+        shapely.box(0, 0, 0.0003, 0.0003),                                  # below the grid
+        shapely.Polygon([(0, 0), (10, 0), (10, 0.0002), (10, 10), (0, 10)]),
+        None,
+    )
+    assert repairs == ["", "invalid", "snapped_invalid", "collapsed", "repeated_points", ""]
+    assert geoms[5] is None
+    assert shapely.is_valid(geoms[:5]).all()
+    # on the grid, and kept on it for later overlays
+    coords = shapely.get_coordinates(geoms[[0, 1, 2, 4]])
+    np.testing.assert_allclose(coords, np.round(coords / GRID_SIZE_M) * GRID_SIZE_M, atol=1e-9)
+    assert (shapely.get_precision(geoms[[0, 1, 2, 4]]) == GRID_SIZE_M).all()
+    # too small for the grid: kept as loaded
+    assert shapely.equals_exact(geoms[3], shapely.box(0, 0, 0.0003, 0.0003), tolerance=0)
+    assert not _has_repeated_points(geoms[:5]).any()
+    assert repair_stats(np.array(repairs, dtype=object)) == {
+        "features": 6, "invalid": 1, "snapped_invalid": 1, "collapsed": 1, "repeated_points": 1,
+    }
+
+
+def test_repeated_points_in_every_kind_of_part():
+    hole = [(2, 2), (2, 4), (4, 4), (4, 4), (4, 2)]
+    geoms = np.array([
+        shapely.Polygon(SQUARE),
+        shapely.Polygon(SQUARE, [hole]),
+        shapely.MultiPolygon([shapely.Polygon(SQUARE), shapely.Polygon([(20, 0), (30, 0), (30, 0), (30, 10)])]),
+        shapely.LineString([(0, 0), (1, 1), (1, 1)]),
+        shapely.GeometryCollection([shapely.Point(0, 0), shapely.MultiLineString([[(0, 0), (1, 0)], [(2, 2), (2, 2), (3, 3)]])]),
+        shapely.GeometryCollection([shapely.Point(0, 0), shapely.Point(0, 0), shapely.Polygon(SQUARE)]),
+        None,
+        shapely.Polygon(),
+    ], dtype=object)
+    # a closing vertex repeats the first, but not the one before it
+    assert list(_has_repeated_points(geoms)) == [False, True, True, True, True, False, False, False]
@@ -0,0 +1,38 @@
+"""Spatial parts: every feature in exactly one part, and the land use does not depend on parts or workers."""
+import numpy as np
+import pandas as pd
+import shapely
+
+from landuse_etl.partition import spatial_parts
+from landuse_etl.pipeline import Pipeline, PipelineConfig
+
+
+def test_every_feature_in_one_part(layers):
+    geoms = layers["gdf_bodenbedeckung"].geometry.copy()
+    geoms.iloc[3] = None
+    parts = spatial_parts(geoms, part_rows=10)
+    assert len(parts) == 7 and max(len(p) for p in parts) <= 10
+    np.testing.assert_array_equal(np.sort(np.concatenate(parts)), np.arange(len(geoms)))
+
+
+def _nutzung(layers, tmp_path, **config):
+    pipeline = Pipeline(PipelineConfig(state_dir=str(tmp_path), checkpoints=False, profile_output=None, **config))
+    pipeline.results.update({name: gdf.copy() for name, gdf in layers.items()})
+    pipeline.timings["load"] = 0.0
+    pipeline.run(["classify"])
+    return pipeline.results["gdf_nutzung"]
+
+
+def test_parts_do_not_change_the_result(layers, tmp_path):
+    whole = _nutzung(layers, tmp_path / "a")
+    parted = _nutzung(layers, tmp_path / "b", part_rows=7)
+    pd.testing.assert_frame_equal(pd.DataFrame(parted.drop(columns="geometry")), pd.DataFrame(whole.drop(columns="geometry")))
+    assert shapely.equals_exact(parted.geometry.values, whole.geometry.values, tolerance=0).all()
+
+
+def test_workers_do_not_change_the_result(layers, tmp_path):
+    # the worker processes get the geometries without their precision grid and must put it back
+    whole = _nutzung(layers, tmp_path / "a")
+    parted = _nutzung(layers, tmp_path / "b", part_rows=7, workers=2)
+    pd.testing.assert_frame_equal(pd.DataFrame(parted.drop(columns="geometry")), pd.DataFrame(whole.drop(columns="geometry")))
+    assert shapely.equals_exact(parted.geometry.values, whole.geometry.values, tolerance=0).all()
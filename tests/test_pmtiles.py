@@ -0,0 +1,82 @@
+"""Tiles packed by write_pmtiles read back unchanged, including after a dirty-tile update."""
+import gzip
+import json
+import os
+
+from landuse_etl import pmtiles
+from landuse_etl.pmtiles import PMTilesReader, write_pmtiles, zxy_to_tileid
+
+
+def _write_tiles(tile_dir, tiles):
+    for (z, x, y), content in tiles.items():
+        path = os.path.join(tile_dir, str(z), str(x), f"{y}.pbf")
+        os.makedirs(os.path.dirname(path), exist_ok=True)
+        with open(path, "wb") as f:
+            f.write(content)
+
+
+def _tile_set(zooms, *, tag=b""):
+    # a few distinct tiles, the rest repeating contents (all water, all forest, ...)
+    tiles = {}
+    for z in zooms:
+        for x in range(8):
+            for y in range(8):
+                unique = (x + y) % 5 == 0
+                tiles[z, x, y] = tag + (f"{z}/{x}/{y}".encode() if unique else b"water")
+    return tiles
+
+
+def _read_back(path):
+    reader = PMTilesReader(path)
+    return reader, {tile_id: gzip.decompress(content) for tile_id, content in reader.tiles()}
+
+
+def test_round_trip(tmp_path):
+    tiles = _tile_set(range(12, 15))
+    _write_tiles(tmp_path / "tiles", tiles)
+    with open(tmp_path / "tiles" / "metadata.json", "w", encoding="utf-8") as f:
+        json.dump({"name": "landuse", "bounds": "7.55,47.52,7.70,47.60", "json": json.dumps({"vector_layers": []})}, f)
+
+    stats = write_pmtiles(str(tmp_path / "tiles"), str(tmp_path / "a.pmtiles"))
+    reader, stored = _read_back(tmp_path / "a.pmtiles")
+    assert stored == {zxy_to_tileid(*zxy): content for zxy, content in tiles.items()}
+    assert stats["contents"] < stats["tiles"] == len(tiles)
+    assert gzip.decompress(reader.tile(13, 3, 2)) == tiles[13, 3, 2]
+    assert reader.tile(15, 0, 0) is None
+    assert reader.metadata == {"name": "landuse", "bounds": "7.55,47.52,7.70,47.60", "vector_layers": []}
+    assert (reader.header["min_zoom"], reader.header["max_zoom"]) == (12, 14)
+
+    # deterministic: the same tiles give the same file
+    write_pmtiles(str(tmp_path / "tiles"), str(tmp_path / "b.pmtiles"))
+    assert (tmp_path / "a.pmtiles").read_bytes() == (tmp_path / "b.pmtiles").read_bytes()
+
+
+def test_leaf_directories(tmp_path, monkeypatch):
+    # a root too small for the directory: the entries go to leaves
+    monkeypatch.setattr(pmtiles, "ROOT_SIZE", 64)
+    monkeypatch.setattr(pmtiles, "LEAF_ENTRIES", 16)
+    tiles = {(10, x, y): f"{x}/{y}".encode() for x in range(30) for y in range(30)}
+    _write_tiles(tmp_path / "tiles", tiles)
+    stats = write_pmtiles(str(tmp_path / "tiles"), str(tmp_path / "a.pmtiles"))
+    reader, stored = _read_back(tmp_path / "a.pmtiles")
+    assert stats["leaf_directories"]
+    assert stored == {zxy_to_tileid(*zxy): content for zxy, content in tiles.items()}
+    assert gzip.decompress(reader.tile(10, 29, 17)) == b"29/17"
+
+
+def test_dirty_update(tmp_path):
+    tiles = _tile_set(range(12, 14))
+    _write_tiles(tmp_path / "tiles", tiles)
+    write_pmtiles(str(tmp_path / "tiles"), str(tmp_path / "a.pmtiles"))
+
+    # tippecanoe rebuilt two dirty tiles; one of them came out empty
+    dirty = {"12": [[1, 1], [2, 5]], "13": [[0, 0]]}
+    rebuilt = {(12, 1, 1): b"new 12/1/1", (13, 0, 0): b"new 13/0/0"}
+    _write_tiles(tmp_path / "dirty", rebuilt)
+    stats = write_pmtiles(str(tmp_path / "dirty"), str(tmp_path / "a.pmtiles"), dirty=dirty)
+
+    expected = {**tiles, **rebuilt}
+    del expected[12, 2, 5]
+    _, stored = _read_back(tmp_path / "a.pmtiles")
+    assert stored == {zxy_to_tileid(*zxy): content for zxy, content in expected.items()}
+    assert (stats["dirty"], stats["replaced"], stats["dropped"]) == (3, 2, 1)
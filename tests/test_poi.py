@@ -0,0 +1,65 @@
+"""Nearest POI per building: the BuildingIndex against the sjoin_nearest it replaced."""
+import geopandas as gpd
+import numpy as np
+import pandas as pd
+import pytest
+import shapely
+
+from landuse_etl.poi import BuildingIndex
+from landuse_etl.stages import build_nearest_point_to_building_mapping
+
+
+def _baseline(points_gdf, buildings_gdf, *, label_col, max_distance_m=0.0):
+    # the notebook's version
+    p = points_gdf[points_gdf[label_col].notna()].copy()
+    joined = gpd.sjoin_nearest(
+        p[[label_col, "geometry"]], buildings_gdf[["laufnr", "geometry"]], how="left", distance_col="dist_m",
+    )
+    mapping = (
+        joined.sort_values("dist_m", kind="stable")
+        .dropna(subset=["laufnr"])
+        .groupby("laufnr", as_index=False)
+        .first()[["laufnr", label_col, "dist_m"]]
+    )
+    mapping_filtered = mapping[mapping["dist_m"] <= max_distance_m].copy()
+    stats = {
+        "points_considered": int(p.shape[0]),
+        "buildings_matched": int(mapping["laufnr"].nunique()),
+        "max_distance_m": float(max_distance_m),
+    }
+    return mapping, mapping_filtered, stats
+
+
+def _assert_same(got, expected):
+    pd.testing.assert_frame_equal(
+        got.reset_index(drop=True), expected.reset_index(drop=True).astype({"laufnr": got["laufnr"].dtype}),
+        check_exact=False, atol=1e-9,
+    )
+
+
+@pytest.fixture
+def kultur(layers, buildings):
+    # points inside buildings, near them and far away, one without a label
+    x0, y0 = buildings.total_bounds[:2]
+    rng = np.random.default_rng(3)
+    xy = rng.uniform(-30, 110, size=(25, 2))
+    labels = rng.choice(["Museum", "Theater", None], size=25)
+    return gpd.GeoDataFrame({"bi_subkategorie": labels}, geometry=shapely.points(xy + [x0, y0]), crs=2056)
+
+
+@pytest.mark.parametrize("max_distance_m", [0.0, 4.0, 1000.0])
+def test_wrapper_matches_the_baseline(kultur, buildings, max_distance_m):
+    got = build_nearest_point_to_building_mapping(kultur, buildings, label_col="bi_subkategorie", max_distance_m=max_distance_m)
+    expected = _baseline(kultur, buildings, label_col="bi_subkategorie", max_distance_m=max_distance_m)
+    _assert_same(got[0], expected[0])
+    _assert_same(got[1], expected[1])
+    assert got[2] == expected[2]
+    assert len(got[1]) < len(got[0]) or max_distance_m == 1000.0
+
+
+@pytest.mark.parametrize("max_distance_m", [0.0, 4.0])
+def test_bounded_search_gives_the_filtered_mapping(kultur, buildings, max_distance_m):
+    mapping, stats = BuildingIndex(buildings).assign(kultur, label_col="bi_subkategorie", max_distance_m=max_distance_m)
+    _, expected, _ = _baseline(kultur, buildings, label_col="bi_subkategorie", max_distance_m=max_distance_m)
+    _assert_same(mapping, expected)
+    assert stats["buildings_matched"] == len(expected)
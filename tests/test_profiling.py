@@ -0,0 +1,37 @@
+"""The per-stage profiling report: timings, rows and vertices per stage, written as one JSON file."""
+import json
+
+from landuse_etl.profiling import Profiler, count_rows, count_vertices
+
+
+def test_counts(layers):
+    bb = layers["gdf_bodenbedeckung"]
+    # every grid cell is a closed ring of 5 coordinates
+    assert count_rows(bb) == len(bb) and count_vertices(bb) == 5 * len(bb)
+    assert count_rows([bb, bb.geometry, "not a frame"]) == 2 * len(bb)
+    assert count_vertices(bb.drop(columns="geometry")) == 0 and count_rows(None) == 0
+
+
+def test_report_per_stage(tmp_path, layers):
+    bb = layers["gdf_bodenbedeckung"]
+    profiler = Profiler()
+    with profiler.stage("select", inputs=bb) as rec:
+        rec.outputs = bb.iloc[:10]
+    path = tmp_path / "out" / "profile.json"
+    profiler.write(str(path))
+    report = json.loads(path.read_text())
+    stage, = report["stages"]
+    assert stage["stage"] == "select" and stage["wall_s"] >= 0
+    assert (stage["rows_in"], stage["rows_out"]) == (len(bb), 10)
+    assert (stage["vertices_in"], stage["vertices_out"]) == (5 * len(bb), 50)
+    assert report["total"]["wall_s"] == stage["wall_s"] and "budget_bytes" not in report["total"]
+    # the frames are not kept alive by the report, no temporary file is left behind
+    assert profiler.records[0].inputs is None and profiler.records[0].outputs is None
+    assert [p.name for p in path.parent.iterdir()] == ["profile.json"]
+
+
+def test_disabled_profiler_records_nothing(layers):
+    profiler = Profiler(enabled=False)
+    with profiler.stage("select", inputs=layers["gdf_bodenbedeckung"]) as rec:
+        rec.outputs = layers["gdf_bodenbedeckung"]
+    assert profiler.records == []
@@ -0,0 +1,76 @@
+"""Category raster: scanline fill and summed-area queries against cell-centre point-in-polygon tests."""
+import geopandas as gpd
+import numpy as np
+import pytest
+import shapely
+
+from landuse_etl.raster import load_category_raster, write_category_raster
+
+NAMES = ["building", "paved", "garden", "public"]
+
+
+@pytest.fixture
+def pieces(layers):
+    # the cells cut by the public-space discs: curved, non-overlapping features
+    bb = layers["gdf_bodenbedeckung"]
+    kind = bb["bs_art_txt"].map(dict(zip(sorted(bb["bs_art_txt"].unique()), NAMES[:3])))
+    public = shapely.union_all(layers["gdf_oeffentlicher_raum"].geometry.values)
+    geoms = np.concatenate([shapely.difference(bb.geometry.values, public), shapely.intersection(bb.geometry.values, public)])
+    categories = np.concatenate([kind.to_numpy(), np.full(len(bb), "public")])
+    keep = shapely.area(geoms) > 0
+    return gpd.GeoDataFrame({"category": categories[keep]}, geometry=geoms[keep], crs=2056)
+
+
+@pytest.fixture
+def raster(pieces, tmp_path):
+    path = str(tmp_path / "landuse.raster")
+    write_category_raster(pieces, pieces["category"], path, category_names=NAMES, cell_size=2.0, block=4, band_blocks=2)
+    return load_category_raster(path)
+
+
+def _centres(raster):
+    rows, cols = np.mgrid[0:raster.nrows, 0:raster.ncols]
+    return raster.x0 + (cols + 0.5) * raster.cell_size, raster.y0 + (rows + 0.5) * raster.cell_size
+
+
+def _brute_force_grid(raster, pieces):
+    xs, ys = _centres(raster)
+    points = shapely.points(xs.ravel(), ys.ravel())
+    p, f = shapely.STRtree(pieces.geometry.values).query(points, predicate="within")
+    grid = np.zeros(points.shape, dtype=np.uint8)
+    grid[p] = [NAMES.index(c) + 1 for c in pieces["category"].to_numpy()[f]]
+    return grid.reshape(xs.shape)
+
+
+def test_grid_matches_cell_centres(raster, pieces):
+    assert raster.nrows % raster.block == 0 and raster.nrows > 2 * 2 * raster.block  # several bands
+    np.testing.assert_array_equal(np.asarray(raster.grid), _brute_force_grid(raster, pieces))
+
+
+def _brute_force_counts(raster, member):
+    xs, ys = _centres(raster)
+    cells = np.asarray(raster.grid)[member(xs, ys)]
+    return np.bincount(cells, minlength=len(NAMES) + 1)[1:]
+
+
+@pytest.mark.parametrize("dx, dy, radius", [(40, 40, 25), (3, 77, 13), (61.3, 18.9, 7.1), (40, 40, 500)])
+def test_circle_counts(raster, dx, dy, radius):
+    x, y = raster.x0 + dx, raster.y0 + dy
+    expected = _brute_force_counts(raster, lambda px, py: (px - x) ** 2 + (py - y) ** 2 <= radius ** 2)
+    np.testing.assert_array_equal(raster.counts_circle(x, y, radius), expected)
+
+
+def test_polygon_counts(raster):
+    x0, y0 = raster.x0, raster.y0
+    region = shapely.Polygon([(x0 + 3, y0 + 1), (x0 + 71, y0 + 22), (x0 + 30, y0 + 66), (x0 + 12, y0 + 40)])
+    expected = _brute_force_counts(raster, lambda px, py: shapely.contains_xy(region, px, py))
+    np.testing.assert_array_equal(raster.counts_polygon(region), expected)
+    sizes = raster.composition(region)
+    assert sizes["sumSizes"] == pytest.approx(expected.sum() * raster.cell_size ** 2)
+    assert sum(v["p"] for v in sizes["sizes"].values()) == pytest.approx(100)
+
+
+def test_read_without_mmap(raster):
+    loaded = load_category_raster(raster.path, mmap=False)
+    np.testing.assert_array_equal(loaded.grid, raster.grid)
+    np.testing.assert_array_equal(loaded.sat, raster.sat)
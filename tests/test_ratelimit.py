@@ -0,0 +1,96 @@
+"""The shared token bucket paces requests, and Retry-After holds back every thread."""
+import http.server
+import threading
+import time
+
+import pytest
+from urllib3.response import HTTPResponse
+
+from landuse_etl.wfs import RateLimiter, _LimitedRetry, retry_session
+
+
+def test_rate_is_kept():
+    limiter = RateLimiter(20, burst=1)
+    t0 = time.monotonic()
+    for _ in range(6):
+        limiter.acquire()
+    # the first token is there from the start, the other five take 1/20 s each
+    assert time.monotonic() - t0 >= 5 / 20 * 0.9
+
+
+def test_burst_is_free():
+    limiter = RateLimiter(1, burst=4)
+    t0 = time.monotonic()
+    for _ in range(4):
+        limiter.acquire()
+    assert time.monotonic() - t0 < 0.5
+
+
+def test_rate_must_be_positive():
+    with pytest.raises(ValueError):
+        RateLimiter(0)
+
+
+def test_defer_blocks_every_thread():
+    limiter = RateLimiter(1000, burst=4)
+    limiter.defer(0.3)
+    waited = []
+
+    def worker():
+        t0 = time.monotonic()
+        limiter.acquire()
+        waited.append(time.monotonic() - t0)
+
+    threads = [threading.Thread(target=worker) for _ in range(3)]
+    for t in threads:
+        t.start()
+    for t in threads:
+        t.join()
+    assert len(waited) == 3 and min(waited) >= 0.25
+
+
+def test_retry_after_defers_the_limiter():
+    limiter = RateLimiter(1000, burst=4)
+    retry = _LimitedRetry(total=2, limiter=limiter)
+    t0 = time.monotonic()
+    retry.sleep(HTTPResponse(status=429, headers={"Retry-After": "1"}))
+    # the retry itself waited, and so would every other caller of the limiter
+    assert time.monotonic() - t0 >= 0.9
+    assert retry.new(total=1).limiter is limiter
+
+
+class _Throttling(http.server.BaseHTTPRequestHandler):
+    # 429 with Retry-After on the first request, 200 afterwards
+    hits = []
+
+    def log_message(self, *args):
+        pass
+
+    def do_GET(self):
+        self.hits.append(time.monotonic())
+        if len(self.hits) == 1:
+            self.send_response(429)
+            self.send_header("Retry-After", "1")
+            self.send_header("Content-Length", "0")
+            self.end_headers()
+            return
+        body = b"ok"
+        self.send_response(200)
+        self.send_header("Content-Length", str(len(body)))
+        self.end_headers()
+        self.wfile.write(body)
+
+
+def test_session_honours_retry_after():
+    server = http.server.ThreadingHTTPServer(("127.0.0.1", 0), _Throttling)
+    threading.Thread(target=server.serve_forever, daemon=True).start()
+    try:
+        limiter = RateLimiter(1000, burst=4)
+        session = retry_session(backoff=0, rate_limiter=limiter)
+        resp = session.get(f"http://127.0.0.1:{server.server_port}/", timeout=10)
+        assert resp.status_code == 200 and resp.content == b"ok"
+        hits = _Throttling.hits
+        assert len(hits) == 2 and hits[1] - hits[0] >= 0.9
+    finally:
+        server.shutdown()
+        server.server_close()
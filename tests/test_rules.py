@@ -0,0 +1,117 @@
+"""NutzungRules: the shipped rules against the hand-written classification they replaced."""
+import geopandas as gpd
+import pandas as pd
+import pytest
+import shapely
+
+from landuse_etl.rules import POI_COLUMN, NutzungRules
+from landuse_etl.stages import BUILDING_BB, TARGET_BB, _classify_rows, load_color_config, load_rules
+
+CODE2DE = {
+    "1010": "Provisorische Unterkunft",
+    "1020": "Gebäude ausschliesslich für Wohnnutzung",
+    "1021": "Einfamilienhaus, ohne Nebennutzung",
+    "1025": "Mehrfamilienhaus, ohne Nebennutzung",
+    "1030": "Wohngebäude mit Nebennutzung",
+    "1040": "Gebäude mit teilweiser Wohnnutzung",
+    "1060": "Gebäude ohne Wohnnutzung",
+    "1080": "Sonderbau",
+}
+
+
+def _baseline(gdf, kultur, schulen, color_config, season="always"):
+    # the notebook's version; `kultur` and `schulen` hold the matched POI label per row
+    def clean_bs_art(s):
+        if pd.isna(s): return None
+        return str(s).replace(".", " - ").replace("_", " ")
+
+    def norm_code(x):
+        if pd.isna(x): return None
+        if isinstance(x, int): return str(x)
+        if isinstance(x, float): return str(int(x))
+        return str(x).strip()
+
+    nutzung = gdf["bs_art_txt"].map(clean_bs_art)
+    code = gdf["gebaeudekategorieid"].apply(norm_code)
+    has_code = code.notna()
+    nutzung[has_code] = "Gebäude - " + code[has_code].map(lambda c: CODE2DE.get(c, c))
+    mask_ps = (gdf["bs_art_txt"] == TARGET_BB) & gdf["oeffentlicher Raum"].notna() & ~has_code
+    nutzung[mask_ps] = "befestigt - uebrige befestigte - " + gdf.loc[mask_ps, "oeffentlicher Raum"].astype(str)
+    bldg_mask = gdf["bs_art_txt"].eq(BUILDING_BB) & gdf.geometry.notna()
+    for labels in (kultur, schulen):
+        override = bldg_mask & labels.notna()
+        nutzung[override] = "Gebäude - " + labels[override].astype(str)
+
+    palette = color_config["palettes"][season]
+
+    def color(n):
+        if pd.isna(n):
+            return palette.get("other", "#ffffff")
+        return palette.get(color_config["landuseMapping"].get(str(n).strip(), "other"), "#ffffff")
+
+    return nutzung, nutzung.map(color)
+
+
+@pytest.fixture
+def frame():
+    # every combination the rules tell apart; codes come as floats, ints, padded strings and unknown values
+    rows = [
+        (bs_art, code, public, kultur, schule)
+        for bs_art in [BUILDING_BB, TARGET_BB, "humusiert.Gartenanlage", None]
+        for code in [None, 1025.0, 1080, " 1060 ", 4711]
+        for public in [None, "Platz"]
+        for kultur in [None, "Museum"]
+        for schule in [None, "Primarschule"]
+    ]
+    columns = ["bs_art_txt", "gebaeudekategorieid", "oeffentlicher Raum", "kultur", "schulen"]
+    geometry = [shapely.box(i, 0, i + 1, 1) if i % 7 else None for i in range(len(rows))]
+    return gpd.GeoDataFrame(pd.DataFrame(rows, columns=columns, dtype=object), geometry=geometry, crs=2056)
+
+
+def test_shipped_rules_match_the_baseline(frame):
+    color_config = load_color_config()
+    rows = frame.rename(columns={name: POI_COLUMN.format(name) for name in ["kultur", "schulen"]})
+    got = NutzungRules(load_rules(), color_config).apply(rows)
+    assert list(got.index) == list(frame.index)
+    for season in color_config["palettes"]:
+        nutzung, color = _baseline(frame, frame["kultur"], frame["schulen"], color_config, season)
+        assert list(got["nutzung"]) == list(nutzung)
+        assert list(got["color" if season == "always" else f"color_{season}"]) == list(color)
+    # every branch is exercised
+    assert {"Gebäude - Museum", "Gebäude - Primarschule", "Gebäude - Sonderbau", "Gebäude - 4711",
+            "befestigt - uebrige befestigte - Platz", "humusiert - Gartenanlage"} <= set(got["nutzung"])
+    assert got["nutzung"].isna().any()
+
+
+def test_classify_rows_merges_the_poi_mappings(frame):
+    color_config = load_color_config()
+    gdf_all = frame.drop(columns=["kultur", "schulen"]).assign(laufnr=range(1, len(frame) + 1))
+    mappings = {
+        "kultur": pd.DataFrame({"laufnr": gdf_all["laufnr"], "bi_subkategorie": frame["kultur"], "dist_m": 0.0}).dropna(),
+        "schulen": pd.DataFrame({"laufnr": gdf_all["laufnr"], "schultyp": frame["schulen"], "dist_m": 0.0}).dropna(),
+    }
+    got = _classify_rows(gdf_all, mappings, load_rules(), color_config)
+    nutzung, color = _baseline(frame, frame["kultur"], frame["schulen"], color_config)
+    assert list(got["nutzung"]) == list(nutzung) and list(got["color"]) == list(color)
+    assert not any(column.startswith("_poi_") for column in got.columns)
+    assert list(got.columns[: len(gdf_all.columns) + 1]) == list(gdf_all.columns) + ["nutzung"]
+
+
+def test_later_rules_override_earlier_ones():
+    rules = {"rules": [
+        {"column": "a"},
+        {"column": "b", "where": {"kind": ["x", "y"]}, "template": "B {value}"},
+        {"column": "c", "present": ["b"], "lookup": {"1": "one"}},
+    ]}
+    color_config = {"landuseMapping": {"one": "cat"}, "palettes": {"always": {"cat": "#111111", "other": "#eeeeee"}, "summer": {}}}
+    frame = pd.DataFrame({
+        "a": ["a0", "a1", "a2", None],
+        "b": ["b0", "b1", None, "b3"],
+        "c": ["1", None, "1", None],
+        "kind": ["x", "z", "y", "y"],
+    })
+    got = NutzungRules(rules, color_config).apply(frame)
+    assert list(got["nutzung"]) == ["one", "a1", "a2", "B b3"]
+    assert list(got["category"]) == ["cat", "other", "other", "other"]
+    assert list(got["color"]) == ["#111111", "#eeeeee", "#eeeeee", "#eeeeee"]
+    assert list(got["color_summer"]) == ["#ffffff"] * 4
@@ -0,0 +1,120 @@
+"""SVG export: path data from the vectorized coordinate pass, streamed in chunks."""
+import re
+
+import geopandas as gpd
+import pytest
+import shapely
+
+from landuse_etl.svg import export_to_svg
+
+
+def _paths(path):
+    with open(path, encoding="utf-8") as f:
+        return re.findall(r'<path d="([^"]*)" fill="([^"]*)"', f.read())
+
+
+def _square(x0, y0, size):
+    return [(x0, y0), (x0 + size, y0), (x0 + size, y0 + size), (x0, y0 + size)]
+
+
+def _squares():
+    with_hole = shapely.Polygon(_square(0, 0, 10), [_square(2, 2, 2)])
+    two = shapely.MultiPolygon([shapely.Polygon(_square(10, 0, 2)), shapely.Polygon(_square(10, 8, 2))])
+    return gpd.GeoDataFrame(
+        {"color": ["#ff0000", None, "#00ff00"]}, geometry=[with_hole, two, shapely.Point(5, 5)], crs=2056,
+    )
+
+
+def test_path_data(tmp_path):
+    out = tmp_path / "a.svg"
+    export_to_svg(_squares(), str(out), width=120, precision=1)
+    # 10 px per metre, y flipped: (0, 0) is the bottom-left corner at y=100
+    assert _paths(out) == [
+        ("M 0.0 100.0 L 100.0 100.0 L 100.0 0.0 L 0.0 0.0 L 0.0 100.0 Z "
+         "M 20.0 80.0 L 40.0 80.0 L 40.0 60.0 L 20.0 60.0 L 20.0 80.0 Z", "#ff0000"),
+        # no colour: white
+        ("M 100.0 100.0 L 120.0 100.0 L 120.0 80.0 L 100.0 80.0 L 100.0 100.0 Z "
+         "M 100.0 20.0 L 120.0 20.0 L 120.0 0.0 L 100.0 0.0 L 100.0 20.0 Z", "#ffffff"),
+        ("M 50.0 50.0 L 50.0 50.0", "#00ff00"),
+    ]
+    assert 'width="120" height="100" viewBox="0 0 120 100"' in out.read_text()
+
+
+def test_chunks_give_the_same_bytes(tmp_path, layers):
+    gdf = layers["gdf_bodenbedeckung"].assign(color="#123456")
+    outputs = []
+    for chunk_size in (1, 7, 10000):
+        out = tmp_path / f"{chunk_size}.svg"
+        export_to_svg(gdf, str(out), chunk_size=chunk_size)
+        outputs.append(out.read_bytes())
+    assert outputs[0] == outputs[1] == outputs[2]
+    assert len(_paths(tmp_path / "1.svg")) == len(gdf)
+
+
+def test_empty_and_missing_geometries_are_skipped(tmp_path):
+    gdf = gpd.GeoDataFrame(
+        {"color": ["#ff0000"] * 3}, geometry=[shapely.box(0, 0, 1, 1), None, shapely.Polygon()], crs=2056,
+    )
+    export_to_svg(gdf, str(tmp_path / "a.svg"))
+    assert len(_paths(tmp_path / "a.svg")) == 1
+
+
+def test_color_column_is_required(tmp_path):
+    gdf = gpd.GeoDataFrame(geometry=[shapely.box(0, 0, 1, 1)], crs=2056)
+    with pytest.raises(ValueError, match="color"):
+        export_to_svg(gdf, str(tmp_path / "a.svg"))
+
+
+def _coordinates(path):
+    return [tuple(map(float, xy)) for d, _ in _paths(path) for xy in re.findall(r"(-?[\d.]+) (-?[\d.]+)", d)]
+
+
+def test_lod_draws_only_the_clipped_view(tmp_path, layers):
+    gdf = layers["gdf_bodenbedeckung"].assign(color="#123456")
+    x0, y0 = gdf.total_bounds[:2]
+    view = (x0 + 15, y0 + 15, x0 + 45, y0 + 35)
+    out = tmp_path / "lod.svg"
+    export_to_svg(gdf, str(out), bounds=view, width=300, lod=True)
+    # cells touching the view only along an edge clip to nothing and are left out
+    inside = gdf.geometry.intersection(shapely.box(*view)).area > 0
+    assert len(_paths(out)) == inside.sum() < len(gdf)
+    assert all(0 <= x <= 300 and 0 <= y <= 200 for x, y in _coordinates(out))
+
+
+def test_lod_simplification_keeps_shared_borders(layers):
+    # public-space discs cut into cells: simplified, the pieces still tile the region
+    from landuse_etl.svg import _lod_geometries
+
+    cells = layers["gdf_bodenbedeckung"]
+    discs = shapely.union_all(layers["gdf_oeffentlicher_raum"].geometry.values)
+    pieces = shapely.get_parts(shapely.intersection(cells.geometry.values, discs))
+    pieces = pieces[shapely.get_type_id(pieces) == shapely.GeometryType.POLYGON]
+    region = shapely.box(*cells.total_bounds)
+    tree = shapely.STRtree(pieces)
+    _, simplified = _lod_geometries(pieces, tree, region, tolerance=1.5)
+    assert shapely.get_num_coordinates(simplified).sum() < shapely.get_num_coordinates(pieces).sum()
+    overlap = sum(shapely.intersection(a, b).area for i, a in enumerate(simplified) for b in simplified[i + 1:])
+    assert overlap < 1e-6
+    assert shapely.union_all(simplified).area == pytest.approx(sum(g.area for g in simplified))
+
+
+def test_one_svg_per_district(tmp_path, layers):
+    from landuse_etl.svg import export_district_svgs
+
+    gdf = layers["gdf_bodenbedeckung"].assign(color="#123456")
+    x0, y0, x1, y1 = gdf.total_bounds
+    districts = gpd.GeoDataFrame(
+        {"id": [7, 8, 9]},
+        geometry=[
+            shapely.Polygon([(x0, y0), (x1, y0), (x0, y1)]),   # lower-left triangle
+            shapely.box(x0 + 40, y0 + 40, x1, y1),              # upper-right quarter
+            shapely.box(x1 + 100, y1 + 100, x1 + 200, y1 + 200),  # no features at all
+        ],
+        crs=2056,
+    )
+    paths = export_district_svgs(gdf, districts, str(tmp_path), prefix="wk", width=200)
+    assert [p.rsplit("/", 1)[-1] for p in paths] == ["wk-7.svg", "wk-8.svg", "wk-9.svg"]
+    for path, region in zip(paths, districts.geometry):
+        expected = (gdf.geometry.intersection(region).area > 1e-9).sum()
+        assert len(_paths(path)) == expected
+    assert len(_paths(paths[1])) == 16 and _paths(paths[2]) == []
@@ -0,0 +1,90 @@
+"""Dirty-tile planning: which tiles a run changed, and when its tile state takes over."""
+import json
+import os
+
+import pytest
+import shapely
+
+from landuse_etl.tilediff import PENDING_FILE, STATE_FILE, diff_tiles, plan_tile_changes, promote_tile_state, tile_state, tiles_for_bounds
+
+ZOOMS = [14, 17]
+
+
+@pytest.fixture
+def features(layers):
+    bb = layers["gdf_bodenbedeckung"]
+    return bb[["bs_art_txt", "geometry"]].rename(columns={"bs_art_txt": "nutzung"}).to_crs(4326), bb["laufnr"].to_numpy()
+
+
+def _plan(state_dir, out_dir, gdf, fids):
+    return plan_tile_changes(str(state_dir), gdf, fids, str(out_dir), zooms=ZOOMS)
+
+
+def test_first_run_is_full_and_pending(tmp_path, features):
+    gdf, fids = features
+    changes = _plan(tmp_path / "state", tmp_path / "out", gdf, fids)
+    assert changes["mode"] == "full" and "no tile state" in changes["reason"]
+    assert json.loads((tmp_path / "out" / "changes.json").read_text())["mode"] == "full"
+    assert os.path.exists(tmp_path / "state" / PENDING_FILE) and not os.path.exists(tmp_path / "state" / STATE_FILE)
+    assert promote_tile_state(str(tmp_path / "state"))
+    assert os.path.exists(tmp_path / "state" / STATE_FILE) and not promote_tile_state(str(tmp_path / "state"))
+
+
+def test_unchanged_rerun_keeps_the_tiles(tmp_path, features):
+    gdf, fids = features
+    _plan(tmp_path / "state", tmp_path / "out", gdf, fids)
+    promote_tile_state(str(tmp_path / "state"))
+    changes = _plan(tmp_path / "state", tmp_path / "out", gdf, fids)
+    assert changes["mode"] == "none"
+    assert not os.path.exists(tmp_path / "state" / PENDING_FILE)
+
+
+def test_one_changed_feature_dirties_its_tiles(tmp_path, features):
+    gdf, fids = features
+    _plan(tmp_path / "state", tmp_path / "out", gdf, fids)
+    promote_tile_state(str(tmp_path / "state"))
+
+    changed = gdf.copy()
+    changed.loc[changed.index[10], "nutzung"] = "Wald"
+    changes = _plan(tmp_path / "state", tmp_path / "out", changed, fids)
+    assert changes["mode"] == "dirty"
+    assert changes["stats"]["modified"] == 1 and changes["stats"]["added"] == changes["stats"]["removed"] == 0
+    bounds = changed.geometry.iloc[10].bounds
+    for z in ZOOMS:
+        assert {tuple(xy) for xy in changes["tiles"][str(z)]} == tiles_for_bounds(bounds, z)
+        # the whole 80 m test grid lies within one tile even at zoom 17
+        lines = (tmp_path / "out" / f"z{z}.geojsonl").read_text().splitlines()
+        assert len(lines) == len(changed) and sum('"Wald"' in line for line in lines) == 1
+
+    # the tiles were not built: the next run plans against the previous state again
+    assert _plan(tmp_path / "state", tmp_path / "out", changed, fids)["mode"] == "dirty"
+    promote_tile_state(str(tmp_path / "state"))
+    assert _plan(tmp_path / "state", tmp_path / "out", changed, fids)["mode"] == "none"
+    assert not list((tmp_path / "out").glob("z*.geojsonl"))
+
+
+def test_many_changes_rebuild_everything(tmp_path, features):
+    gdf, fids = features
+    _plan(tmp_path / "state", tmp_path / "out", gdf, fids)
+    promote_tile_state(str(tmp_path / "state"))
+    changes = _plan(tmp_path / "state", tmp_path / "out", gdf.assign(nutzung="Wald"), fids)
+    assert changes["mode"] == "full" and changes["reason"] == f"{len(gdf)} of {len(gdf)} features changed"
+
+
+def test_diff_counts(features):
+    gdf, fids = features
+    previous = tile_state(gdf.iloc[:-1], fids[:-1])
+    moved = gdf.iloc[1:].copy()
+    moved.loc[moved.index[0], "geometry"] = shapely.affinity.translate(moved.geometry.iloc[0], 0.001)
+    dirty, stats = diff_tiles(previous, tile_state(moved, fids[1:]), zooms=ZOOMS)
+    assert (stats["added"], stats["removed"], stats["modified"]) == (1, 1, 1)
+    assert set(dirty) == set(ZOOMS)
+
+
+def test_buffer_reaches_neighbouring_tiles():
+    # a point just inside the west edge of a zoom-14 tile
+    west = -180.0 + 8590 / (1 << 14) * 360.0
+    point = (west + 1e-6, 47.56, west + 1e-6, 47.56)
+    (x, y), = tiles_for_bounds(point, 14, buffer=0.0)
+    assert x == 8590
+    assert tiles_for_bounds(point, 14) == {(8589, y), (8590, y)}
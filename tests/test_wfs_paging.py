@@ -0,0 +1,158 @@
+"""GetFeature paging: to numberMatched where the server reports it, to a short page where it does not."""
+import json
+import logging
+import random
+
+import pytest
+
+from landuse_etl.wfs import getfeature_pages
+
+
+class _Response:
+    def __init__(self, content, ok=True):
+        self.content = content
+        self.ok = ok
+
+    def close(self):
+        pass
+
+
+class FakeWFS:
+    """
+    A GetFeature endpoint over `n` point features. `max_features` caps every
+    page (MapServer's maxFeatures), `stop_at` makes later pages come back
+    empty, `matched` toggles numberMatched and `ignore_count` sends every
+    feature at once. Unless sorted on fid, every request sees the features in
+    another order, as a database without ORDER BY may return them;
+    `attributes=False` leaves nothing to sort on.
+    """
+    def __init__(self, n, *, max_features=None, matched=True, stop_at=None, ignore_count=False, attributes=True):
+        self.features = [
+            {"type": "Feature", "id": f"layer.{i}", "properties": {"fid": i},
+             "geometry": {"type": "Point", "coordinates": [2611000.0 + i, 1267000.0]}}
+            for i in range(n)
+        ]
+        if not attributes:
+            for f in self.features:
+                f["properties"] = {}
+        self.max_features = max_features
+        self.matched = matched
+        self.stop_at = stop_at
+        self.ignore_count = ignore_count
+        self.requests = []
+
+    def get(self, url, params=None, timeout=None):
+        params = dict(params)
+        self.requests.append(params)
+        start = int(params.get("startIndex", 0))
+        count = len(self.features) if self.ignore_count or "count" not in params else int(params["count"])
+        if self.max_features:
+            count = min(count, self.max_features)
+        available = self.features[:self.stop_at] if self.stop_at is not None else self.features
+        if params.get("sortBy") != "fid ASC":
+            available = random.Random(len(self.requests)).sample(available, len(available))
+        page = available[start:start + count]
+        collection = {"type": "FeatureCollection", "features": page, "numberReturned": len(page)}
+        if self.matched:
+            collection["numberMatched"] = len(self.features)
+        return _Response(json.dumps(collection).encode())
+
+
+def _fids(pages):
+    return sorted(fid for page in pages for fid in page["fid"])
+
+
+def _paged(server):
+    # the requests for pages, without the one-feature probe for the sort key
+    return [r for r in server.requests if r.get("count") != 1]
+
+
+def test_pages_to_number_matched_past_a_server_cap():
+    server = FakeWFS(23, max_features=4)
+    pages = getfeature_pages(server, "http://wfs", "layer", page_size=10)
+    # every page comes back short of the 10 asked for; numberMatched says there is more
+    assert _fids(pages) == list(range(23))
+    assert [r["startIndex"] for r in _paged(server)] == [0, 4, 8, 12, 16, 20]
+    assert all(page.crs.to_epsg() == 2056 for page in pages)
+
+
+def test_short_page_ends_a_layer_without_number_matched():
+    server = FakeWFS(12, matched=False)
+    pages = getfeature_pages(server, "http://wfs", "layer", page_size=5)
+    assert _fids(pages) == list(range(12))
+    assert [r["startIndex"] for r in _paged(server)] == [0, 5, 10]
+
+
+def test_full_last_page_needs_an_empty_one_without_number_matched():
+    server = FakeWFS(10, matched=False)
+    pages = getfeature_pages(server, "http://wfs", "layer", page_size=5)
+    assert _fids(pages) == list(range(10))
+    assert len(_paged(server)) == 3
+
+
+def test_server_ignoring_count():
+    server = FakeWFS(12, matched=False, ignore_count=True)
+    pages = getfeature_pages(server, "http://wfs", "layer", page_size=5)
+    assert _fids(pages) == list(range(12))
+    assert len(_paged(server)) == 1
+
+
+def test_layer_short_of_number_matched_warns(caplog):
+    server = FakeWFS(12, stop_at=7)
+    with caplog.at_level(logging.WARNING):
+        pages = getfeature_pages(server, "http://wfs", "layer", page_size=5)
+    assert _fids(pages) == list(range(7))
+    assert "got 7 of 12 features" in caplog.text
+
+
+def test_unpaged_request():
+    server = FakeWFS(12)
+    pages = getfeature_pages(server, "http://wfs", "layer", page_size=None)
+    assert _fids(pages) == list(range(12))
+    assert len(server.requests) == 1 and "count" not in server.requests[0]
+
+
+def test_empty_layer_keeps_one_page():
+    server = FakeWFS(0)
+    pages = getfeature_pages(server, "http://wfs", "layer", page_size=5)
+    assert len(pages) == 1 and pages[0].empty
+
+
+def test_pages_are_sorted_on_the_first_attribute():
+    server = FakeWFS(23)
+    pages = getfeature_pages(server, "http://wfs", "layer", page_size=5)
+    probe, *paged = server.requests
+    assert probe["count"] == 1 and "sortBy" not in probe
+    assert all(r["sortBy"] == "fid ASC" for r in paged)
+    assert [fid for page in pages for fid in page["fid"]] == list(range(23))
+
+
+def test_sort_key_comes_along_with_narrowed_attributes():
+    server = FakeWFS(12)
+    pages = getfeature_pages(server, "http://wfs", "layer", page_size=5, properties=["name"])
+    probe, *paged = server.requests
+    assert "propertyName" not in probe
+    assert all(r["propertyName"].split(",")[0] == "fid" for r in paged)
+    # the server sent fid for sorting only; it is not handed on
+    assert all("fid" not in page.columns for page in pages)
+
+
+def test_one_page_layer_is_not_sorted():
+    server = FakeWFS(4)
+    getfeature_pages(server, "http://wfs", "layer", page_size=5)
+    assert len(server.requests) == 2 and all("sortBy" not in r for r in server.requests)
+
+
+def test_overlapping_pages_are_rejected():
+    # without an attribute to sort on, the unstable order repeats features across pages
+    server = FakeWFS(40, attributes=False)
+    with pytest.raises(RuntimeError, match="on more than one page"):
+        getfeature_pages(server, "http://wfs", "layer", page_size=10)
+
+
+def test_unsorted_paging_on_request():
+    server = FakeWFS(40, matched=False)
+    with pytest.raises(RuntimeError, match="on more than one page"):
+        getfeature_pages(server, "http://wfs", "layer", page_size=10, sort_by=None)
+    assert all("sortBy" not in r for r in server.requests)
+    assert [r["startIndex"] for r in server.requests] == [0, 10, 20, 30, 40]
@@ -0,0 +1,40 @@
+"""GetFeature parameters: the attributes the stages read and an optional bbox, nothing else."""
+import geopandas as gpd
+import pytest
+import shapely
+
+from landuse_etl import stages as st
+from landuse_etl.wfs import GEOMETRY_PROPERTY, getfeature_params
+
+
+def test_projection_bbox_and_sorting():
+    params = getfeature_params("ms:BI_KulturUnterhaltung", properties=("bi_subkategorie",), bbox=(2611000, 1267000.5, 2612000, 1268000), sort_by="fid")
+    assert params["propertyName"] == f"bi_subkategorie,{GEOMETRY_PROPERTY}"
+    assert params["bbox"] == "2611000.0,1267000.5,2612000.0,1268000.0,urn:ogc:def:crs:EPSG::2056"
+    assert params["sortBy"] == "fid ASC" and params["srsName"] == "EPSG:2056"
+    # geometry only, and the full layer by default
+    assert getfeature_params("ms:OR", properties=())["propertyName"] == GEOMETRY_PROPERTY
+    assert not {"propertyName", "bbox", "filter", "sortBy"} & set(getfeature_params("ms:OR"))
+
+
+def test_filter_and_bbox_do_not_combine():
+    assert getfeature_params("ms:OR", fes_filter="<fes:Filter/>")["filter"] == "<fes:Filter/>"
+    with pytest.raises(ValueError, match="bbox"):
+        getfeature_params("ms:OR", bbox=(0, 0, 1, 1), fes_filter="<fes:Filter/>")
+
+
+def test_loaders_ask_for_what_the_stages_read(monkeypatch):
+    calls = []
+
+    def load_data_from_wfs(url, **kwargs):
+        calls.append(kwargs)
+        return gpd.GeoDataFrame({name: ["x"] for name in kwargs["properties"]}, geometry=[shapely.Point(0, 0)], crs=2056)
+
+    monkeypatch.setattr(st, "load_data_from_wfs", load_data_from_wfs)
+    bbox = (2611000, 1267000, 2612000, 1268000)
+    for load in (st.load_gebaeudekategorie, st.load_oeffentlicher_raum, st.load_kultur, st.load_schulstandorte):
+        load("http://wfs", None, bbox=bbox)
+    assert [call["properties"] for call in calls] == [
+        ("gebaeudekategorieid",), (), ("bi_subkategorie",), ("sc_schultyp",), ("so_schultyp",),
+    ]
+    assert all(call["bbox"] == bbox for call in calls)